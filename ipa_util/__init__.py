@@ -0,0 +1,2 @@
+# Bumped whenever the analysis output changes, so cached results from an older version are never served
+__version__ = '0.6.2'
@@ -0,0 +1,179 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ipa_util import metrics
+from ipa_util.bundle import BundleInventory
+from ipa_util.cache import ResultCache
+from ipa_util.info_plist import PlistScanner, EmbeddedProvisioningPlistScanner
+from ipa_util.mach_o import MachO
+from ipa_util.metrics import MetricsRecorder
+from ipa_util.result import IpaInfo
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+class IpaAnalyzer:
+    """
+    Runs the full Unpack / Validate / PlistScanner / MachO pipeline over a single .ipa file
+    """
+
+    def __init__(self, src_path, dest_path=None, in_archive=False, cache=None, binary_workers=None, metrics=False,
+                 trace_memory=True, verify_pages=False, clean_dest=False, read_signatures=False) -> None:
+        """
+        __init__
+        :param src_path: Full path to the source .ipa file, an http(s) URL or a source.ByteSource
+        :param dest_path: Folder to unpack into. A temporary folder is used if not given.
+        :param in_archive: Read everything straight from the zip instead of unpacking it
+        :param cache: Optional ResultCache. A hit skips the whole pipeline, including unpacking.
+        :param binary_workers: Threads used to analyze the binaries in the bundle
+        :param metrics: Record per-stage timings and I/O, returned in a 'metrics' section next to 'ipa_info'
+        :param trace_memory: Include peak memory in the metrics. tracemalloc makes the run noticeably slower.
+        :param verify_pages: Check every page of every binary against its code signature. Off by default: it reads
+                             and decompresses each binary in full, where otherwise only its headers, load commands
+                             and signature are read. The page hashing is spread over a thread per CPU.
+        :param clean_dest: Remove what was unpacked into dest_path once done. By default it's kept, so analyzing the
+                           same build again only re-extracts the files that changed.
+        :param read_signatures: Read the code signature of every binary, checking its blobs and the signed
+                                entitlements against the profile (req-008, req-009). Off by default: the signature
+                                is at the end of each binary, so it means reading each one in full, where otherwise
+                                only the location of the signature is reported. Implied by verify_pages.
+        """
+        super().__init__()
+        self._src_path = src_path
+        self._dest_path = dest_path
+        self._in_archive = in_archive
+        self._cache = cache
+        self._binary_workers = binary_workers
+        self._metrics = metrics
+        self._trace_memory = trace_memory
+        self._verify_pages = verify_pages
+        self._clean_dest = clean_dest
+        self._read_signatures = read_signatures or verify_pages
+
+    def analyze(self, ipa_unpacker=None):
+        """
+        Analyze the .ipa file
+        :param ipa_unpacker: An Unpack the caller already opened on src_path, e.g. to fingerprint the build. It's
+                             reused rather than opening the source and reading its central directory again, and
+                             left for the caller to close.
+        :return: The top level info object, {'ipa_info': result.IpaInfo}, plus {'metrics': {...}} when instrumented.
+                 A result served from the cache has plain dicts in place of the result objects.
+        """
+        if not self._metrics:
+            return self._analyze(ipa_unpacker)
+        recorder = MetricsRecorder(self._trace_memory)
+        with recorder:
+            top_level = self._analyze(ipa_unpacker)
+        # Cached results never carry metrics, they describe this run only
+        top_level['metrics'] = recorder.to_dict()
+        return top_level
+
+    def _analyze(self, ipa_unpacker=None):
+        opened_here = ipa_unpacker is None
+        src = open_source(self._src_path) if opened_here else self._src_path
+        if opened_here:
+            ipa_unpacker = Unpack(src, None)
+        try:
+            cache_key = None
+            if self._cache is not None:
+                with metrics.stage('cache_lookup'):
+                    cache_key = ResultCache.cache_key(ipa_unpacker.ipa_zip, self._verify_pages, self._read_signatures)
+                    top_level = self._cache.get(cache_key) if cache_key is not None else None
+                if top_level is not None:
+                    return top_level
+            if self._in_archive:
+                # Work directly against the zip members
+                top_level = self._analyze_root(ipa_unpacker, ipa_unpacker.open_ipa())
+            else:
+                ipa_unpacker.close_ipa()
+                top_level = self._analyze_unpacked(src)
+            if cache_key is not None:
+                with metrics.stage('cache_store'):
+                    self._cache.put(cache_key, top_level)
+            return top_level
+        finally:
+            if opened_here:
+                ipa_unpacker.close_ipa()
+            if src is not self._src_path:
+                print('Fetched {0} bytes in {1} requests from {2}'.format(src.bytes_fetched, src.fetch_count, self._src_path))
+                src.close()
+
+    def _analyze_unpacked(self, src):
+        """
+        Unpack the .ipa to disk and analyze the result
+        :param src: The path or ByteSource to unpack from
+        :return: The top level info object
+        """
+        tempdir_obj = None
+        dest_path = self._dest_path
+        if dest_path is None:
+            tempdir_obj = tempfile.TemporaryDirectory(prefix='vipa_')
+            dest_path = tempdir_obj.name
+        print('Temporary directory path: {0}'.format(dest_path))
+        ipa_unpacker = Unpack(src, dest_path)
+        try:
+            # Unpack the zip file
+            with metrics.stage('unzip'):
+                ipa_root = ipa_unpacker.unpack_ipa()
+            return self._analyze_root(ipa_unpacker, ipa_root)
+        finally:
+            # Finally, clean up our mess
+            if self._clean_dest:
+                ipa_unpacker.cleanup_dest()
+            if tempdir_obj is not None:
+                tempdir_obj.cleanup()
+
+    def _analyze_root(self, ipa_unpacker, ipa_root):
+        """
+        Run the validation and extraction steps against an unpacked (or opened) .ipa
+        :param ipa_unpacker: The Unpack instance which produced ipa_root
+        :param ipa_root: Location of the Payload folder, on disk or in the archive
+        :return: The top level info object
+        """
+        # top level object
+        top_level = {}
+        root_obj = IpaInfo()
+        # Validate the structure and find various paths
+        ipa_val = Validate(ipa_root)
+        with metrics.stage('validate_structure'):
+            ipa_val.validate_structure()
+        # Extract metadata from Info.plist
+        with metrics.stage('info_plist'):
+            plist_dict = ipa_val.extract_plist()
+            info_p = PlistScanner(plist_dict)
+            root_obj.app_meta = info_p.dump_info()
+        #
+        app_dir = ipa_val.app_dir
+        with metrics.stage('provisioning'):
+            signed_data = ipa_unpacker.extract_provisioning_info(app_dir)
+            embedded_plist_dict = ipa_val.extract_provisioning_plist(signed_data.content)
+            embedded_pscan = EmbeddedProvisioningPlistScanner(embedded_plist_dict, signed_data.signer_chain())
+            root_obj.provisioning = embedded_pscan.dump_info()
+        # One pool hashes the code pages of every binary, so the bundle's threads don't each start their own
+        hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1) if self._verify_pages else None
+        try:
+            # Get info on the binary files
+            with metrics.stage('mach_o'):
+                binary_name = ipa_val.executable_name
+                binary_path = ipa_val.executable_path
+                macho = MachO(binary_path, binary_name)
+                mach_info = macho.get_mach_info(verify_pages=self._verify_pages, pool=hash_pool,
+                                                read_signature=self._read_signatures)
+                root_obj.binary_info = mach_info
+                ipa_val.validate_binary(mach_info)
+                # The profile is checked against the entitlements signed into the executable, when they were read
+                ipa_val.validate_provisioning_plist(embedded_plist_dict, mach_info)
+            # Everything else in the bundle: frameworks, app extensions, loose dylibs. The main executable is listed
+            # too, with the info from above.
+            with metrics.stage('bundle_binaries'):
+                inventory = BundleInventory(app_dir, ipa_val, self._binary_workers, hash_pool, self._read_signatures,
+                                            {binary_name: mach_info})
+                root_obj.bundle_binaries = inventory.analyze()
+        finally:
+            if hash_pool is not None:
+                hash_pool.shutdown()
+        # Form the top level object
+        top_level['ipa_info'] = root_obj
+        return top_level
@@ -0,0 +1,141 @@
+import os
+import sys
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.cache import ResultCache
+from ipa_util.result import JsonWriter
+
+# One cache connection per worker process, opened on first use
+_worker_caches = {}
+
+
+def _worker_cache(cache_path, cache_max_bytes):
+    if cache_path is None:
+        return None
+    cache = _worker_caches.get(cache_path)
+    if cache is None:
+        cache = ResultCache(cache_path, cache_max_bytes)
+        _worker_caches[cache_path] = cache
+    return cache
+
+
+def analyze_one(src_path, in_archive=True, cache_path=None, cache_max_bytes=ResultCache.DEFAULT_MAX_BYTES, metrics=False,
+                trace_memory=True):
+    """
+    Worker entry point. Analyzes one .ipa and turns any failure into an error record so one bad build
+    doesn't take the whole run down.
+    :param src_path: Path or URL of the .ipa file, or an open file object
+    :param in_archive: Read straight from the zip rather than unpacking to a temp folder
+    :param cache_path: Optional path to a ResultCache database shared by all workers
+    :param cache_max_bytes: Size limit for the cache
+    :param metrics: Add per-stage metrics to the record, see IpaAnalyzer
+    :param trace_memory: Include peak memory in the metrics
+    :return: A JSON serializable record
+    """
+    record = {'path': getattr(src_path, 'name', src_path)}
+    try:
+        cache = _worker_cache(cache_path, cache_max_bytes)
+        # The pipeline prints progress messages, keep them off the JSON Lines stream
+        with contextlib.redirect_stdout(sys.stderr):
+            record.update(IpaAnalyzer(src_path, in_archive=in_archive, cache=cache, metrics=metrics,
+                                      trace_memory=trace_memory).analyze())
+    except Exception as e:
+        record['error'] = str(e)
+        record['error_type'] = type(e).__name__
+    return record
+
+
+class BatchRunner:
+    """
+    Analyze many .ipa files across a process pool, streaming one JSON object per line as each build finishes
+    """
+
+    def __init__(self, workers=None, in_archive=True, max_pending=None, cache_path=None,
+                 cache_max_bytes=ResultCache.DEFAULT_MAX_BYTES, metrics=False) -> None:
+        """
+        __init__
+        :param workers: Number of worker processes, defaults to the CPU count
+        :param in_archive: Analyze straight from the zip (the default) rather than unpacking each build
+        :param max_pending: Upper bound on submitted but unfinished builds, so huge inputs aren't queued up front
+        :param cache_path: Optional path to a ResultCache database
+        :param cache_max_bytes: Size limit for the cache
+        :param metrics: Add per-stage metrics to each record
+        """
+        super().__init__()
+        self._workers = workers or os.cpu_count() or 1
+        self._in_archive = in_archive
+        self._cache_path = cache_path
+        self._cache_max_bytes = cache_max_bytes
+        self._metrics = metrics
+        self._max_pending = max_pending or self._workers * 4
+        self.ok_count = 0
+        self.error_count = 0
+
+    @staticmethod
+    def iter_ipa_paths(inputs, stdin=None):
+        """
+        Expand the inputs into individual .ipa paths
+        :param inputs: Directories (walked recursively) or .ipa files. '-' reads paths from stdin, one per line.
+        :param stdin: The stream to read paths from, defaults to sys.stdin
+        :return: Generator of paths
+        """
+        if stdin is None:
+            stdin = sys.stdin
+        for item in inputs:
+            if item == '-':
+                for line in stdin:
+                    line = line.strip()
+                    if line:
+                        yield line
+            elif os.path.isdir(item):
+                for dir_path, dir_names, file_names in os.walk(item):
+                    dir_names.sort()
+                    for name in sorted(file_names):
+                        if name.lower().endswith('.ipa'):
+                            yield os.path.join(dir_path, name)
+            else:
+                yield item
+
+    def run(self, paths, out_fp):
+        """
+        Run the pipeline over every path, writing a JSON line to out_fp as each one completes.
+        :param paths: Iterable of .ipa paths
+        :param out_fp: Text stream for the results
+        :return: None
+        """
+        writer = JsonWriter(out_fp)
+        with ProcessPoolExecutor(max_workers=self._workers) as pool:
+            pending = {}
+            for src_path in paths:
+                if len(pending) >= self._max_pending:
+                    self._drain(pending, writer, False)
+                pending[pool.submit(analyze_one, src_path, self._in_archive, self._cache_path,
+                                    self._cache_max_bytes, self._metrics)] = src_path
+            self._drain(pending, writer, True)
+
+    def _drain(self, pending, writer, wait_all):
+        """
+        Wait for submitted builds and write out their records
+        :param pending: Dict of future => path, finished entries are removed
+        :param writer: result.JsonWriter over the output stream
+        :param wait_all: Wait for everything rather than just the next build to finish
+        :return: None
+        """
+        if wait_all:
+            done = as_completed(list(pending))
+        else:
+            done = wait(pending, return_when=FIRST_COMPLETED).done
+        for future in done:
+            src_path = pending.pop(future)
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker itself died (BrokenProcessPool and friends)
+                record = {'path': src_path, 'error': str(e), 'error_type': type(e).__name__}
+            if 'error' in record:
+                self.error_count += 1
+            else:
+                self.ok_count += 1
+            writer.write_line(record)
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import zipfile
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from ipa_util import __version__
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.info_plist import EmbeddedProvisioningPlistScanner
+from ipa_util.mach_o import MachO
+from ipa_util.synth import SyntheticIpa
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+class _Stage:
+    """
+    One benchmarked step of the pipeline. setup() runs once, untimed, then run() is timed for each iteration.
+    run() returns the number of bytes it processed, for the throughput figure.
+    """
+
+    def __init__(self, ipa_path, work_dir) -> None:
+        super().__init__()
+        self.ipa_path = ipa_path
+        self.work_dir = work_dir
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError()
+
+    def teardown(self):
+        pass
+
+
+class _UnzipStage(_Stage):
+    def run(self):
+        dest = tempfile.mkdtemp(dir=self.work_dir)
+        Unpack(self.ipa_path, dest).unpack_ipa()
+        with zipfile.ZipFile(self.ipa_path) as ipa_zip:
+            return sum(info.file_size for info in ipa_zip.infolist())
+
+
+class _InArchiveStage(_Stage):
+    def setup(self):
+        self.unpacker = Unpack(self.ipa_path, None)
+        self.validate = Validate(self.unpacker.open_ipa())
+        self.validate.validate_structure()
+        # Fills in the bundle id and executable name the later stages look at
+        self.validate.extract_plist()
+
+    def teardown(self):
+        self.unpacker.close_ipa()
+
+
+class _PlistStage(_InArchiveStage):
+    def setup(self):
+        super().setup()
+        self.plist_size = len((self.validate.app_dir / 'Info.plist').read_bytes())
+
+    def run(self):
+        self.validate.extract_plist()
+        return self.plist_size
+
+
+class _ProvisioningStage(_InArchiveStage):
+    def run(self):
+        signed_data = self.unpacker.extract_provisioning_info(self.validate.app_dir)
+        plist_dict = self.validate.extract_provisioning_plist(signed_data.content)
+        EmbeddedProvisioningPlistScanner(plist_dict, signed_data.signer_chain()).dump_info()
+        return len(signed_data.content)
+
+
+class _MachOStage(_InArchiveStage):
+    def setup(self):
+        super().setup()
+        # Parse from disk, the way the extracting pipeline does
+        self.binary_name = self.validate.executable_name
+        self.binary_path = Path(self.work_dir) / self.binary_name
+        self.binary_path.write_bytes(self.validate.executable_path.read_bytes())
+
+    def run(self):
+        MachO(self.binary_path, self.binary_name).get_mach_info()
+        return self.binary_path.stat().st_size
+
+
+class _EndToEndStage(_Stage):
+    def run(self):
+        IpaAnalyzer(self.ipa_path, in_archive=True).analyze()
+        return os.path.getsize(self.ipa_path)
+
+
+class _EndToEndExtractStage(_Stage):
+    def run(self):
+        IpaAnalyzer(self.ipa_path, dest_path=tempfile.mkdtemp(dir=self.work_dir)).analyze()
+        return os.path.getsize(self.ipa_path)
+
+
+STAGES = {
+    'unzip': _UnzipStage,
+    'plist': _PlistStage,
+    'provisioning': _ProvisioningStage,
+    'macho': _MachOStage,
+    'end_to_end': _EndToEndStage,
+    'end_to_end_extract': _EndToEndExtractStage,
+}
+
+
+def run_stage(stage_name, ipa_path, iterations):
+    """
+    Child process entry point: time one stage and report its peak RSS
+    :return: The stage result, see Benchmark.run()
+    """
+    base_rss = _peak_rss_kb()
+    timings = []
+    processed = 0
+    with tempfile.TemporaryDirectory(prefix='vipa_bench_') as work_dir, \
+            open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stage = STAGES[stage_name](ipa_path, work_dir)
+        stage.setup()
+        try:
+            for i in range(iterations):
+                start = time.perf_counter()
+                processed += stage.run()
+                timings.append(time.perf_counter() - start)
+        finally:
+            stage.teardown()
+    total = sum(timings)
+    result = {}
+    result['iterations'] = iterations
+    result['mean_ms'] = round(total / iterations * 1000, 3)
+    result['min_ms'] = round(min(timings) * 1000, 3)
+    result['max_ms'] = round(max(timings) * 1000, 3)
+    result['ops_per_s'] = round(iterations / total, 2) if total else None
+    result['mb_per_s'] = round(processed / total / (1024 * 1024), 2) if total else None
+    result['peak_rss_kb'] = _peak_rss_kb()
+    result['base_rss_kb'] = base_rss
+    return result
+
+
+class Benchmark:
+    """
+    Times each pipeline stage separately against a synthetic .ipa (or a given one). Every stage runs in a fresh
+    process so its peak RSS is its own, and results can be saved as a baseline and compared against later.
+    """
+    DEFAULT_ITERATIONS = 10
+    # A stage whose mean time grows by more than this fraction of the baseline counts as a regression
+    DEFAULT_THRESHOLD = 0.10
+
+    def __init__(self, ipa_path=None, synth_options=None, stages=None, iterations=DEFAULT_ITERATIONS) -> None:
+        """
+        __init__
+        :param ipa_path: .ipa to benchmark against. One is generated with SyntheticIpa if not given.
+        :param synth_options: Keyword arguments for SyntheticIpa
+        :param stages: Names of the stages to run, from STAGES. All of them by default.
+        :param iterations: Timed iterations per stage
+        """
+        super().__init__()
+        self._ipa_path = ipa_path
+        self._synth_options = synth_options or {}
+        self._stages = list(stages or STAGES)
+        self._iterations = iterations
+        for name in self._stages:
+            if name not in STAGES:
+                raise Exception('Unknown benchmark stage: {0}'.format(name))
+
+    def run(self):
+        """
+        :return: The benchmark report: the configuration and, per stage, timings, throughput and peak RSS
+        """
+        with tempfile.TemporaryDirectory(prefix='vipa_bench_') as temp_dir:
+            ipa_path = self._ipa_path
+            if ipa_path is None:
+                ipa_path = SyntheticIpa(**self._synth_options).write(os.path.join(temp_dir, 'synth.ipa'))
+            report = {}
+            report['vipa_version'] = __version__
+            report['python'] = platform.python_version()
+            report['machine'] = platform.machine()
+            report['config'] = self.config()
+            report['ipa_size'] = os.path.getsize(ipa_path)
+            report['stages'] = {}
+            for name in self._stages:
+                report['stages'][name] = self._run_isolated(name, str(ipa_path))
+            return report
+
+    def config(self):
+        config = {}
+        config['ipa'] = str(self._ipa_path) if self._ipa_path is not None else None
+        config['synth'] = self._synth_options if self._ipa_path is None else None
+        config['iterations'] = self._iterations
+        return config
+
+    def _run_isolated(self, name, ipa_path):
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            return pool.submit(run_stage, name, ipa_path, self._iterations).result()
+
+    @staticmethod
+    def save(report, baseline_path):
+        with open(str(baseline_path), 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(baseline_path):
+        with open(str(baseline_path)) as fp:
+            return json.load(fp)
+
+    @staticmethod
+    def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+        """
+        Compare a report against a baseline
+        :return: Tuple of (rows, regressions). Each row is a dict with the stage name, both means and peak RSS values,
+        the relative change in mean time and a regression flag.
+        """
+        rows = []
+        regressions = []
+        for name, result in report['stages'].items():
+            row = {}
+            row['stage'] = name
+            row['mean_ms'] = result['mean_ms']
+            row['peak_rss_kb'] = result['peak_rss_kb']
+            base = baseline.get('stages', {}).get(name)
+            if base is None:
+                row['baseline_mean_ms'] = None
+                row['baseline_peak_rss_kb'] = None
+                row['change'] = None
+                row['regression'] = False
+            else:
+                row['baseline_mean_ms'] = base['mean_ms']
+                row['baseline_peak_rss_kb'] = base['peak_rss_kb']
+                row['change'] = (result['mean_ms'] - base['mean_ms']) / base['mean_ms'] if base['mean_ms'] else None
+                row['regression'] = row['change'] is not None and row['change'] > threshold
+                if row['regression']:
+                    regressions.append(name)
+            rows.append(row)
+        return rows, regressions
+
+    @staticmethod
+    def format_report(report, rows=None):
+        """
+        :return: A plain text table of the report, with baseline columns when rows from compare() are given
+        """
+        lines = []
+        lines.append('vipa {0}, Python {1} on {2}, .ipa of {3} bytes, {4} iterations per stage'.format(
+            report['vipa_version'], report['python'], report['machine'], report['ipa_size'], report['config']['iterations']))
+        header = '{0:<20} {1:>10} {2:>10} {3:>10} {4:>10} {5:>12}'.format('stage', 'mean ms', 'min ms', 'ops/s', 'MB/s', 'peak RSS KB')
+        if rows is not None:
+            header += ' {0:>12} {1:>9}'.format('baseline ms', 'change')
+        lines.append(header)
+        by_stage = {row['stage']: row for row in rows or []}
+        for name, result in report['stages'].items():
+            line = '{0:<20} {1:>10.3f} {2:>10.3f} {3:>10} {4:>10} {5:>12}'.format(
+                name, result['mean_ms'], result['min_ms'], result['ops_per_s'], result['mb_per_s'], result['peak_rss_kb'])
+            row = by_stage.get(name)
+            if row is not None:
+                if row['change'] is None:
+                    line += ' {0:>12} {1:>9}'.format('-', '-')
+                else:
+                    line += ' {0:>12.3f} {1:>+8.1%}{2}'.format(row['baseline_mean_ms'], row['change'], ' REGRESSION' if row['regression'] else '')
+            lines.append(line)
+        return '\n'.join(lines)
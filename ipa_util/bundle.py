@@ -0,0 +1,146 @@
+import os
+import zipfile
+import posixpath
+import contextvars
+from pathlib import Path
+from struct import Struct
+from concurrent.futures import ThreadPoolExecutor
+
+from ipa_util.mach_o import MachO
+from ipa_util.result import BundleBinary
+
+
+class BundleInventory:
+    """
+    Finds every Mach-O in an app bundle (the main executable, Frameworks/*.framework, PlugIns/*.appex, loose dylibs)
+    by sniffing the leading magic bytes of each file, then analyzes them concurrently.
+    Only SNIFF_SIZE bytes are read from files that turn out not to be Mach-O, so scanning cost follows the file
+    count rather than the bundle size.
+    """
+    # The 4 byte magic, plus the next 4 bytes to tell a fat header from a Java class file (both are 0xcafebabe)
+    SNIFF_SIZE = 8
+    SNIFF = Struct('>II')
+    THIN_MAGICS = (MachO.MACHO_HEADER_MAGIC, MachO.MACHO_HEADER_CIGAM,
+                   MachO.MACHO64_HEADER_MAGIC, MachO.MACHO64_HEADER_CIGAM)
+    FAT_MAGICS = (MachO.FAT_HEADER_MAGIC, MachO.FAT64_HEADER_MAGIC)
+    # A class file has its version where a fat header has the slice count, and class file versions start at 45
+    MAX_FAT_SLICES = 32
+    DEFAULT_WORKERS = 8
+
+    def __init__(self, app_dir, validate=None, max_workers=None, hash_pool=None, read_signatures=False,
+                 analyzed=None) -> None:
+        """
+        __init__
+        :param app_dir: The .app folder, on disk or a zipfile.Path from Unpack.open_ipa()
+        :param validate: Optional Validate instance used to check each binary (req-007, req-008)
+        :param max_workers: Size of the thread pool used to analyze the binaries
+        :param hash_pool: Executor for verifying code signature page hashes. Pages aren't verified if not given.
+        :param read_signatures: Read each binary's code signature, see MachO.get_mach_info()
+        :param analyzed: Dict of path relative to the .app folder => result.BinaryInfo for binaries the caller
+                         already analyzed and validated, such as the main executable. They're reported as they are
+                         rather than parsed and hashed again.
+        """
+        super().__init__()
+        self._app_dir = app_dir
+        self._validate = validate
+        self._max_workers = max_workers or min(BundleInventory.DEFAULT_WORKERS, os.cpu_count() or 1)
+        self._hash_pool = hash_pool
+        self._read_signatures = read_signatures
+        self._analyzed = analyzed or {}
+
+    def find_binaries(self, candidate=None):
+        """
+        :param candidate: Optional predicate on the path relative to the .app folder. Only the files it accepts are
+                          opened and sniffed, so a caller which can tell likely binaries by name saves a member read
+                          (or a range request) for everything else.
+        :return: List of (path relative to the .app folder, path usable by MachO) for every Mach-O in the bundle
+        """
+        if isinstance(self._app_dir, zipfile.Path):
+            return self._find_in_archive(candidate)
+        return self._find_on_disk(candidate)
+
+    def analyze(self):
+        """
+        Analyze every binary in the bundle on a thread pool
+        :return: List of per-binary reports, in bundle path order
+        """
+        binaries = self.find_binaries()
+        if not binaries:
+            return []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            # Each task runs in a copy of our context so metrics recorded in the workers land in the current stage
+            futures = [pool.submit(contextvars.copy_context().run, self._analyze_binary, rel_name, binary_path)
+                       for rel_name, binary_path in binaries]
+            return [future.result() for future in futures]
+
+    def _analyze_binary(self, rel_name, binary_path):
+        """
+        :return: A result.BundleBinary with the binary info and whether it passed validation
+        """
+        report = BundleBinary(path=rel_name)
+        if rel_name in self._analyzed:
+            report.binary_info = self._analyzed[rel_name]
+            report.valid = True
+            return report
+        try:
+            mach_info = MachO(binary_path, posixpath.basename(rel_name)).get_mach_info(
+                verify_pages=self._hash_pool is not None, pool=self._hash_pool, read_signature=self._read_signatures)
+            report.binary_info = mach_info
+            if self._validate is not None:
+                self._validate.validate_binary(mach_info)
+            report.valid = True
+        except Exception as e:
+            report.valid = False
+            report.error = str(e)
+        return report
+
+    @staticmethod
+    def is_mach_o(head):
+        """
+        :param head: The first SNIFF_SIZE bytes of a file
+        :return: True if they look like a thin or fat Mach-O header
+        """
+        if len(head) < BundleInventory.SNIFF_SIZE:
+            return False
+        magic, next_word = BundleInventory.SNIFF.unpack(head)
+        if magic in BundleInventory.THIN_MAGICS:
+            return True
+        return magic in BundleInventory.FAT_MAGICS and 0 < next_word <= BundleInventory.MAX_FAT_SLICES
+
+    def _find_in_archive(self, candidate=None):
+        """
+        Scan the central directory for candidates under the .app folder and sniff each one
+        """
+        ipa_zip = self._app_dir.root
+        prefix = self._app_dir.at
+        binaries = []
+        for info in ipa_zip.infolist():
+            if not info.filename.startswith(prefix) or info.is_dir():
+                continue
+            if info.file_size < BundleInventory.SNIFF_SIZE:
+                continue
+            if candidate is not None and not candidate(info.filename[len(prefix):]):
+                continue
+            with ipa_zip.open(info) as member_fp:
+                head = member_fp.read(BundleInventory.SNIFF_SIZE)
+            if self.is_mach_o(head):
+                binaries.append((info.filename[len(prefix):], zipfile.Path(ipa_zip, info.filename)))
+        binaries.sort(key=lambda b: b[0])
+        return binaries
+
+    def _find_on_disk(self, candidate=None):
+        app_dir = Path(self._app_dir)
+        binaries = []
+        for dir_path, dir_names, file_names in os.walk(str(app_dir)):
+            for name in file_names:
+                file_path = Path(dir_path) / name
+                if file_path.is_symlink() or file_path.stat().st_size < BundleInventory.SNIFF_SIZE:
+                    continue
+                if candidate is not None and not candidate(file_path.relative_to(app_dir).as_posix()):
+                    continue
+                with file_path.open('rb') as fp:
+                    head = fp.read(BundleInventory.SNIFF_SIZE)
+                if self.is_mach_o(head):
+                    binaries.append((file_path.relative_to(app_dir).as_posix(), file_path))
+        binaries.sort(key=lambda b: b[0])
+        return binaries
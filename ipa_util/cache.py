@@ -0,0 +1,128 @@
+import json
+import time
+import hashlib
+import sqlite3
+
+from ipa_util import __version__
+from ipa_util.info_plist import EmbeddedProvisioningPlistScanner
+from ipa_util.result import dumps
+
+
+class ResultCache:
+    """
+    Persistent, size bounded LRU cache of analysis results.
+
+    Entries are keyed on the zip central directory (names, CRC32s and sizes of the members), so a lookup never
+    reads or decompresses any payload. The store is a SQLite database in WAL mode, which makes it safe
+    to share between batch worker processes.
+    """
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    # Once over the limit, evict down to this fraction of it so we don't evict on every put
+    EVICT_TO_RATIO = 0.9
+    EVICT_BATCH = 64
+
+    def __init__(self, cache_path, max_bytes=DEFAULT_MAX_BYTES) -> None:
+        """
+        __init__
+        :param cache_path: Path to the cache database file, created if missing
+        :param max_bytes: Upper bound for the total size of the cached results
+        """
+        super().__init__()
+        self._cache_path = str(cache_path)
+        self._max_bytes = max_bytes
+        self._conn = sqlite3.connect(self._cache_path, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS results '
+                           '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('total_size', 0)")
+
+    @staticmethod
+    def cache_key(ipa_zip, verify_pages=False, read_signatures=False):
+        """
+        Build the cache key for an .ipa from its central directory alone.
+        The analysis covers every Mach-O in the bundle, and which members those are can't be told without reading
+        them, so the key covers the name, CRC32 and size of every member. That's still only central directory data.
+        :param ipa_zip: An open ZipFile
+        :param verify_pages: The result has the page hashes checked. It's cached apart from the one without, so
+                             neither is served to a run which asked for the other.
+        :param read_signatures: The result has the contents of the code signatures, cached apart in the same way
+        :return: Hex digest, or None if the archive doesn't look like an .ipa
+        """
+        digest = hashlib.sha256()
+        options = ' verify_pages' if verify_pages else ''
+        options += ' read_signatures' if read_signatures else ''
+        digest.update('vipa {0}{1}\n'.format(__version__, options).encode('utf-8'))
+        has_payload = False
+        for info in ipa_zip.infolist():
+            if info.filename.startswith('Payload/'):
+                has_payload = True
+            digest.update('{0} {1:08x} {2}\n'.format(info.filename, info.CRC, info.file_size).encode('utf-8'))
+        if not has_payload:
+            return None
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result, marking it as recently used
+        :param key: Key from cache_key()
+        :return: The cached result with its time dependent fields recomputed, or None on a miss
+        """
+        row = self._conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+        value = json.loads(row[0])
+        ipa_info = value.get('ipa_info')
+        if ipa_info is not None:
+            EmbeddedProvisioningPlistScanner.refresh_info(ipa_info)
+        return value
+
+    def put(self, key, value):
+        """
+        Store a result, evicting the least recently used entries if the cache grows past its limit
+        :param key: Key from cache_key()
+        :param value: Result to store, made of result objects and / or JSON serializable values
+        :return: None
+        """
+        encoded = dumps(value)
+        size = len(encoded)
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+            old_size = row[0] if row is not None else 0
+            conn.execute('INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                         (key, encoded, size, time.time()))
+            total = self._add_total(size - old_size)
+            if total > self._max_bytes:
+                self._evict(total, int(self._max_bytes * ResultCache.EVICT_TO_RATIO))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        self._conn.close()
+
+    def _add_total(self, delta):
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_size'", (delta,))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _evict(self, total, target):
+        """
+        Delete least recently used entries until the total size drops to target. Runs inside put()'s transaction.
+        """
+        while total > target:
+            rows = self._conn.execute('SELECT key, size FROM results ORDER BY last_access LIMIT ?',
+                                      (ResultCache.EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            freed = 0
+            for key, size in rows:
+                self._conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                freed += size
+                if total - freed <= target:
+                    break
+            total = self._add_total(-freed)
@@ -0,0 +1,344 @@
+from datetime import datetime
+
+from ipa_util.result import format_date
+
+
+class _Tlv:
+    """
+    A single BER/DER element. Only offsets into the source buffer are kept, nothing is copied.
+    """
+    __slots__ = ('tag_class', 'constructed', 'tag', 'start', 'content_start', 'content_end', 'end')
+
+    def __init__(self, tag_class, constructed, tag, start, content_start, content_end, end) -> None:
+        super().__init__()
+        self.tag_class = tag_class
+        self.constructed = constructed
+        self.tag = tag
+        self.start = start
+        self.content_start = content_start
+        self.content_end = content_end
+        self.end = end
+
+    def is_universal(self, tag):
+        return self.tag_class == DerReader.CLASS_UNIVERSAL and self.tag == tag
+
+    def is_context(self, tag):
+        return self.tag_class == DerReader.CLASS_CONTEXT and self.tag == tag
+
+
+class DerReader:
+    """
+    Streaming BER/DER reader over a memoryview.
+    Apple signs provisioning profiles with BER indefinite lengths, so those are handled as well as plain DER.
+    """
+    CLASS_UNIVERSAL = 0
+    CLASS_CONTEXT = 2
+    TAG_INTEGER = 0x02
+    TAG_OCTET_STRING = 0x04
+    TAG_OID = 0x06
+    TAG_UTF8_STRING = 0x0c
+    TAG_SEQUENCE = 0x10
+    TAG_SET = 0x11
+    TAG_PRINTABLE_STRING = 0x13
+    TAG_T61_STRING = 0x14
+    TAG_IA5_STRING = 0x16
+    TAG_UTC_TIME = 0x17
+    TAG_GENERALIZED_TIME = 0x18
+    TAG_UNIVERSAL_STRING = 0x1c
+    TAG_BMP_STRING = 0x1e
+
+    def __init__(self, data) -> None:
+        """
+        __init__
+        :param data: bytes-like object holding the encoded structure
+        """
+        super().__init__()
+        self._buf = memoryview(data)
+
+    def root(self):
+        """
+        :return: The outermost element
+        """
+        return self.element_at(0, len(self._buf))
+
+    def raw(self, elem):
+        """
+        :return: The complete encoding (header and content) of the element, as bytes
+        """
+        return bytes(self._buf[elem.start:elem.end])
+
+    def element_at(self, pos, limit):
+        """
+        Decode the element starting at pos
+        :param pos: Offset of the identifier octet
+        :param limit: The element must end at or before this offset
+        :return: A _Tlv
+        """
+        buf = self._buf
+        start = pos
+        if pos + 2 > limit:
+            raise Exception('Truncated DER element at offset {0}'.format(pos))
+        ident = buf[pos]
+        pos += 1
+        tag = ident & 0x1f
+        if tag == 0x1f:
+            tag = 0
+            while True:
+                b = buf[pos]
+                pos += 1
+                tag = (tag << 7) | (b & 0x7f)
+                if not b & 0x80:
+                    break
+        first = buf[pos]
+        pos += 1
+        constructed = bool(ident & 0x20)
+        if first == 0x80:
+            # Indefinite length, the content runs until an end-of-contents marker
+            if not constructed:
+                raise Exception('Indefinite length on a primitive element at offset {0}'.format(start))
+            content_end = pos
+            while True:
+                if content_end + 2 > limit:
+                    raise Exception('Missing end-of-contents for element at offset {0}'.format(start))
+                if buf[content_end] == 0 and buf[content_end + 1] == 0:
+                    end = content_end + 2
+                    break
+                content_end = self.element_at(content_end, limit).end
+        else:
+            if first & 0x80:
+                n = first & 0x7f
+                length = int.from_bytes(buf[pos:pos + n], 'big')
+                pos += n
+            else:
+                length = first
+            content_end = pos + length
+            end = content_end
+            if end > limit:
+                raise Exception('DER element at offset {0} overruns its container'.format(start))
+        return _Tlv(ident >> 6, constructed, tag, start, pos, content_end, end)
+
+    def children(self, elem):
+        """
+        Iterate over the elements contained in a constructed element
+        :param elem: The parent element
+        :return: Generator of _Tlv
+        """
+        pos = elem.content_start
+        while pos < elem.content_end:
+            child = self.element_at(pos, elem.content_end)
+            yield child
+            pos = child.end
+
+    def child_list(self, elem):
+        return list(self.children(elem))
+
+    def octets(self, elem):
+        """
+        Content of an OCTET STRING, joining the segments of a constructed (BER) one
+        :return: bytes
+        """
+        if not elem.constructed:
+            return bytes(self._buf[elem.content_start:elem.content_end])
+        return b''.join(self.octets(c) for c in self.children(elem))
+
+    def integer(self, elem):
+        return int.from_bytes(self._buf[elem.content_start:elem.content_end], 'big', signed=True)
+
+    def oid(self, elem):
+        """
+        :return: Dotted string form of an OBJECT IDENTIFIER
+        """
+        parts = []
+        val = 0
+        for b in self._buf[elem.content_start:elem.content_end]:
+            val = (val << 7) | (b & 0x7f)
+            if not b & 0x80:
+                parts.append(val)
+                val = 0
+        if not parts:
+            return ''
+        first = parts[0]
+        if first < 40:
+            head = [0, first]
+        elif first < 80:
+            head = [1, first - 40]
+        else:
+            head = [2, first - 80]
+        return '.'.join(str(p) for p in head + parts[1:])
+
+    def string(self, elem):
+        """
+        Decode any of the ASN.1 string types used in X.509 names
+        :return: str
+        """
+        data = bytes(self._buf[elem.content_start:elem.content_end])
+        if elem.tag == DerReader.TAG_BMP_STRING:
+            return data.decode('utf-16-be')
+        if elem.tag == DerReader.TAG_UNIVERSAL_STRING:
+            return data.decode('utf-32-be')
+        if elem.tag == DerReader.TAG_T61_STRING:
+            return data.decode('latin-1')
+        return data.decode('utf-8', errors='replace')
+
+    def time(self, elem):
+        """
+        Decode a UTCTime or GeneralizedTime
+        :return: A naive datetime in UTC, the same convention plistlib uses for dates
+        """
+        text = bytes(self._buf[elem.content_start:elem.content_end]).decode('ascii').rstrip('Z')
+        if elem.tag == DerReader.TAG_UTC_TIME:
+            year = int(text[:2])
+            text = str(year + 2000 if year < 50 else year + 1900) + text[2:]
+        text = text.split('.')[0]
+        if len(text) == 12:
+            return datetime.strptime(text, '%Y%m%d%H%M')
+        return datetime.strptime(text, '%Y%m%d%H%M%S')
+
+
+class Certificate:
+    """
+    The parts of an X.509 certificate we're interested in
+    """
+    # Short names for the attribute types found in Apple certificate names
+    NAME_OIDS = {
+        '2.5.4.3': 'CN',
+        '2.5.4.6': 'C',
+        '2.5.4.10': 'O',
+        '2.5.4.11': 'OU',
+        '0.9.2342.19200300.100.1.1': 'UID',
+    }
+
+    def __init__(self, reader, cert_elem) -> None:
+        """
+        __init__
+        :param reader: The DerReader holding the encoded certificate
+        :param cert_elem: The Certificate SEQUENCE element
+        """
+        super().__init__()
+        tbs = reader.child_list(reader.child_list(cert_elem)[0])
+        ix = 0
+        # version is an optional [0] EXPLICIT
+        if tbs[0].is_context(0):
+            ix = 1
+        self.serial_number = reader.integer(tbs[ix])
+        self.issuer_raw = reader.raw(tbs[ix + 2])
+        self.issuer = self._decode_name(reader, tbs[ix + 2])
+        validity = reader.child_list(tbs[ix + 3])
+        self.not_before = reader.time(validity[0])
+        self.not_after = reader.time(validity[1])
+        self.subject_raw = reader.raw(tbs[ix + 4])
+        self.subject = self._decode_name(reader, tbs[ix + 4])
+
+    @property
+    def team_identifier(self):
+        """
+        Apple puts the team id in the OU of developer and distribution certificates
+        """
+        return self.subject.get('OU')
+
+    def dump_info(self):
+        """
+        Dump the certificate fields as a python object
+        :return: A dictionary
+        """
+        val_obj = {}
+        val_obj['subject'] = self.subject
+        val_obj['issuer'] = self.issuer
+        val_obj['serial_number'] = '{0:x}'.format(self.serial_number)
+        val_obj['not_before'] = format_date(self.not_before)
+        val_obj['not_after'] = format_date(self.not_after)
+        team = self.team_identifier
+        if team is not None:
+            val_obj['team_identifier'] = team
+        return val_obj
+
+    def _decode_name(self, reader, name_elem):
+        """
+        Flatten an X.509 Name into a dict of short attribute name => value
+        """
+        name = {}
+        for rdn in reader.children(name_elem):
+            for atv in reader.children(rdn):
+                oid_elem, val_elem = reader.child_list(atv)[:2]
+                oid = reader.oid(oid_elem)
+                name[Certificate.NAME_OIDS.get(oid, oid)] = reader.string(val_elem)
+        return name
+
+
+class SignedData:
+    """
+    In-process decoder for a PKCS#7 / CMS signed-data blob such as embedded.mobileprovision.
+    The signature itself is not verified (the equivalent of openssl smime -verify -noverify), we only pull out the
+    encapsulated content and the certificates.
+    """
+    OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+
+    def __init__(self, data) -> None:
+        """
+        __init__
+        :param data: The DER/BER encoded ContentInfo
+        """
+        super().__init__()
+        reader = DerReader(data)
+        content_info = reader.child_list(reader.root())
+        if len(content_info) < 2 or reader.oid(content_info[0]) != SignedData.OID_SIGNED_DATA:
+            raise Exception('Not a PKCS#7 signed-data blob')
+        sd = reader.child_list(reader.child_list(content_info[1])[0])
+        # sd[0] is the version, sd[1] the digest algorithms
+        encap = reader.child_list(sd[2])
+        self._content = None
+        if len(encap) > 1:
+            self._content = reader.octets(reader.child_list(encap[1])[0])
+        self._certificates = []
+        signer_infos = sd[-1]
+        for elem in sd[3:-1]:
+            if elem.is_context(0):
+                self._certificates = [Certificate(reader, c) for c in reader.children(elem)]
+        self._signer_issuer = None
+        self._signer_serial = None
+        signers = reader.child_list(signer_infos)
+        if signers:
+            sid = reader.child_list(signers[0])[1]
+            if sid.is_universal(DerReader.TAG_SEQUENCE):
+                # issuerAndSerialNumber
+                issuer_elem, serial_elem = reader.child_list(sid)
+                self._signer_issuer = reader.raw(issuer_elem)
+                self._signer_serial = reader.integer(serial_elem)
+
+    @property
+    def content(self):
+        """
+        :return: The encapsulated content (for a provisioning profile, the plist) as bytes
+        """
+        if self._content is None:
+            raise Exception('Signed-data blob has no encapsulated content')
+        return self._content
+
+    @property
+    def certificates(self):
+        return self._certificates
+
+    def signer_chain(self):
+        """
+        The signer certificate followed by its issuers, as far as the embedded certificates go
+        :return: List of Certificate
+        """
+        signer = None
+        for cert in self._certificates:
+            if cert.issuer_raw == self._signer_issuer and cert.serial_number == self._signer_serial:
+                signer = cert
+                break
+        if signer is None:
+            # Signer identified by subjectKeyIdentifier or not present, fall back to the first certificate
+            if not self._certificates:
+                return []
+            signer = self._certificates[0]
+        chain = [signer]
+        by_subject = {c.subject_raw: c for c in self._certificates}
+        cert = signer
+        while cert.issuer_raw != cert.subject_raw:
+            cert = by_subject.get(cert.issuer_raw)
+            if cert is None or cert in chain:
+                break
+            chain.append(cert)
+        return chain
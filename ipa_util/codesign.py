@@ -0,0 +1,357 @@
+import os
+import hashlib
+import plistlib
+from struct import Struct
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CodeDirectory:
+    """
+    A CodeDirectory blob: the signing identifier and team, plus a hash for every page of the signed code and for
+    each special slot (Info.plist, requirements, resources, entitlements).
+    """
+    # struct CS_CodeDirectory up to pageSize / spare2
+    HEADER = Struct('>IIIIIIIIIBBBBI')
+    TEAM_OFFSET = Struct('>I')
+    CODE_LIMIT_64 = Struct('>Q')
+    # Versions which added fields after the base header
+    SUPPORTS_TEAM_ID = 0x20200
+    SUPPORTS_CODE_LIMIT_64 = 0x20300
+    # hashType => (hashlib name, name in the output). The stored hash is truncated to hashSize bytes.
+    HASH_TYPES = {
+        1: ('sha1', 'sha1'),
+        2: ('sha256', 'sha256'),
+        3: ('sha256', 'sha256_truncated'),
+        4: ('sha384', 'sha384'),
+    }
+    # Weakest first, the strongest code directory is the one that gets verified
+    HASH_STRENGTH = (1, 3, 2, 4)
+    # Pages handed to the pool per task
+    CHUNK_PAGES = 64
+    # Bad page numbers listed in the output, the count is always complete
+    MAX_BAD_PAGES = 16
+
+    def __init__(self, blob) -> None:
+        """
+        __init__
+        :param blob: The complete CodeDirectory blob, as bytes
+        """
+        super().__init__()
+        if len(blob) < CodeDirectory.HEADER.size:
+            raise Exception('Code directory is too small: {0} bytes'.format(len(blob)))
+        (magic, length, self.version, self.flags, self._hash_offset, ident_offset, self.n_special_slots,
+         self.n_code_slots, self.code_limit, self.hash_size, self.hash_type, self.platform, page_size_log2,
+         spare2) = CodeDirectory.HEADER.unpack_from(blob)
+        if magic != CodeSignature.CSMAGIC_CODEDIRECTORY:
+            raise Exception('Bad code directory magic: {0:#x}'.format(magic))
+        if self.hash_type not in CodeDirectory.HASH_TYPES:
+            raise Exception('Unknown code directory hash type: {0}'.format(self.hash_type))
+        if self._hash_offset - self.n_special_slots * self.hash_size < 0 or \
+                self._hash_offset + self.n_code_slots * self.hash_size > len(blob):
+            raise Exception('Code directory hash slots overrun the blob')
+        self._blob = blob
+        self.identifier = self._c_string(ident_offset)
+        self.team_id = None
+        if self.version >= CodeDirectory.SUPPORTS_TEAM_ID:
+            team_offset = CodeDirectory.TEAM_OFFSET.unpack_from(blob, CodeDirectory.HEADER.size + 4)[0]
+            if team_offset:
+                self.team_id = self._c_string(team_offset)
+        if self.version >= CodeDirectory.SUPPORTS_CODE_LIMIT_64:
+            code_limit_64 = CodeDirectory.CODE_LIMIT_64.unpack_from(blob, CodeDirectory.HEADER.size + 12)[0]
+            if code_limit_64:
+                self.code_limit = code_limit_64
+        # A page size of 0 means the code is hashed as a single page
+        self.page_size = (1 << page_size_log2) if page_size_log2 else max(self.code_limit, 1)
+        self._hash_name, self.hash_type_name = CodeDirectory.HASH_TYPES[self.hash_type]
+
+    @property
+    def cdhash(self):
+        """
+        The hash of the code directory itself, which is what the system identifies the signed code by
+        """
+        return hashlib.new(self._hash_name, self._blob).digest()[:20].hex()
+
+    def special_slot_hash(self, slot):
+        """
+        :param slot: A special slot number, CSSLOT_INFOSLOT upwards
+        :return: The stored hash, or None if the directory has no such slot or it was left empty
+        """
+        if slot > self.n_special_slots:
+            return None
+        start = self._hash_offset - slot * self.hash_size
+        stored = self._blob[start:start + self.hash_size]
+        return None if not any(stored) else stored
+
+    def code_slot_hash(self, page):
+        start = self._hash_offset + page * self.hash_size
+        return self._blob[start:start + self.hash_size]
+
+    def verify_blob(self, slot, blob):
+        """
+        :param slot: Special slot of the blob
+        :param blob: The blob as stored in the signature
+        :return: True or False, or None if the directory doesn't hash that slot
+        """
+        stored = self.special_slot_hash(slot)
+        if stored is None:
+            return None
+        return hashlib.new(self._hash_name, blob).digest()[:self.hash_size] == stored
+
+    def verify_pages(self, data, base, pool=None):
+        """
+        Hash every page of the signed code and compare it with its code slot.
+        Pages are handed to the pool a chunk at a time as views over the file; hashlib releases the GIL while it
+        hashes, so with a memory mapped file the work spreads over every thread in the pool.
+        :param data: The _MappedData / _StreamData holding the slice
+        :param base: File offset of the slice, page offsets are relative to it
+        :param pool: Executor to hash on. A temporary one sized to the CPU count is used if not given.
+        :return: {'page_count': ..., 'bad_page_count': ..., 'bad_pages': [...], 'valid': ...}
+        """
+        page_count = (self.code_limit + self.page_size - 1) // self.page_size
+        chunk_size = self.page_size * CodeDirectory.CHUNK_PAGES
+        max_pending = (os.cpu_count() or 1) * 2
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        bad_pages = []
+        # Future => the view it hashes
+        pending = {}
+        try:
+            for first_page in range(0, min(page_count, self.n_code_slots), CodeDirectory.CHUNK_PAGES):
+                if len(pending) >= max_pending:
+                    self._collect(pending, bad_pages, FIRST_COMPLETED)
+                start = first_page * self.page_size
+                with ExitStack() as stack:
+                    # Released here if the submit fails, by _hash_chunk() once the pool has it
+                    view = stack.enter_context(data.view(base + start, min(chunk_size, self.code_limit - start)))
+                    future = pool.submit(self._hash_chunk, view, first_page)
+                    stack.pop_all()
+                pending[future] = view
+            while pending:
+                self._collect(pending, bad_pages, FIRST_COMPLETED)
+        finally:
+            # Only left over when something failed, that error is the one to report
+            self._abandon(pending)
+            if own_pool:
+                pool.shutdown()
+        bad_pages.sort()
+        result = {}
+        result['page_count'] = page_count
+        result['bad_page_count'] = len(bad_pages)
+        result['bad_pages'] = bad_pages[:CodeDirectory.MAX_BAD_PAGES]
+        # A directory with a different number of slots than there are pages can't describe this code
+        result['valid'] = not bad_pages and page_count == self.n_code_slots
+        return result
+
+    @staticmethod
+    def _collect(pending, bad_pages, return_when):
+        """
+        Wait for hashing tasks and gather their bad pages. A task's error is raised once it's out of pending.
+        """
+        for future in wait(pending, return_when=return_when).done:
+            del pending[future]
+            bad_pages.extend(future.result())
+
+    @staticmethod
+    def _abandon(pending):
+        """
+        Cancel the tasks not started yet, releasing their views, and wait for the running ones, which release their
+        own. Nothing is raised, so the mapping can be closed and the error that got us here isn't replaced.
+        """
+        for future, view in pending.items():
+            if future.cancel():
+                view.release()
+        wait(pending)
+        pending.clear()
+
+    def _hash_chunk(self, view, first_page):
+        """
+        :return: Page numbers within the chunk whose hash doesn't match
+        """
+        bad_pages = []
+        page_size = self.page_size
+        with view:
+            for pos in range(0, len(view), page_size):
+                page = first_page + pos // page_size
+                with view[pos:pos + page_size] as page_view:
+                    digest = hashlib.new(self._hash_name, page_view).digest()
+                if digest[:self.hash_size] != self.code_slot_hash(page):
+                    bad_pages.append(page)
+        return bad_pages
+
+    def _c_string(self, offset):
+        end = self._blob.find(b'\0', offset)
+        if offset >= len(self._blob) or end < 0:
+            raise Exception('Code directory string at {0:#x} overruns the blob'.format(offset))
+        return self._blob[offset:end].decode('utf-8', errors='replace')
+
+
+class CodeSignature:
+    """
+    The embedded signature LC_CODE_SIGNATURE points at: a SuperBlob indexing the code directories, the requirements,
+    the entitlements and the CMS signature. It's big endian whatever the byte order of the slice.
+    """
+    SUPER_BLOB = Struct('>III')
+    BLOB_INDEX = Struct('>II')
+    BLOB_HEADER = Struct('>II')
+    CSMAGIC_REQUIREMENT = 0xfade0c00
+    CSMAGIC_REQUIREMENTS = 0xfade0c01
+    CSMAGIC_CODEDIRECTORY = 0xfade0c02
+    CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0cc0
+    CSMAGIC_EMBEDDED_ENTITLEMENTS = 0xfade7171
+    CSMAGIC_EMBEDDED_DER_ENTITLEMENTS = 0xfade7172
+    CSMAGIC_BLOBWRAPPER = 0xfade0b01
+
+    CSSLOT_CODEDIRECTORY = 0
+    CSSLOT_INFOSLOT = 1
+    CSSLOT_REQUIREMENTS = 2
+    CSSLOT_RESOURCEDIR = 3
+    CSSLOT_ENTITLEMENTS = 5
+    CSSLOT_DER_ENTITLEMENTS = 7
+    CSSLOT_ALTERNATE_CODEDIRECTORIES = 0x1000
+    CSSLOT_ALTERNATE_CODEDIRECTORY_MAX = 5
+    CSSLOT_SIGNATURESLOT = 0x10000
+
+    # Blobs which have their hash in a special slot of the code directory
+    HASHED_SLOTS = {
+        CSSLOT_REQUIREMENTS: 'requirements',
+        CSSLOT_ENTITLEMENTS: 'entitlements',
+        CSSLOT_DER_ENTITLEMENTS: 'der_entitlements',
+    }
+    REQUIREMENT_TYPES = {
+        1: 'host',
+        2: 'guest',
+        3: 'designated',
+        4: 'library',
+        5: 'plugin',
+    }
+
+    def __init__(self, blob) -> None:
+        """
+        __init__
+        :param blob: The bytes LC_CODE_SIGNATURE points at
+        """
+        super().__init__()
+        if len(blob) < CodeSignature.SUPER_BLOB.size:
+            raise Exception('Code signature is too small: {0} bytes'.format(len(blob)))
+        magic, length, count = CodeSignature.SUPER_BLOB.unpack_from(blob)
+        if magic != CodeSignature.CSMAGIC_EMBEDDED_SIGNATURE:
+            raise Exception('Bad code signature magic: {0:#x}'.format(magic))
+        if length > len(blob) or CodeSignature.SUPER_BLOB.size + count * CodeSignature.BLOB_INDEX.size > length:
+            raise Exception('Code signature index overruns the signature')
+        self._blobs = {}
+        for i in range(count):
+            slot, offset = CodeSignature.BLOB_INDEX.unpack_from(blob, CodeSignature.SUPER_BLOB.size + i * CodeSignature.BLOB_INDEX.size)
+            if offset + CodeSignature.BLOB_HEADER.size > length:
+                raise Exception('Code signature blob {0:#x} starts past the end of the signature'.format(slot))
+            blob_length = CodeSignature.BLOB_HEADER.unpack_from(blob, offset)[1]
+            if blob_length < CodeSignature.BLOB_HEADER.size or offset + blob_length > length:
+                raise Exception('Code signature blob {0:#x} overruns the signature'.format(slot))
+            self._blobs[slot] = blob[offset:offset + blob_length]
+        self._code_directories = None
+        self._entitlements = None
+
+    def blob(self, slot):
+        """
+        :return: The blob in the slot (header included), or None
+        """
+        return self._blobs.get(slot)
+
+    @property
+    def code_directories(self):
+        """
+        The primary code directory, then any alternates (a SHA-1 signature usually carries a SHA-256 alternate)
+        """
+        if self._code_directories is None:
+            slots = [CodeSignature.CSSLOT_CODEDIRECTORY]
+            slots += [CodeSignature.CSSLOT_ALTERNATE_CODEDIRECTORIES + i
+                      for i in range(CodeSignature.CSSLOT_ALTERNATE_CODEDIRECTORY_MAX)]
+            self._code_directories = [CodeDirectory(self._blobs[slot]) for slot in slots if slot in self._blobs]
+        return self._code_directories
+
+    @property
+    def code_directory(self):
+        """
+        The code directory with the strongest hash, or None if there isn't one
+        """
+        if not self.code_directories:
+            return None
+        return max(self.code_directories, key=lambda cd: CodeDirectory.HASH_STRENGTH.index(cd.hash_type))
+
+    @property
+    def entitlements(self):
+        """
+        The entitlements plist signed into the binary, as a dict, or None if it has none
+        """
+        if self._entitlements is None:
+            blob = self._blobs.get(CodeSignature.CSSLOT_ENTITLEMENTS)
+            if blob is None:
+                return None
+            entitlements = plistlib.loads(blob[CodeSignature.BLOB_HEADER.size:])
+            if not isinstance(entitlements, dict):
+                raise Exception('The signed entitlements are not a dictionary')
+            self._entitlements = entitlements
+        return self._entitlements
+
+    @property
+    def requirements(self):
+        """
+        :return: Names of the requirement types in the requirement set, e.g. ['designated']
+        """
+        blob = self._blobs.get(CodeSignature.CSSLOT_REQUIREMENTS)
+        if blob is None:
+            return []
+        count = CodeSignature.BLOB_HEADER.unpack_from(blob, 4)[1] if len(blob) >= 12 else 0
+        names = []
+        for i in range(count):
+            pos = 12 + i * CodeSignature.BLOB_INDEX.size
+            if pos + CodeSignature.BLOB_INDEX.size > len(blob):
+                raise Exception('Requirement set index overruns the blob')
+            req_type = CodeSignature.BLOB_INDEX.unpack_from(blob, pos)[0]
+            names.append(CodeSignature.REQUIREMENT_TYPES.get(req_type, '{0:#x}'.format(req_type)))
+        return names
+
+    @property
+    def signed(self):
+        """
+        False for ad-hoc signatures, which have no CMS signature (or an empty wrapper)
+        """
+        blob = self._blobs.get(CodeSignature.CSSLOT_SIGNATURESLOT)
+        return blob is not None and len(blob) > CodeSignature.BLOB_HEADER.size
+
+    def verify_blobs(self):
+        """
+        Check the hashed blobs against every code directory
+        :return: Dict of blob name => True / False, for each blob present in the signature
+        """
+        results = {}
+        for slot, name in CodeSignature.HASHED_SLOTS.items():
+            blob = self._blobs.get(slot)
+            if blob is None:
+                continue
+            checks = [cd.verify_blob(slot, blob) for cd in self.code_directories]
+            checks = [check for check in checks if check is not None]
+            # A blob that no directory vouches for could have been swapped in
+            results[name] = bool(checks) and all(checks)
+        return results
+
+    def dump_info(self):
+        """
+        :return: A python value object for the signature
+        """
+        code_dir = self.code_directory
+        val_obj = {}
+        val_obj['identifier'] = code_dir.identifier if code_dir is not None else None
+        val_obj['team_id'] = code_dir.team_id if code_dir is not None else None
+        val_obj['cdhash'] = code_dir.cdhash if code_dir is not None else None
+        val_obj['hash_type'] = code_dir.hash_type_name if code_dir is not None else None
+        val_obj['hash_types'] = [cd.hash_type_name for cd in self.code_directories]
+        val_obj['page_size'] = code_dir.page_size if code_dir is not None else None
+        val_obj['code_limit'] = code_dir.code_limit if code_dir is not None else None
+        val_obj['flags'] = code_dir.flags if code_dir is not None else None
+        val_obj['signed'] = self.signed
+        val_obj['requirements'] = self.requirements
+        val_obj['entitlements'] = self.entitlements
+        val_obj['blobs_valid'] = self.verify_blobs()
+        return val_obj
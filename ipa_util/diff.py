@@ -0,0 +1,212 @@
+import posixpath
+import zipfile
+
+from ipa_util.bundle import BundleInventory
+from ipa_util.info_plist import EmbeddedProvisioningPlistScanner
+from ipa_util.mach_o import MachO
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+class BuildDiff:
+    """
+    Structured delta between two builds of an app.
+
+    The central directories are compared by name, CRC32 and size, which needs no decompression at all. Only members
+    that actually changed are read: Info.plist is re-scanned, the provisioning profile re-decoded and changed
+    Mach-O files re-parsed, and only those parts are re-validated.
+    Member names are taken relative to the .app folder, so renaming the app doesn't show every file as changed.
+    """
+    # Slice fields compared for changed binaries
+    SLICE_FIELDS = ('size', 'file_type', 'uuid', 'platform', 'min_os', 'sdk', 'cryptid', 'dylibs')
+    # Provisioning fields that aren't worth reporting
+    PROFILE_SKIP_FIELDS = ('signer_certificates',)
+
+    def __init__(self, old_src, new_src) -> None:
+        """
+        __init__
+        :param old_src: Path or URL of the previous .ipa
+        :param new_src: Path or URL of the new .ipa
+        """
+        super().__init__()
+        self._old_src = old_src
+        self._new_src = new_src
+
+    def diff(self):
+        """
+        :return: The delta, {'files': ..., 'info_plist': ..., 'provisioning': ..., 'binaries': ..., 'validation': ...}
+        """
+        with _Build(self._old_src) as old, _Build(self._new_src) as new:
+            delta = {}
+            added, removed, changed = self._diff_members(old.members, new.members)
+            files = {}
+            files['added'] = [{'name': name, 'size': new.members[name].file_size} for name in added]
+            files['removed'] = [{'name': name, 'size': old.members[name].file_size} for name in removed]
+            files['changed'] = [{'name': name, 'old_size': old.members[name].file_size,
+                                 'new_size': new.members[name].file_size,
+                                 'size_delta': new.members[name].file_size - old.members[name].file_size}
+                                for name in changed]
+            files['unchanged_count'] = len(new.members) - len(added) - len(changed)
+            files['size_delta'] = sum(i.file_size for i in new.members.values()) - \
+                sum(i.file_size for i in old.members.values())
+            delta['files'] = files
+            errors = []
+            delta['info_plist'] = None
+            if 'Info.plist' in changed:
+                delta['info_plist'] = self.diff_dicts(old.info_plist(), new.info_plist())
+            delta['provisioning'] = None
+            if 'embedded.mobileprovision' in changed:
+                old_prov = self._profile_info(old.profile_plist())
+                new_prov = self._profile_info(new.profile_plist())
+                delta['provisioning'] = self.diff_dicts(old_prov, new_prov)
+            if 'Info.plist' in changed or 'embedded.mobileprovision' in changed:
+                # Both feed the app id check, the rest of the provisioning validation only needs the profile
+                new.info_plist()
+                try:
+                    new.validate.validate_provisioning_plist(new.profile_plist())
+                except Exception as e:
+                    errors.append(str(e))
+            delta['binaries'] = {}
+            for name in changed:
+                if not new.is_mach_o(name) or not old.is_mach_o(name):
+                    continue
+                new_info = new.mach_info(name)
+                binary_delta = self.diff_slices(old.mach_info(name), new_info)
+                if binary_delta:
+                    delta['binaries'][name] = binary_delta
+                try:
+                    new.validate.validate_binary(new_info)
+                except Exception as e:
+                    errors.append(str(e))
+            for name in added:
+                if new.is_mach_o(name):
+                    try:
+                        new.validate.validate_binary(new.mach_info(name))
+                    except Exception as e:
+                        errors.append(str(e))
+            delta['validation'] = errors
+            return delta
+
+    @staticmethod
+    def _diff_members(old_members, new_members):
+        """
+        :return: Tuple of sorted added, removed and changed (CRC32 or size differs) member names
+        """
+        added = sorted(name for name in new_members if name not in old_members)
+        removed = sorted(name for name in old_members if name not in new_members)
+        changed = []
+        for name, info in sorted(new_members.items()):
+            old_info = old_members.get(name)
+            if old_info is not None and (old_info.CRC != info.CRC or old_info.file_size != info.file_size):
+                changed.append(name)
+        return added, removed, changed
+
+    @staticmethod
+    def _profile_info(plist_dict):
+        val_obj = EmbeddedProvisioningPlistScanner(plist_dict).dump_info().to_dict()
+        for key in BuildDiff.PROFILE_SKIP_FIELDS:
+            val_obj.pop(key, None)
+        # Entitlements aren't part of dump_info() but a change there matters as much as the expiry
+        val_obj['Entitlements'] = plist_dict.get('Entitlements')
+        return val_obj
+
+    @staticmethod
+    def diff_dicts(old_dict, new_dict):
+        """
+        Compare two dictionaries key by key (top level only)
+        :return: {'added': {key: value}, 'removed': {key: value}, 'changed': {key: {'old': ..., 'new': ...}}}
+        """
+        delta = {}
+        delta['added'] = {key: new_dict[key] for key in sorted(new_dict) if key not in old_dict}
+        delta['removed'] = {key: old_dict[key] for key in sorted(old_dict) if key not in new_dict}
+        delta['changed'] = {key: {'old': old_dict[key], 'new': new_dict[key]}
+                            for key in sorted(new_dict) if key in old_dict and old_dict[key] != new_dict[key]}
+        return delta
+
+    @staticmethod
+    def diff_slices(old_info, new_info):
+        """
+        Compare the architecture slices of two versions of a binary, matching slices by architecture
+        :return: {'added': [arch], 'removed': [arch], 'changed': {arch: {field: {'old', 'new'}}}}, or None if equal
+        """
+        def by_arch(mach_info):
+            return {'{0} {1}'.format(s['cpu_type'], s['cpu_subtype']).strip(): s for s in mach_info['arch_slices']}
+        old_slices = by_arch(old_info)
+        new_slices = by_arch(new_info)
+        delta = {}
+        delta['added'] = sorted(arch for arch in new_slices if arch not in old_slices)
+        delta['removed'] = sorted(arch for arch in old_slices if arch not in new_slices)
+        delta['changed'] = {}
+        for arch, new_slice in sorted(new_slices.items()):
+            old_slice = old_slices.get(arch)
+            if old_slice is None:
+                continue
+            changes = {field: {'old': old_slice.get(field), 'new': new_slice.get(field)}
+                       for field in BuildDiff.SLICE_FIELDS if old_slice.get(field) != new_slice.get(field)}
+            if changes:
+                delta['changed'][arch] = changes
+        if old_info['binary_type'] != new_info['binary_type']:
+            delta['binary_type'] = {'old': old_info['binary_type'], 'new': new_info['binary_type']}
+        if not delta['added'] and not delta['removed'] and not delta['changed'] and 'binary_type' not in delta:
+            return None
+        return delta
+
+
+class _Build:
+    """
+    One side of a diff, opened in-archive. Everything beyond the central directory is read on demand.
+    """
+
+    def __init__(self, src_path) -> None:
+        self._src = open_source(src_path)
+        self._src_path = src_path
+        self._unpacker = Unpack(self._src, None)
+        try:
+            self.validate = Validate(self._unpacker.open_ipa())
+            self.validate.validate_structure()
+        except BaseException:
+            self.close()
+            raise
+        self._prefix = self.validate.app_dir.at
+        self.members = {info.filename[len(self._prefix):]: info for info in self._unpacker.ipa_zip.infolist()
+                        if info.filename.startswith(self._prefix) and not info.is_dir()}
+        # Anything outside the .app (iTunesMetadata.plist, SwiftSupport/...) keeps its full name
+        for info in self._unpacker.ipa_zip.infolist():
+            if not info.filename.startswith(self._prefix) and not info.is_dir():
+                self.members['/' + info.filename] = info
+        self._info_plist = None
+        self._profile_plist = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def info_plist(self):
+        if self._info_plist is None:
+            self._info_plist = self.validate.extract_plist()
+        return self._info_plist
+
+    def profile_plist(self):
+        if self._profile_plist is None:
+            signed_data = self._unpacker.extract_provisioning_info(self.validate.app_dir)
+            self._profile_plist = self.validate.extract_provisioning_plist(signed_data.content)
+        return self._profile_plist
+
+    def is_mach_o(self, name):
+        info = self.members[name]
+        if info.file_size < BundleInventory.SNIFF_SIZE:
+            return False
+        with self._unpacker.ipa_zip.open(info) as member_fp:
+            return BundleInventory.is_mach_o(member_fp.read(BundleInventory.SNIFF_SIZE))
+
+    def mach_info(self, name):
+        member = zipfile.Path(self._unpacker.ipa_zip, self.members[name].filename)
+        return MachO(member, posixpath.basename(name)).get_mach_info()
+
+    def close(self):
+        self._unpacker.close_ipa()
+        if self._src is not self._src_path:
+            self._src.close()
@@ -0,0 +1,130 @@
+import os
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+
+
+class DuplicateReport:
+    """
+    Finds files a build ships more than once, and how many bytes the copies waste.
+
+    Members are first grouped by uncompressed size and CRC32, straight from the zip central directory, which costs
+    no decompression at all. Only members that share both with another member are read: each is streamed through
+    SHA-256 on a thread pool (zlib and hashlib release the GIL), and members are only reported as duplicates when
+    their digests match. Nothing is extracted to disk.
+    """
+    DEFAULT_MIN_SIZE = 1
+
+    def __init__(self, src_path, min_size=DEFAULT_MIN_SIZE, max_workers=None) -> None:
+        """
+        __init__
+        :param src_path: Path or URL of the .ipa file, or a source.ByteSource
+        :param min_size: Ignore files smaller than this many bytes
+        :param max_workers: Threads used to hash the candidates, defaults to the CPU count
+        """
+        super().__init__()
+        self._src_path = src_path
+        self._min_size = max(1, min_size)
+        self._max_workers = max_workers or os.cpu_count() or 1
+
+    def report(self):
+        """
+        :return: {'file_count': ..., 'candidate_count': ..., 'hashed_bytes': ..., 'wasted_bytes': ...,
+                  'wasted_compressed_bytes': ..., 'duplicates': [...]}, duplicate sets most wasteful first
+        """
+        src = open_source(self._src_path)
+        unpacker = Unpack(src, None)
+        try:
+            return self.find_duplicates(unpacker.ipa_zip)
+        finally:
+            unpacker.close_ipa()
+            if src is not self._src_path:
+                src.close()
+
+    def find_duplicates(self, ipa_zip):
+        """
+        :param ipa_zip: An open ZipFile, such as Unpack.ipa_zip
+        :return: See report()
+        """
+        files = {}
+        for info in ipa_zip.infolist():
+            if not info.is_dir() and info.file_size >= self._min_size:
+                # A repeated name is the same file as far as extraction goes, the last one wins
+                files[info.filename] = info
+        groups = {}
+        for info in files.values():
+            groups.setdefault((info.file_size, info.CRC), []).append(info)
+        candidates = [info for group in groups.values() if len(group) > 1 for info in group]
+        digests = {}
+        if candidates:
+            # Largest first, so one big file doesn't start last and hold up the whole pool
+            candidates.sort(key=lambda i: i.file_size, reverse=True)
+            with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self._hash_member, ipa_zip, info)
+                           for info in candidates]
+                for info, future in zip(candidates, futures):
+                    digests[info.filename] = future.result()
+        sets = {}
+        for info in candidates:
+            sets.setdefault(digests[info.filename], []).append(info)
+        duplicates = [self._duplicate_set(digest, members) for digest, members in sets.items() if len(members) > 1]
+        duplicates.sort(key=lambda d: (-d['wasted_bytes'], d['files'][0]))
+        val_obj = {}
+        val_obj['file_count'] = len(files)
+        val_obj['candidate_count'] = len(candidates)
+        val_obj['hashed_bytes'] = sum(info.file_size for info in candidates)
+        val_obj['wasted_bytes'] = sum(d['wasted_bytes'] for d in duplicates)
+        val_obj['wasted_compressed_bytes'] = sum(d['wasted_compressed_bytes'] for d in duplicates)
+        val_obj['duplicates'] = duplicates
+        return val_obj
+
+    @staticmethod
+    def _hash_member(ipa_zip, info):
+        """
+        :return: Hex SHA-256 of the member, streamed CHUNK_SIZE at a time
+        """
+        digest = hashlib.sha256()
+        with ipa_zip.open(info) as member_fp:
+            while True:
+                chunk = member_fp.read(Unpack.CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _duplicate_set(digest, members):
+        """
+        One copy has to ship, the others are waste. For the download size that's every copy but the best
+        compressed one.
+        """
+        members = sorted(members, key=lambda i: i.filename)
+        compressed = [info.compress_size for info in members]
+        val_obj = {}
+        val_obj['sha256'] = digest
+        val_obj['size'] = members[0].file_size
+        val_obj['count'] = len(members)
+        val_obj['wasted_bytes'] = members[0].file_size * (len(members) - 1)
+        val_obj['wasted_compressed_bytes'] = sum(compressed) - min(compressed)
+        val_obj['files'] = [info.filename for info in members]
+        return val_obj
+
+    @staticmethod
+    def format_report(report):
+        """
+        :return: The report as text, one block per duplicate set
+        """
+        lines = []
+        lines.append('{0} files, {1} hashed ({2} bytes), {3} duplicate sets'.format(
+            report['file_count'], report['candidate_count'], report['hashed_bytes'], len(report['duplicates'])))
+        lines.append('{0} bytes wasted, {1} compressed'.format(report['wasted_bytes'], report['wasted_compressed_bytes']))
+        for duplicate in report['duplicates']:
+            lines.append('')
+            lines.append('{0:>12} wasted  {1} copies of {2} bytes, sha256 {3}'.format(
+                duplicate['wasted_bytes'], duplicate['count'], duplicate['size'], duplicate['sha256'][:16]))
+            for name in duplicate['files']:
+                lines.append('    {0}'.format(name))
+        return '\n'.join(lines)
@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import sqlite3
+import contextlib
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.cache import ResultCache
+from ipa_util.result import dumps, format_date
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+
+
+def index_one(src_path, known_fingerprint=None, in_archive=True):
+    """
+    Worker entry point for BuildIndex. Fingerprints the build from its central directory and only analyzes it if
+    the fingerprint differs from the indexed one.
+    :param src_path: Path or URL of the .ipa file
+    :param known_fingerprint: Fingerprint currently in the index, if any
+    :param in_archive: Read straight from the zip rather than unpacking to a temp folder
+    :return: A record with 'path' and 'fingerprint', plus 'unchanged', the analysis result or 'error'
+    """
+    record = {'path': src_path, 'fingerprint': None}
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            # One source for both steps: a URL's central directory is fetched once, and the analysis is of the
+            # very archive that was fingerprinted
+            src = open_source(src_path)
+            unpacker = Unpack(src, None)
+            try:
+                record['fingerprint'] = ResultCache.cache_key(unpacker.ipa_zip)
+                if record['fingerprint'] is not None and record['fingerprint'] == known_fingerprint:
+                    record['unchanged'] = True
+                    return record
+                record.update(IpaAnalyzer(src, in_archive=in_archive).analyze(unpacker))
+            finally:
+                unpacker.close_ipa()
+                if src is not src_path:
+                    src.close()
+    except Exception as e:
+        record['error'] = str(e)
+        record['error_type'] = type(e).__name__
+    return record
+
+
+class BuildIndex:
+    """
+    Local SQLite index of analyzed builds, for fleet wide questions such as which builds expire soon, which are
+    signed by a team or which still ship an architecture.
+
+    Each build is one row in builds with the commonly queried fields pulled out into indexed columns (and the full
+    result kept as JSON), plus one row per architecture slice of every Mach-O in the bundle in slices.
+    Builds whose size and mtime are unchanged are skipped without being opened; builds whose central directory
+    fingerprint (names, CRC32s and sizes, see ResultCache.cache_key) is unchanged are not re-analyzed.
+    """
+    DEFAULT_BATCH_SIZE = 500
+    BUILD_COLUMNS = ('path', 'size', 'mtime', 'fingerprint', 'indexed_at', 'bundle_id', 'bundle_version',
+                     'short_version', 'display_name', 'min_os', 'sdk', 'team_id', 'team_name', 'profile_uuid',
+                     'profile_name', 'creation_date', 'expiration_date', 'binary_type', 'error', 'result')
+    SLICE_COLUMNS = ('build_id', 'binary_path', 'cpu_type', 'arch', 'uuid', 'platform', 'min_os', 'sdk', 'cryptid')
+
+    def __init__(self, db_path) -> None:
+        """
+        __init__
+        :param db_path: Path to the index database, created if missing
+        """
+        super().__init__()
+        self._conn = sqlite3.connect(str(db_path), isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS builds (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, '
+                           'size INTEGER, mtime REAL, fingerprint TEXT, indexed_at REAL NOT NULL, bundle_id TEXT, '
+                           'bundle_version TEXT, short_version TEXT, display_name TEXT, min_os TEXT, sdk TEXT, '
+                           'team_id TEXT, team_name TEXT, profile_uuid TEXT, profile_name TEXT, creation_date TEXT, '
+                           'expiration_date TEXT, binary_type TEXT, error TEXT, result TEXT)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS slices (build_id INTEGER NOT NULL, binary_path TEXT NOT NULL, '
+                           'cpu_type TEXT, arch TEXT, uuid TEXT, platform TEXT, min_os TEXT, sdk TEXT, cryptid INTEGER)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS builds_bundle_id ON builds (bundle_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS builds_team_id ON builds (team_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS builds_profile_uuid ON builds (profile_uuid)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS builds_expiration_date ON builds (expiration_date)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_build_id ON slices (build_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_cpu_type ON slices (cpu_type, build_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_arch ON slices (arch, build_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_uuid ON slices (uuid)')
+        self.indexed_count = 0
+        self.unchanged_count = 0
+        self.error_count = 0
+
+    def close(self):
+        self._conn.close()
+
+    def index(self, paths, workers=None, batch_size=DEFAULT_BATCH_SIZE, in_archive=True):
+        """
+        Index builds, analyzing them on a process pool and writing the results in batched transactions
+        :param paths: Iterable of .ipa paths or URLs
+        :param workers: Number of worker processes, defaults to the CPU count
+        :param batch_size: Builds written per transaction
+        :param in_archive: Analyze straight from the zip rather than unpacking each build
+        :return: None
+        """
+        workers = workers or os.cpu_count() or 1
+        max_pending = workers * 4
+        # Everything needed for the skip checks, loaded once rather than one query per file
+        known = {row['path']: (row['size'], row['mtime'], row['fingerprint'])
+                 for row in self._conn.execute('SELECT path, size, mtime, fingerprint FROM builds')}
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            for src_path in paths:
+                src_path, size, mtime = self._stat(src_path)
+                entry = known.get(src_path)
+                if entry is not None and size is not None and entry[0] == size and entry[1] == mtime:
+                    self.unchanged_count += 1
+                    continue
+                if len(pending) >= max_pending:
+                    self._collect(pending, batch, batch_size, False)
+                future = pool.submit(index_one, src_path, entry[2] if entry is not None else None, in_archive)
+                pending[future] = (src_path, size, mtime)
+            self._collect(pending, batch, batch_size, True)
+        self._write_batch(batch)
+
+    def _collect(self, pending, batch, batch_size, wait_all):
+        done = wait(pending, return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED).done
+        for future in done:
+            src_path, size, mtime = pending.pop(future)
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {'path': src_path, 'fingerprint': None, 'error': str(e), 'error_type': type(e).__name__}
+            record['size'] = size
+            record['mtime'] = mtime
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._write_batch(batch)
+                del batch[:]
+
+    @staticmethod
+    def _stat(src_path):
+        """
+        :return: Tuple of the path as indexed (absolute for local files), size and mtime, or None for URLs
+        """
+        if src_path.startswith('http://') or src_path.startswith('https://'):
+            return src_path, None, None
+        src_path = os.path.abspath(src_path)
+        try:
+            st = os.stat(src_path)
+        except OSError:
+            return src_path, None, None
+        return src_path, st.st_size, st.st_mtime
+
+    def _write_batch(self, batch):
+        """
+        Write a batch of worker records in one transaction
+        """
+        if not batch:
+            return
+        conn = self._conn
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in batch:
+                if record.get('unchanged'):
+                    conn.execute('UPDATE builds SET size = ?, mtime = ?, indexed_at = ? WHERE path = ?',
+                                 (record['size'], record['mtime'], now, record['path']))
+                    self.unchanged_count += 1
+                    continue
+                row = self.build_row(record, now)
+                conn.execute('DELETE FROM slices WHERE build_id IN (SELECT id FROM builds WHERE path = ?)', (record['path'],))
+                conn.execute('DELETE FROM builds WHERE path = ?', (record['path'],))
+                cursor = conn.execute('INSERT INTO builds ({0}) VALUES ({1})'.format(
+                    ', '.join(BuildIndex.BUILD_COLUMNS), ', '.join('?' * len(BuildIndex.BUILD_COLUMNS))), row)
+                conn.executemany('INSERT INTO slices ({0}) VALUES ({1})'.format(
+                    ', '.join(BuildIndex.SLICE_COLUMNS), ', '.join('?' * len(BuildIndex.SLICE_COLUMNS))),
+                    self.slice_rows(cursor.lastrowid, record))
+                if 'error' in record:
+                    self.error_count += 1
+                else:
+                    self.indexed_count += 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def build_row(record, indexed_at):
+        """
+        :param record: A record from index_one()
+        :return: Values for BUILD_COLUMNS
+        """
+        ipa_info = record.get('ipa_info', {})
+        binary_info = ipa_info.get('binary_info') or {}
+        team_ids = ipa_info.get('TeamIdentifier') or [None]
+        return (record['path'], record.get('size'), record.get('mtime'), record.get('fingerprint'), indexed_at,
+                ipa_info.get('CFBundleIdentifier'), ipa_info.get('CFBundleVersion'),
+                ipa_info.get('CFBundleShortVersionString'), ipa_info.get('CFBundleDisplayName'),
+                ipa_info.get('MinimumOSVersion'), ipa_info.get('ios_sdk'), team_ids[0], ipa_info.get('TeamName'),
+                ipa_info.get('UUID'), ipa_info.get('Name'), ipa_info.get('CreationDate'),
+                ipa_info.get('ExpirationDate'), binary_info.get('binary_type'), record.get('error'),
+                dumps(ipa_info) if ipa_info else None)
+
+    @staticmethod
+    def slice_rows(build_id, record):
+        """
+        :return: Values for SLICE_COLUMNS, for the main executable ('' binary path) and every bundle binary
+        """
+        ipa_info = record.get('ipa_info', {})
+        binaries = [('', ipa_info.get('binary_info'))]
+        binaries += [(b['path'], b.get('binary_info')) for b in ipa_info.get('bundle_binaries', [])]
+        rows = []
+        for binary_path, binary_info in binaries:
+            if binary_info is None:
+                continue
+            for arch in binary_info.get('arch_slices', []):
+                # The specific architecture (armv7, arm64e) where the subtype has a name, else the cpu type
+                subtype = arch.get('cpu_subtype')
+                arch_name = subtype if subtype and not subtype.startswith('0x') else arch.get('cpu_type')
+                rows.append((build_id, binary_path, arch.get('cpu_type'), arch_name, arch.get('uuid'),
+                             arch.get('platform'), arch.get('min_os'), arch.get('sdk'), arch.get('cryptid')))
+        return rows
+
+    def query(self, bundle_id=None, team_id=None, profile_uuid=None, binary_uuid=None, arch=None,
+              expires_within=None, expired=None, errors=None, limit=None):
+        """
+        Find indexed builds. All given criteria must match.
+        :param bundle_id: Exact bundle id
+        :param team_id: Team identifier of the provisioning profile
+        :param profile_uuid: UUID of the provisioning profile
+        :param binary_uuid: LC_UUID of any Mach-O slice in the build
+        :param arch: Architecture shipped by any Mach-O in the build, specific ('armv7') or a cpu type ('arm')
+        :param expires_within: Profile expires between now and this many days from now
+        :param expired: True for builds whose profile has expired, False for those which haven't
+        :param errors: True for builds which failed to analyze, False for those which didn't
+        :param limit: Maximum number of rows
+        :return: List of dicts, ordered by path
+        """
+        where = []
+        params = []
+        now = datetime.now().replace(microsecond=0)
+        if bundle_id is not None:
+            where.append('bundle_id = ?')
+            params.append(bundle_id)
+        if team_id is not None:
+            where.append('team_id = ?')
+            params.append(team_id)
+        if profile_uuid is not None:
+            where.append('profile_uuid = ?')
+            params.append(profile_uuid)
+        if binary_uuid is not None:
+            where.append('id IN (SELECT build_id FROM slices WHERE uuid = ?)')
+            params.append(binary_uuid.upper())
+        if arch is not None:
+            where.append('id IN (SELECT build_id FROM slices WHERE arch = ? OR cpu_type = ?)')
+            params += [arch, arch]
+        if expires_within is not None:
+            where.append('expiration_date BETWEEN ? AND ?')
+            params += [format_date(now), format_date(now + timedelta(days=expires_within))]
+        if expired is not None:
+            where.append('expiration_date < ?' if expired else 'expiration_date >= ?')
+            params.append(format_date(now))
+        if errors is not None:
+            where.append('error IS NOT NULL' if errors else 'error IS NULL')
+        sql = 'SELECT path, bundle_id, short_version, bundle_version, team_id, team_name, profile_uuid, ' \
+              'expiration_date, binary_type, error FROM builds'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY path'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(row) for row in self._conn.execute(sql, params)]
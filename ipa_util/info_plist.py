@@ -1,11 +1,19 @@
 from datetime import datetime
 
+from ipa_util.result import AppMeta, ProvisioningInfo, DATE_FORMAT, format_date
+
 
 class PlistScanner:
     """
     Extracts useful info from Info.plist
     """
     # TODO: This can be improved.
+    # AppMeta attribute => the Info.plist key it's read from. Nothing else in the plist is decoded when it's a
+    # lazy_plist.LazyPlist.
+    KEYS = {'name': 'CFBundleName', 'display_name': 'CFBundleDisplayName', 'identifier': 'CFBundleIdentifier',
+            'version': 'CFBundleVersion', 'short_version': 'CFBundleShortVersionString', 'ios_sdk': 'DTSDKName',
+            'minimum_os_version': 'MinimumOSVersion', 'orientations': 'UISupportedInterfaceOrientations',
+            'required_capabilities': 'UIRequiredDeviceCapabilities', 'executable': 'CFBundleExecutable'}
 
     def __init__(self, plist_dict) -> None:
         super().__init__()
@@ -14,71 +22,91 @@ class PlistScanner:
     def dump_info(self):
         """
         Dump keys that are relevant to us. Used mainly for debugging
-        :return: A dictionary containing metadata we're interested in
-        """
-        val_obj = {}
-        self._safe_dict_copy('CFBundleIdentifier', val_obj)
-        self._safe_dict_copy('MinimumOSVersion', val_obj)
-        self._safe_dict_copy('UISupportedInterfaceOrientations', val_obj)
-        self._safe_dict_copy('DTSDKName', val_obj)
-        self._safe_dict_copy('UIRequiredDeviceCapabilities', val_obj)
-        self._safe_dict_copy('CFBundleVersion', val_obj)
-        self._safe_dict_copy('CFBundleShortVersionString', val_obj)
-        self._safe_dict_copy('CFBundleDisplayName', val_obj)
-        self._safe_dict_copy('CFBundleExecutable', val_obj)
-        return val_obj
-
-    def _safe_dict_copy(self, key, val_obj):
-        """
-        Safely copy from the source dict into a target but only if the given key exists
-        :param key: The key to look for in the source dict
-        :return: None
+        :return: A result.AppMeta, keys missing from the plist are left out
         """
-        val = self._plist_dict.get(key)
-        if val is not None:
-            val_obj[key] = val
+        plist_dict = self._plist_dict
+        return AppMeta(**{attr: plist_dict.get(key) for attr, key in PlistScanner.KEYS.items()})
 
 
 class EmbeddedProvisioningPlistScanner:
     """
     Extracts useful info from the embedded provisioning plist
     """
-    def __init__(self, plist_dict) -> None:
+    # ProvisioningInfo attribute => the profile key copied as is into it by dump_info()
+    COPY_KEYS = {'app_id_name': 'AppIDName', 'app_id_prefix': 'ApplicationIdentifierPrefix', 'platform': 'Platform',
+                 'name': 'Name', 'provisions_all_devices': 'ProvisionsAllDevices',
+                 'team_identifier': 'TeamIdentifier', 'team_name': 'TeamName', 'uuid': 'UUID'}
+    # Every key dump_info() decodes. ProvisionedDevices is only looked up, DeveloperCertificates and the like not
+    # at all, so they're never decoded when the plist is a lazy_plist.LazyPlist.
+    KEYS = tuple(COPY_KEYS.values()) + ('CreationDate', 'ExpirationDate', 'Entitlements')
+
+    def __init__(self, plist_dict, signer_chain=None) -> None:
+        """
+        __init__
+        :param plist_dict: Dictionary representation of the embedded provisioning plist
+        :param signer_chain: Optional list of cms.Certificate that signed the profile, signer first
+        """
         super().__init__()
         self._plist_dict = plist_dict
+        self._signer_chain = signer_chain
 
     def dump_info(self):
         """
         Dump keys that are relevant to us. Used mainly for debugging
-        :return:
+        :return: A result.ProvisioningInfo, keys missing from the profile are left out
         """
-        val_obj = {}
-        self._safe_dict_copy('AppIDName', val_obj)
-        self._safe_dict_copy('ApplicationIdentifierPrefix', val_obj)
-        self._safe_dict_copy('Platform', val_obj)
-        self._safe_dict_copy('Name', val_obj)
-        self._safe_dict_copy('ProvisionsAllDevices', val_obj)
-        self._safe_dict_copy('TeamIdentifier', val_obj)
-        self._safe_dict_copy('TeamName', val_obj)
-        self._safe_dict_copy('UUID', val_obj)
+        plist_dict = self._plist_dict
+        val_obj = ProvisioningInfo(**{attr: plist_dict.get(key)
+                                      for attr, key in EmbeddedProvisioningPlistScanner.COPY_KEYS.items()})
+        entitlements = plist_dict.get('Entitlements') or {}
+        val_obj.get_task_allow = entitlements.get('get-task-allow', False)
+        val_obj.application_identifier = entitlements.get('application-identifier')
+        val_obj.distribution_type = self.distribution_type(plist_dict)
         #
-        dt = self._plist_dict.get('CreationDate')
+        dt = plist_dict.get('CreationDate')
         if dt is not None:
-            val_obj['CreationDate'] = dt.isoformat()
-        exp_dt = self._plist_dict.get('ExpirationDate')
+            val_obj.creation_date = format_date(dt)
+        exp_dt = plist_dict.get('ExpirationDate')
         if exp_dt is not None:
-            val_obj['ExpirationDate'] = exp_dt.isoformat()
-        now = datetime.now()
-        val_obj['profile_is_expired'] = (exp_dt < now)
+            val_obj.expiration_date = format_date(exp_dt)
+        val_obj.profile_is_expired = self.is_expired(exp_dt)
+        if self._signer_chain is not None:
+            val_obj.signer_certificates = [cert.dump_info() for cert in self._signer_chain]
         return val_obj
 
-    def _safe_dict_copy(self, key, val_obj):
+    @staticmethod
+    def distribution_type(plist_dict):
         """
-        Safely copy from the source dict into a target but only if the given key exists
-        :param key: The key to look for in the source dict
-        :return: None
+        :param plist_dict: The provisioning profile
+        :return: 'enterprise', 'development', 'adhoc' or 'app_store'
+        """
+        if plist_dict.get('ProvisionsAllDevices'):
+            return 'enterprise'
+        if (plist_dict.get('Entitlements') or {}).get('get-task-allow'):
+            return 'development'
+        if 'ProvisionedDevices' in plist_dict:
+            return 'adhoc'
+        return 'app_store'
+
+    @staticmethod
+    def is_expired(exp_dt):
+        """
+        :param exp_dt: The profile ExpirationDate, None if it has none
+        :return: True if the profile has expired as of now, None if there's no date to tell
         """
-        val = self._plist_dict.get(key)
-        if val is not None:
-            val_obj[key] = val
+        if exp_dt is None:
+            return None
+        now = datetime.now()
+        return exp_dt < now
 
+    @staticmethod
+    def refresh_info(val_obj):
+        """
+        Recompute the time dependent fields of a previous dump_info() result, for results served from a cache
+        :param val_obj: A dump_info() result read back from JSON, or the ipa_info it's flattened into
+        :return: None
+        """
+        exp_dt = val_obj.get('ExpirationDate')
+        if exp_dt is not None:
+            val_obj['profile_is_expired'] = EmbeddedProvisioningPlistScanner.is_expired(
+                datetime.strptime(exp_dt, DATE_FORMAT))
@@ -0,0 +1,283 @@
+import plistlib
+from struct import Struct
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+
+class LazyPlist(Mapping):
+    """
+    Read-only, dict like view of a plist's top level dictionary which only decodes the values that are asked for.
+
+    Binary plists (bplist00) are read through their offset table: opening one decodes the trailer and the top level
+    keys, and each value is decoded on first access. XML plists get a scan over the top level dictionary which finds
+    where each value starts and ends with bytes.find(), so unwanted values (say, thousands of ProvisionedDevices)
+    are skipped at C speed; a wanted value is handed to plistlib on its own.
+    Anything the fast paths don't expect (comments, CDATA, a non-dict root, other encodings) falls back to a
+    full plistlib.loads(), so the result is always the same as plistlib's.
+    """
+    BPLIST_MAGIC = b'bplist00'
+    TRAILER = Struct('>6xBBQQQ')
+    TRAILER_SIZE = 32
+    XML_HEAD = b'<?xml version="1.0" encoding="UTF-8"?><plist version="1.0">'
+    XML_TAIL = b'</plist>'
+    XML_CONTAINERS = (b'array', b'dict')
+    XML_LEAVES = (b'string', b'integer', b'real', b'date', b'data')
+    # Markers of XML the scanner doesn't handle
+    XML_UNSUPPORTED = (b'<!--', b'<![CDATA[', b'<!ENTITY')
+    EPOCH = datetime(2001, 1, 1)
+
+    def __init__(self, data) -> None:
+        """
+        __init__
+        :param data: The plist file contents
+        """
+        super().__init__()
+        self._data = data
+        self._values = {}
+        self._full = None
+        self._index = None
+        self._reader = None
+        if data[:8] == LazyPlist.BPLIST_MAGIC:
+            try:
+                self._reader = _BinaryReader(data)
+                self._index = self._reader.top_level_refs()
+            except (IndexError, ValueError, UnicodeDecodeError, plistlib.InvalidFileException):
+                # Let plistlib produce its usual error, or cope with whatever confused us
+                self._reader = None
+                self._index = None
+        else:
+            self._index = self._scan_xml(data)
+        if self._index is None:
+            self._full = plistlib.loads(data)
+            if not isinstance(self._full, dict):
+                raise Exception('The plist root is not a dictionary')
+
+    @staticmethod
+    def load(fp):
+        """
+        :param fp: A binary file object
+        :return: A LazyPlist of its contents
+        """
+        return LazyPlist(fp.read())
+
+    def __getitem__(self, key):
+        if self._full is not None:
+            return self._full[key]
+        if key in self._values:
+            return self._values[key]
+        location = self._index[key]
+        if self._reader is not None:
+            value = self._reader.object_at(location)
+        else:
+            value = plistlib.loads(LazyPlist.XML_HEAD + self._data[location[0]:location[1]] + LazyPlist.XML_TAIL)
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        if self._full is not None:
+            return iter(self._full)
+        return iter(self._index)
+
+    def __len__(self):
+        if self._full is not None:
+            return len(self._full)
+        return len(self._index)
+
+    def __contains__(self, key):
+        if self._full is not None:
+            return key in self._full
+        return key in self._index
+
+    def to_dict(self):
+        """
+        :return: A plain dict with every value decoded
+        """
+        return {key: self[key] for key in self}
+
+    @staticmethod
+    def _scan_xml(data):
+        """
+        Find the byte range of every value in the top level dictionary of an XML plist
+        :return: Dict of key => (start, end), or None if the document isn't in a shape the scanner handles
+        """
+        if not (data.startswith(b'<?xml') or data.startswith(b'<plist') or data.startswith(b'<!DOCTYPE')):
+            return None
+        if any(marker in data for marker in LazyPlist.XML_UNSUPPORTED):
+            return None
+        head = data[:data.find(b'?>')] if data.startswith(b'<?xml') else b''
+        if b'encoding' in head and b'UTF-8' not in head.upper():
+            return None
+        pos = data.find(b'<plist')
+        if pos < 0:
+            return None
+        pos = data.find(b'>', pos) + 1
+        pos = _skip_space(data, pos)
+        if data.startswith(b'<dict/>', pos):
+            return {}
+        if not data.startswith(b'<dict>', pos):
+            return None
+        pos += len(b'<dict>')
+        index = {}
+        while True:
+            pos = _skip_space(data, pos)
+            if data.startswith(b'</dict>', pos):
+                return index
+            if not data.startswith(b'<key>', pos):
+                return None
+            key_end = data.find(b'</key>', pos)
+            if key_end < 0:
+                return None
+            key = data[pos + len(b'<key>'):key_end]
+            if b'&' in key or b'<' in key:
+                return None
+            start = _skip_space(data, key_end + len(b'</key>'))
+            end = LazyPlist._skip_xml_value(data, start)
+            if end is None:
+                return None
+            index[key.decode('utf-8')] = (start, end)
+            pos = end
+
+    @staticmethod
+    def _skip_xml_value(data, pos):
+        """
+        :return: The offset just past the XML value element starting at pos, or None if it isn't one
+        """
+        if data[pos:pos + 1] != b'<':
+            return None
+        tag_end = data.find(b'>', pos)
+        if tag_end < 0:
+            return None
+        if data[tag_end - 1:tag_end] == b'/':
+            # <true/>, <false/>, <array/>, <dict/>, <string/>
+            return tag_end + 1
+        tag = data[pos + 1:tag_end]
+        if tag in LazyPlist.XML_LEAVES:
+            close = data.find(b'</' + tag + b'>', tag_end)
+            return None if close < 0 else close + len(tag) + 3
+        if tag not in LazyPlist.XML_CONTAINERS:
+            return None
+        opening = b'<' + tag
+        closing = b'</' + tag + b'>'
+        depth = 1
+        pos = tag_end + 1
+        while depth:
+            close = data.find(closing, pos)
+            if close < 0:
+                return None
+            nested = data.find(opening, pos, close)
+            if nested >= 0:
+                nested_end = data.find(b'>', nested)
+                if data[nested_end - 1:nested_end] != b'/':
+                    depth += 1
+                pos = nested_end + 1
+            else:
+                depth -= 1
+                pos = close + len(closing)
+        return pos
+
+
+def _skip_space(data, pos):
+    while data[pos:pos + 1] in (b' ', b'\n', b'\r', b'\t'):
+        pos += 1
+    return pos
+
+
+class _BinaryReader:
+    """
+    Random access decoder for bplist00 objects, following the layout plistlib's _BinaryPlistParser reads
+    """
+
+    def __init__(self, data) -> None:
+        if len(data) < len(LazyPlist.BPLIST_MAGIC) + LazyPlist.TRAILER_SIZE:
+            raise plistlib.InvalidFileException()
+        self._data = data
+        (self._offset_size, self._ref_size, self._num_objects, self._top_object,
+         self._offset_table) = LazyPlist.TRAILER.unpack_from(data, len(data) - LazyPlist.TRAILER_SIZE)
+        if self._top_object >= self._num_objects or self._offset_table + self._num_objects * self._offset_size > len(data):
+            raise plistlib.InvalidFileException()
+        self._objects = {}
+
+    def top_level_refs(self):
+        """
+        :return: Dict of key => object ref for the top level dictionary, or None if the root isn't a dictionary
+        """
+        offset = self._offset(self._top_object)
+        marker = self._data[offset]
+        if marker >> 4 != 0xd:
+            return None
+        count, offset = self._count(marker, offset)
+        key_refs = self._refs(offset, count)
+        value_refs = self._refs(offset + count * self._ref_size, count)
+        return {self.object_at(key_ref): value_ref for key_ref, value_ref in zip(key_refs, value_refs)}
+
+    def object_at(self, ref):
+        if ref in self._objects:
+            return self._objects[ref]
+        offset = self._offset(ref)
+        data = self._data
+        marker = data[offset]
+        kind = marker >> 4
+        info = marker & 0xf
+        if marker == 0x00:
+            value = None
+        elif marker == 0x08:
+            value = False
+        elif marker == 0x09:
+            value = True
+        elif kind == 0x1:
+            size = 1 << info
+            value = int.from_bytes(data[offset + 1:offset + 1 + size], 'big', signed=info >= 3)
+        elif marker == 0x22:
+            value = Struct('>f').unpack_from(data, offset + 1)[0]
+        elif marker == 0x23:
+            value = Struct('>d').unpack_from(data, offset + 1)[0]
+        elif marker == 0x33:
+            value = LazyPlist.EPOCH + timedelta(seconds=Struct('>d').unpack_from(data, offset + 1)[0])
+        elif kind == 0x4:
+            count, offset = self._count(marker, offset)
+            value = bytes(data[offset:offset + count])
+        elif kind == 0x5:
+            count, offset = self._count(marker, offset)
+            value = data[offset:offset + count].decode('ascii')
+        elif kind == 0x6:
+            count, offset = self._count(marker, offset)
+            value = data[offset:offset + count * 2].decode('utf-16be')
+        elif kind == 0x8:
+            value = plistlib.UID(int.from_bytes(data[offset + 1:offset + 2 + info], 'big'))
+        elif kind == 0xa:
+            count, offset = self._count(marker, offset)
+            # Guard against reference cycles while the children are decoded
+            self._objects[ref] = value = []
+            value.extend(self.object_at(child) for child in self._refs(offset, count))
+        elif kind == 0xd:
+            count, offset = self._count(marker, offset)
+            self._objects[ref] = value = {}
+            key_refs = self._refs(offset, count)
+            value_refs = self._refs(offset + count * self._ref_size, count)
+            for key_ref, value_ref in zip(key_refs, value_refs):
+                value[self.object_at(key_ref)] = self.object_at(value_ref)
+        else:
+            raise plistlib.InvalidFileException()
+        self._objects[ref] = value
+        return value
+
+    def _offset(self, ref):
+        start = self._offset_table + ref * self._offset_size
+        return int.from_bytes(self._data[start:start + self._offset_size], 'big')
+
+    def _refs(self, offset, count):
+        size = self._ref_size
+        data = self._data
+        return [int.from_bytes(data[offset + i * size:offset + (i + 1) * size], 'big') for i in range(count)]
+
+    def _count(self, marker, offset):
+        """
+        :return: Tuple of the object's length and the offset of its contents
+        """
+        count = marker & 0xf
+        offset += 1
+        if count == 0xf:
+            size = 1 << (self._data[offset] & 0xf)
+            count = int.from_bytes(self._data[offset + 1:offset + 1 + size], 'big')
+            offset += 1 + size
+        return count, offset
@@ -1,11 +1,405 @@
-import sys
-from struct import *
+import mmap
+import zipfile
+from pathlib import Path
+from struct import Struct
+
+from ipa_util.codesign import CodeSignature
+from ipa_util.symbols import SymbolTable
+from ipa_util.result import ArchSlice, BinaryInfo
+
+
+class _MappedData:
+    """
+    Memory mapped executable. Views are zero copy, so only the pages that are actually looked at get read.
+    """
+
+    def __init__(self, file_path) -> None:
+        super().__init__()
+        self._fp = open(str(file_path), 'rb')
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file, can't be mapped
+            self._mm = b''
+        self.size = len(self._mm)
+
+    def view(self, offset, size):
+        """
+        :return: A memoryview over [offset, offset + size). Release it (or use it in a with block) when done.
+        """
+        if offset < 0 or offset + size > self.size:
+            raise Exception('Read past the end of the mach file: {0:#x}+{1:#x}'.format(offset, size))
+        return memoryview(self._mm)[offset:offset + size]
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fp.close()
+
+
+class _StreamData:
+    """
+    Fallback for executables that can't be mapped, such as zip members read in-archive. Views are read on demand
+    with seek() + read().
+    """
+
+    def __init__(self, fp, size=None) -> None:
+        """
+        __init__
+        :param fp: Seekable binary file object
+        :param size: Size of the file if known. Otherwise it's found by seeking to the end, which for a compressed
+                     zip member means decompressing all of it.
+        """
+        super().__init__()
+        self._fp = fp
+        self.size = fp.seek(0, 2) if size is None else size
+
+    def view(self, offset, size):
+        if offset < 0 or offset + size > self.size:
+            raise Exception('Read past the end of the mach file: {0:#x}+{1:#x}'.format(offset, size))
+        self._fp.seek(offset)
+        return memoryview(self._fp.read(size))
+
+    def close(self):
+        self._fp.close()
+
+
+class MachSlice:
+    """
+    A single architecture within a mach file. The header and load commands are only parsed on first use.
+    """
+    # struct mach_header, after the magic
+    MACH_HEADER = {'<': Struct('<iiIIII'), '>': Struct('>iiIIII')}
+    LOAD_COMMAND = {'<': Struct('<II'), '>': Struct('>II')}
+    SEGMENT = {'<': Struct('<16sIIII'), '>': Struct('>16sIIII')}
+    SEGMENT_64 = {'<': Struct('<16sQQQQ'), '>': Struct('>16sQQQQ')}
+    ENCRYPTION_INFO = {'<': Struct('<III'), '>': Struct('>III')}
+    VERSION_MIN = {'<': Struct('<II'), '>': Struct('>II')}
+    BUILD_VERSION = {'<': Struct('<III'), '>': Struct('>III')}
+    DYLIB = {'<': Struct('<IIII'), '>': Struct('>IIII')}
+    LINKEDIT_DATA = {'<': Struct('<II'), '>': Struct('>II')}
+    SYMTAB = {'<': Struct('<IIII'), '>': Struct('>IIII')}
+    # The leading ilocalsym, nlocalsym, iextdefsym, nextdefsym, iundefsym, nundefsym of struct dysymtab_command
+    DYSYMTAB = {'<': Struct('<IIIIII'), '>': Struct('>IIIIII')}
+
+    LC_SEGMENT = 0x1
+    LC_SYMTAB = 0x2
+    LC_DYSYMTAB = 0xb
+    LC_LOAD_DYLIB = 0xc
+    LC_ID_DYLIB = 0xd
+    LC_SEGMENT_64 = 0x19
+    LC_UUID = 0x1b
+    LC_CODE_SIGNATURE = 0x1d
+    LC_LAZY_LOAD_DYLIB = 0x20
+    LC_ENCRYPTION_INFO = 0x21
+    LC_VERSION_MIN_MACOSX = 0x24
+    LC_VERSION_MIN_IPHONEOS = 0x25
+    LC_ENCRYPTION_INFO_64 = 0x2c
+    LC_VERSION_MIN_TVOS = 0x2f
+    LC_VERSION_MIN_WATCHOS = 0x30
+    LC_BUILD_VERSION = 0x32
+    LC_LOAD_WEAK_DYLIB = 0x80000018
+    LC_REEXPORT_DYLIB = 0x8000001f
+    LC_LOAD_UPWARD_DYLIB = 0x80000023
+
+    DYLIB_COMMANDS = {
+        LC_LOAD_DYLIB: 'load',
+        LC_LOAD_WEAK_DYLIB: 'weak',
+        LC_REEXPORT_DYLIB: 'reexport',
+        LC_LAZY_LOAD_DYLIB: 'lazy',
+        LC_LOAD_UPWARD_DYLIB: 'upward',
+    }
+    VERSION_MIN_PLATFORMS = {
+        LC_VERSION_MIN_MACOSX: 'macos',
+        LC_VERSION_MIN_IPHONEOS: 'ios',
+        LC_VERSION_MIN_TVOS: 'tvos',
+        LC_VERSION_MIN_WATCHOS: 'watchos',
+    }
+    # LC_BUILD_VERSION platform values
+    BUILD_PLATFORMS = {
+        1: 'macos',
+        2: 'ios',
+        3: 'tvos',
+        4: 'watchos',
+        5: 'bridgeos',
+        6: 'maccatalyst',
+        7: 'iossimulator',
+        8: 'tvossimulator',
+        9: 'watchossimulator',
+        10: 'driverkit',
+        11: 'visionos',
+        12: 'visionossimulator',
+    }
+    FILE_TYPES = {
+        1: 'object',
+        2: 'execute',
+        6: 'dylib',
+        7: 'dylinker',
+        8: 'bundle',
+        10: 'dsym',
+    }
+
+    def __init__(self, data, offset, size, cpu_type, cpu_subtype) -> None:
+        """
+        __init__
+        :param data: The _MappedData / _StreamData the slice lives in
+        :param offset: Offset of the slice's mach header within the file
+        :param size: Size of the slice
+        :param cpu_type: Decoded cpu type name
+        :param cpu_subtype: Decoded cpu subtype name
+        """
+        super().__init__()
+        self._data = data
+        self.offset = offset
+        self.size = size
+        self.cpu_type = cpu_type
+        self.cpu_subtype = cpu_subtype
+        self._parsed = False
+        self._endian = None
+        self._is_64 = False
+        self._file_type = None
+        self._uuid = None
+        self._platform = None
+        self._min_os = None
+        self._sdk = None
+        self._cryptid = None
+        self._segments = []
+        self._dylibs = []
+        self._load_commands = []
+        self._code_signature_range = None
+        self._code_signature = None
+        self._symtab = None
+        self._dysymtab = None
+        self._symbol_table = None
+
+    @property
+    def file_type(self):
+        self._parse()
+        return MachSlice.FILE_TYPES.get(self._file_type, '{0:#x}'.format(self._file_type))
+
+    @property
+    def uuid(self):
+        self._parse()
+        return self._uuid
+
+    @property
+    def platform(self):
+        self._parse()
+        return self._platform
+
+    @property
+    def min_os(self):
+        self._parse()
+        return self._min_os
+
+    @property
+    def sdk(self):
+        self._parse()
+        return self._sdk
+
+    @property
+    def cryptid(self):
+        """
+        Non zero when the slice is encrypted (App Store FairPlay), None if there's no encryption info at all
+        """
+        self._parse()
+        return self._cryptid
+
+    @property
+    def segments(self):
+        self._parse()
+        return self._segments
+
+    @property
+    def dylibs(self):
+        self._parse()
+        return self._dylibs
+
+    @property
+    def code_signature(self):
+        """
+        The CodeSignature LC_CODE_SIGNATURE points at, or None if the slice isn't signed
+        """
+        self._parse()
+        if self._code_signature is None and self._code_signature_range is not None:
+            dataoff, datasize = self._code_signature_range
+            with self._data.view(self.offset + dataoff, datasize) as sig:
+                self._code_signature = CodeSignature(bytes(sig))
+        return self._code_signature
+
+    @property
+    def symbol_table(self):
+        """
+        The SymbolTable LC_SYMTAB describes, or None if the slice has none. Read on first use.
+        """
+        self._parse()
+        if self._symbol_table is None and self._symtab is not None:
+            symoff, nsyms, stroff, strsize = self._symtab
+            entry_size = SymbolTable.NLIST_64_SIZE if self._is_64 else SymbolTable.NLIST_SIZE
+            if symoff + nsyms * entry_size > self.size or stroff + strsize > self.size:
+                raise Exception('The symbol table of the {0} slice runs past its end'.format(self.cpu_type))
+            self._symbol_table = SymbolTable(self._data, self.offset, self._endian, self._is_64, self._symtab,
+                                             self._dysymtab)
+        return self._symbol_table
+
+    def verify_pages(self, pool=None):
+        """
+        Verify the page hashes of the strongest code directory, see CodeDirectory.verify_pages()
+        :param pool: Executor to hash on
+        :return: The verification result, or None if the slice isn't signed
+        """
+        code_sig = self.code_signature
+        if code_sig is None or code_sig.code_directory is None:
+            return None
+        if code_sig.code_directory.code_limit > self.size:
+            raise Exception('The code signature covers {0:#x} bytes but the slice is only {1:#x}'.format(
+                code_sig.code_directory.code_limit, self.size))
+        return code_sig.code_directory.verify_pages(self._data, self.offset, pool)
+
+    @property
+    def load_commands(self):
+        """
+        :return: List of (cmd, offset within the file, cmdsize) for every load command in the slice
+        """
+        self._parse()
+        return self._load_commands
+
+    def signature_info(self, read_signature=False, verify_pages=False, pool=None):
+        """
+        :param read_signature: Read the signature blob and check the blobs it hashes. The blob sits at the end of the
+                               slice, so a binary read out of a zip or over HTTP is read in full to get to it.
+        :param verify_pages: Also hash every page covered by the code signature, see verify_pages()
+        :param pool: Executor to hash the pages on
+        :return: The signature's 'offset' within the slice and 'size', from LC_CODE_SIGNATURE, with the fields of
+                 CodeSignature.dump_info() when it was read. None if the slice isn't signed.
+        """
+        self._parse()
+        if self._code_signature_range is None:
+            return None
+        val_obj = {}
+        val_obj['offset'], val_obj['size'] = self._code_signature_range
+        if read_signature or verify_pages:
+            val_obj.update(self.code_signature.dump_info())
+        if verify_pages:
+            val_obj['pages'] = self.verify_pages(pool)
+        return val_obj
+
+    def dump_info(self, load_commands=True, verify_pages=False, pool=None, read_signature=False):
+        """
+        :param load_commands: Include the details that need the load commands walked
+        :param verify_pages: Hash every page covered by the code signature, see verify_pages()
+        :param pool: Executor to hash the pages on
+        :param read_signature: Include the contents of the code signature, see signature_info()
+        :return: A result.ArchSlice for this slice
+        """
+        slice = ArchSlice(cpu_type=self.cpu_type, cpu_subtype=self.cpu_subtype, offset=self.offset, size=self.size)
+        if load_commands:
+            slice.file_type = self.file_type
+            slice.uuid = self.uuid
+            slice.platform = self.platform
+            slice.min_os = self.min_os
+            slice.sdk = self.sdk
+            slice.cryptid = self.cryptid
+            slice.segments = self.segments
+            slice.dylibs = [dylib['name'] for dylib in self.dylibs]
+            slice.code_signature = self.signature_info(read_signature, verify_pages, pool)
+        return slice
+
+    def _parse(self):
+        """
+        Read the mach header and walk the load commands. Only the header and the load command area are touched.
+        """
+        if self._parsed:
+            return
+        self._parsed = True
+        with self._data.view(self.offset, 28) as hdr:
+            magic = MachO.MAGIC.unpack_from(hdr)[0]
+            if magic in (MachO.MACHO_HEADER_MAGIC, MachO.MACHO64_HEADER_MAGIC):
+                endian = '>'
+            elif magic in (MachO.MACHO_HEADER_CIGAM, MachO.MACHO64_HEADER_CIGAM):
+                endian = '<'
+            else:
+                raise Exception('Unknown header bytes: {0:#x}'.format(magic))
+            self._endian = endian
+            self._is_64 = magic in (MachO.MACHO64_HEADER_MAGIC, MachO.MACHO64_HEADER_CIGAM)
+            cputype, cpusubtype, self._file_type, ncmds, sizeofcmds, flags = MachSlice.MACH_HEADER[endian].unpack_from(hdr, 4)
+        header_size = 32 if self._is_64 else 28
+        with self._data.view(self.offset + header_size, sizeofcmds) as cmds:
+            self._walk_load_commands(cmds, ncmds, self.offset + header_size)
+
+    def _walk_load_commands(self, cmds, ncmds, base):
+        """
+        :param cmds: View over the load command area
+        :param ncmds: Number of load commands from the header
+        :param base: File offset of the load command area
+        """
+        endian = self._endian
+        lc = MachSlice.LOAD_COMMAND[endian]
+        pos = 0
+        for i in range(ncmds):
+            if pos + lc.size > len(cmds):
+                raise Exception('Load command {0} overruns sizeofcmds'.format(i))
+            cmd, cmdsize = lc.unpack_from(cmds, pos)
+            if cmdsize < lc.size or pos + cmdsize > len(cmds):
+                raise Exception('Bad cmdsize {0} for load command {1:#x}'.format(cmdsize, cmd))
+            body = pos + lc.size
+            self._load_commands.append((cmd, base + pos, cmdsize))
+            if cmd == MachSlice.LC_SEGMENT or cmd == MachSlice.LC_SEGMENT_64:
+                seg_struct = MachSlice.SEGMENT_64[endian] if cmd == MachSlice.LC_SEGMENT_64 else MachSlice.SEGMENT[endian]
+                segname, vmaddr, vmsize, fileoff, filesize = seg_struct.unpack_from(cmds, body)
+                segment = {}
+                segment['name'] = segname.rstrip(b'\0').decode('utf-8', errors='replace')
+                segment['vmaddr'] = vmaddr
+                segment['vmsize'] = vmsize
+                segment['fileoff'] = fileoff
+                segment['filesize'] = filesize
+                self._segments.append(segment)
+            elif cmd == MachSlice.LC_UUID:
+                raw = bytes(cmds[body:body + 16]).hex().upper()
+                self._uuid = '{0}-{1}-{2}-{3}-{4}'.format(raw[:8], raw[8:12], raw[12:16], raw[16:20], raw[20:])
+            elif cmd == MachSlice.LC_SYMTAB:
+                self._symtab = MachSlice.SYMTAB[endian].unpack_from(cmds, body)
+            elif cmd == MachSlice.LC_DYSYMTAB:
+                self._dysymtab = MachSlice.DYSYMTAB[endian].unpack_from(cmds, body)
+            elif cmd == MachSlice.LC_CODE_SIGNATURE:
+                self._code_signature_range = MachSlice.LINKEDIT_DATA[endian].unpack_from(cmds, body)
+            elif cmd == MachSlice.LC_ENCRYPTION_INFO or cmd == MachSlice.LC_ENCRYPTION_INFO_64:
+                self._cryptid = MachSlice.ENCRYPTION_INFO[endian].unpack_from(cmds, body)[2]
+            elif cmd in MachSlice.VERSION_MIN_PLATFORMS:
+                version, sdk = MachSlice.VERSION_MIN[endian].unpack_from(cmds, body)
+                self._set_version(MachSlice.VERSION_MIN_PLATFORMS[cmd], version, sdk)
+            elif cmd == MachSlice.LC_BUILD_VERSION:
+                platform, minos, sdk = MachSlice.BUILD_VERSION[endian].unpack_from(cmds, body)
+                self._set_version(MachSlice.BUILD_PLATFORMS.get(platform, str(platform)), minos, sdk)
+            elif cmd in MachSlice.DYLIB_COMMANDS:
+                name_offset, timestamp, current_version, compat_version = MachSlice.DYLIB[endian].unpack_from(cmds, body)
+                name = bytes(cmds[pos + name_offset:pos + cmdsize]).split(b'\0', 1)[0]
+                dylib = {}
+                dylib['name'] = name.decode('utf-8', errors='replace')
+                dylib['kind'] = MachSlice.DYLIB_COMMANDS[cmd]
+                dylib['current_version'] = self._decode_version(current_version)
+                dylib['compat_version'] = self._decode_version(compat_version)
+                self._dylibs.append(dylib)
+            pos += cmdsize
+
+    def _set_version(self, platform, min_os, sdk):
+        self._platform = platform
+        self._min_os = self._decode_version(min_os)
+        self._sdk = self._decode_version(sdk)
+
+    @staticmethod
+    def _decode_version(version):
+        """
+        Versions are packed as xxxx.yy.zz nibbles
+        """
+        return '{0}.{1}.{2}'.format(version >> 16, (version >> 8) & 0xff, version & 0xff)
 
 
 class MachO:
     """
     Apple mach and universal binary parsing.
-    Note this class doesn't do much. For our purposes, we're only interested in the headers
+    The file is memory mapped and each slice's load commands are walked lazily, so even a huge fat binary only has
+    its header pages read.
     """
     # 4 bytes for magic - 0xcafebabe
     # 4 bytes for a count of how many slices are in this file
@@ -16,6 +410,7 @@ class MachO:
     MACHO64_HEADER_CIGAM = 0xcffaedfe
     # Identifies this file as a fat binary
     FAT_HEADER_MAGIC = 0xcafebabe
+    FAT64_HEADER_MAGIC = 0xcafebabf
     # Size for the cpu type / subtype fields in the mach header
     MACH_ARCH_SIZE = 8
     # Size for the fat_arch struct
@@ -28,17 +423,31 @@ class MachO:
     #     uint32_t      size;
     #     uint32_t      align;
     # };
+    # fat_arch_64 widens offset and size to 64 bits and adds a reserved field
+    FAT_ARCH_64_SIZE = 32
     ARCH_64BIT_FLAG = 0x01000000
     ARCH_MASK       = 0x00ffffff
+    # The top byte of the subtype holds capability bits (pointer auth on arm64e)
+    SUBTYPE_MASK    = 0x00ffffff
+    CPU_TYPE_ARM = 12
+
+    MAGIC = Struct('>I')
+    FAT_HEADER = Struct('>II')
+    FAT_ARCH = Struct('>iiIII')
+    FAT_ARCH_64 = Struct('>iiQQII')
+    THIN_ARCH = {'<': Struct('<ii'), '>': Struct('>ii')}
 
     def __init__(self, executable_file, executable_name) -> None:
         """
         __init__
-        :param executable_file: Full path to the executable file in mach format
+        :param executable_file: Full path to the executable file in mach format, on disk or a zipfile.Path
         """
         super().__init__()
         self._executable_file = executable_file
         self._executable_name = executable_name
+        self._data = None
+        self._binary_type = None
+        self._slices = None
         # cpu type map
         self._cputype_map = {}
         self._cputype_map[7] = 'x86'
@@ -58,88 +467,109 @@ class MachO:
         self._arm_subtype_map[14] = 'armv6m'
         self._arm_subtype_map[15] = 'armv7m'
         self._arm_subtype_map[16] = 'armv7em'
-        if sys.byteorder == 'big':
-            self._sys_is_big_endian = True
+        self._arm64_subtype_map = {}
+        self._arm64_subtype_map[0] = ''
+        self._arm64_subtype_map[1] = 'arm64v8'
+        self._arm64_subtype_map[2] = 'arm64e'
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """
+        Map the executable. Files inside a zip can't be mapped and are read on demand instead.
+        :return: None
+        """
+        if self._data is not None:
+            return
+        if isinstance(self._executable_file, zipfile.Path):
+            # The central directory has the size, no need to seek through the member for it
+            member_size = self._executable_file.root.getinfo(self._executable_file.at).file_size
+            self._data = _StreamData(self._executable_file.open('rb'), member_size)
         else:
-            self._sys_is_big_endian = False
+            self._data = _MappedData(Path(self._executable_file))
 
-    def get_mach_info(self):
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+            self._slices = None
+
+    @property
+    def binary_type(self):
+        self._read_header()
+        return self._binary_type
+
+    def slices(self):
+        """
+        :return: List of MachSlice, one per architecture. Load commands are parsed when first asked for.
+        """
+        self._read_header()
+        return self._slices
+
+    def get_mach_info(self, load_commands=True, verify_pages=False, pool=None, read_signature=False):
         """
         Extract info from the mach file into a python object.
-        :return: A python value object
+        :param load_commands: Walk the load commands as well as reading the slice headers
+        :param verify_pages: Check every page against the code signature. This reads the whole file.
+        :param pool: Executor to hash the pages on, shared by the slices. One is made per slice if not given.
+        :param read_signature: Read each slice's code signature rather than just where it is. The signature is at
+                               the end of the slice, so from a zip or over HTTP this reads the whole file too.
+        :return: A result.BinaryInfo
+        """
+        value_object = BinaryInfo(binary_name=self._executable_name)
+        opened_here = self._data is None
+        self.open()
+        try:
+            value_object.binary_type = self.binary_type
+            value_object.arch_slices = [s.dump_info(load_commands, verify_pages, pool, read_signature)
+                                        for s in self.slices()]
+        finally:
+            if opened_here:
+                self.close()
+        return value_object
+
+    def _read_header(self):
+        """
+        Read the fat header (if any) and build the slice list
         """
-        value_object = {}
-        ftype = 'Unknown'
+        if self._slices is not None:
+            return
+        self.open()
+        data = self._data
+        if data.size < MachO.HEADER_MAGIC_SIZE + MachO.MACH_ARCH_SIZE:
+            raise Exception('File is too small to be a mach file: {0} bytes'.format(data.size))
         binary_slices = []
-        with self._executable_file.open('rb') as macho_fp:
-            header_magic = macho_fp.read(MachO.HEADER_MAGIC_SIZE)
-            res = unpack('>I', header_magic)
-            if res[0] == MachO.FAT_HEADER_MAGIC:
+        with data.view(0, MachO.HEADER_MAGIC_SIZE + MachO.MACH_ARCH_SIZE) as hdr:
+            magic = MachO.MAGIC.unpack_from(hdr)[0]
+            if magic == MachO.FAT_HEADER_MAGIC or magic == MachO.FAT64_HEADER_MAGIC:
                 ftype = 'fat_binary'
-                fat_count = macho_fp.read(MachO.HEADER_MAGIC_SIZE)
-                res = unpack('>I', fat_count)
-                for i in range(res[0]):
-                    slice = {}
-                    arch_struct = macho_fp.read(MachO.FAT_ARCH_SIZE)
-                    res_arch = unpack('>iiIII', arch_struct)
-                    dec_cpu = self._decode_cpu_types(res_arch[0],res_arch[1])
-                    slice['cpu_type'] = dec_cpu[0]
-                    slice['cpu_subtype'] = dec_cpu[1]
-                    binary_slices.append(slice)
-            elif res[0] == MachO.MACHO_HEADER_MAGIC:
+                fat_count = MachO.FAT_HEADER.unpack_from(hdr)[1]
+            elif magic == MachO.MACHO_HEADER_MAGIC or magic == MachO.MACHO_HEADER_CIGAM:
                 ftype = 'mach_o_binary'
-                slice = {}
-                arch_struct = macho_fp.read(MachO.MACH_ARCH_SIZE)
-                if self._sys_is_big_endian:
-                    res_arch = unpack('<ii', arch_struct)
-                else:
-                    res_arch = unpack('>ii', arch_struct)
-                dec_cpu = self._decode_cpu_types(res_arch[0],res_arch[1])
-                slice['cpu_type'] = dec_cpu[0]
-                slice['cpu_subtype'] = dec_cpu[1]
-                binary_slices.append(slice)
-            elif res[0] == MachO.MACHO_HEADER_CIGAM:
-                ftype = 'mach_o_binary'
-                slice = {}
-                arch_struct = macho_fp.read(MachO.MACH_ARCH_SIZE)
-                if not self._sys_is_big_endian:
-                    res_arch = unpack('<ii', arch_struct)
-                else:
-                    res_arch = unpack('>ii', arch_struct)
-                dec_cpu = self._decode_cpu_types(res_arch[0],res_arch[1])
-                slice['cpu_type'] = dec_cpu[0]
-                slice['cpu_subtype'] = dec_cpu[1]
-                binary_slices.append(slice)
-            elif res[0] == MachO.MACHO64_HEADER_MAGIC:
-                ftype = 'mach_64_binary'
-                slice = {}
-                arch_struct = macho_fp.read(MachO.MACH_ARCH_SIZE)
-                if self._sys_is_big_endian:
-                    res_arch = unpack('<ii', arch_struct)
-                else:
-                    res_arch = unpack('>ii', arch_struct)
-                dec_cpu = self._decode_cpu_types(res_arch[0],res_arch[1])
-                slice['cpu_type'] = dec_cpu[0]
-                slice['cpu_subtype'] = dec_cpu[1]
-                binary_slices.append(slice)
-            elif res[0] == MachO.MACHO64_HEADER_CIGAM:
+            elif magic == MachO.MACHO64_HEADER_MAGIC or magic == MachO.MACHO64_HEADER_CIGAM:
                 ftype = 'mach_64_binary'
-                slice = {}
-                arch_struct = macho_fp.read(MachO.MACH_ARCH_SIZE)
-                if not self._sys_is_big_endian:
-                    res_arch = unpack('<ii', arch_struct)
-                else:
-                    res_arch = unpack('>ii', arch_struct)
-                dec_cpu = self._decode_cpu_types(res_arch[0],res_arch[1])
-                slice['cpu_type'] = dec_cpu[0]
-                slice['cpu_subtype'] = dec_cpu[1]
-                binary_slices.append(slice)
             else:
-                raise Exception('Unknown header bytes: {0:#x}'.format(res[0]))
-        value_object['binary_name'] = self._executable_name
-        value_object['binary_type'] = ftype
-        value_object['arch_slices'] = binary_slices
-        return value_object
+                raise Exception('Unknown header bytes: {0:#x}'.format(magic))
+            if ftype != 'fat_binary':
+                # The magic reads back as MAGIC when the file is big endian, CIGAM when it's little endian
+                endian = '>' if magic in (MachO.MACHO_HEADER_MAGIC, MachO.MACHO64_HEADER_MAGIC) else '<'
+                res_arch = MachO.THIN_ARCH[endian].unpack_from(hdr, MachO.HEADER_MAGIC_SIZE)
+                dec_cpu = self._decode_cpu_types(res_arch[0], res_arch[1])
+                binary_slices.append(MachSlice(data, 0, data.size, dec_cpu[0], dec_cpu[1]))
+        if ftype == 'fat_binary':
+            arch_struct = MachO.FAT_ARCH_64 if magic == MachO.FAT64_HEADER_MAGIC else MachO.FAT_ARCH
+            with data.view(8, arch_struct.size * fat_count) as archs:
+                for i in range(fat_count):
+                    res_arch = arch_struct.unpack_from(archs, i * arch_struct.size)
+                    dec_cpu = self._decode_cpu_types(res_arch[0], res_arch[1])
+                    binary_slices.append(MachSlice(data, res_arch[2], res_arch[3], dec_cpu[0], dec_cpu[1]))
+        self._binary_type = ftype
+        self._slices = binary_slices
 
     def _decode_cpu_types(self, cpu_type, cpu_subtype):
         """
@@ -155,9 +585,12 @@ class MachO:
             cpu_typ_name = '{0:#x}'.format(cpu_typ_num)
         if cpu_type & MachO.ARCH_64BIT_FLAG:
             cpu_typ_name = cpu_typ_name + '64'
-        if cpu_typ_num == 12:
-            cpu_subtyp_name = self._arm_subtype_map.get(cpu_subtype)
+        if cpu_typ_num == MachO.CPU_TYPE_ARM:
+            cpu_subtype &= MachO.SUBTYPE_MASK
+            if cpu_type & MachO.ARCH_64BIT_FLAG:
+                cpu_subtyp_name = self._arm64_subtype_map.get(cpu_subtype)
+            else:
+                cpu_subtyp_name = self._arm_subtype_map.get(cpu_subtype)
             if cpu_subtyp_name is None:
                 cpu_subtyp_name = '{0:#x}'.format(cpu_subtype)
         return cpu_typ_name, cpu_subtyp_name
-
@@ -0,0 +1,255 @@
+import io
+import os
+import time
+import zipfile
+import threading
+import contextlib
+import tracemalloc
+from contextvars import ContextVar
+
+# The recorder for the analysis running in this context, and the stage counters are charged to. Thread pools
+# that should report into it have to run their tasks in a copy of the submitting context.
+_recorder = ContextVar('vipa_metrics_recorder', default=None)
+_stage = ContextVar('vipa_metrics_stage', default=None)
+
+
+def active():
+    """
+    :return: The MetricsRecorder for the current analysis, or None when instrumentation is off
+    """
+    return _recorder.get()
+
+
+def stage(name):
+    """
+    Time a pipeline stage, a no-op unless a recorder is active
+    :param name: Stage name in the report
+    :return: A context manager
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return contextlib.nullcontext()
+    return recorder.stage(name)
+
+
+def count(name, value=1):
+    """
+    Add to one of MetricsRecorder.COUNTERS for the current stage, a no-op unless a recorder is active
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+class _StageFrame:
+    __slots__ = ('name', 'wall', 'cpu', 'base_memory', 'peak_memory')
+
+    def __init__(self, name, base_memory) -> None:
+        self.name = name
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.base_memory = base_memory
+        self.peak_memory = base_memory
+
+
+class MetricsRecorder:
+    """
+    Collects per-stage wall and CPU time, I/O counters and peak traced memory for one analysis.
+    Use as a context manager around the run; stage() blocks and count() calls made within it are recorded.
+
+    CPU time is process CPU, so it includes any helper threads running during the stage. Peak memory comes from
+    tracemalloc, which slows every allocation down noticeably, so it can be turned off.
+    """
+    COUNTERS = ('bytes_read', 'bytes_decompressed', 'files_written', 'bytes_written', 'files_skipped')
+
+    def __init__(self, trace_memory=True) -> None:
+        """
+        __init__
+        :param trace_memory: Record peak memory with tracemalloc
+        """
+        super().__init__()
+        self._trace_memory = trace_memory
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._totals = dict.fromkeys(MetricsRecorder.COUNTERS, 0)
+        self._frames = []
+        self._tokens = None
+        self._total = None
+
+    def __enter__(self):
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._tokens = (_recorder.set(self), _stage.set(None))
+        self._total = self._push('total')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pop(self._total)
+        _recorder.reset(self._tokens[0])
+        _stage.reset(self._tokens[1])
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        frame = self._push(name)
+        token = _stage.set(name)
+        try:
+            yield
+        finally:
+            _stage.reset(token)
+            self._pop(frame)
+
+    def count(self, name, value=1):
+        stage_name = _stage.get()
+        with self._lock:
+            self._totals[name] += value
+            if stage_name is not None:
+                self._entry(stage_name)[name] += value
+
+    def to_dict(self):
+        """
+        :return: {'total': {...}, 'stages': {name: {...}}}, stages in the order they first ran
+        """
+        report = {}
+        report['total'] = self._stages.get('total', {})
+        report['stages'] = {name: entry for name, entry in self._stages.items() if name != 'total'}
+        return report
+
+    def _entry(self, name):
+        entry = self._stages.get(name)
+        if entry is None:
+            entry = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+            entry.update(dict.fromkeys(MetricsRecorder.COUNTERS, 0))
+            if self._trace_memory:
+                entry['peak_memory_bytes'] = 0
+            self._stages[name] = entry
+        return entry
+
+    def _traced_peak(self):
+        """
+        Fold the tracemalloc peak since the last reset into every open frame
+        """
+        if not self._trace_memory:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._frames:
+            frame.peak_memory = max(frame.peak_memory, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def _push(self, name):
+        current = self._traced_peak()
+        with self._lock:
+            # Create the entry up front so the report lists stages in the order they started
+            self._entry(name)
+        frame = _StageFrame(name, current or 0)
+        self._frames.append(frame)
+        return frame
+
+    def _pop(self, frame):
+        self._traced_peak()
+        self._frames.remove(frame)
+        with self._lock:
+            entry = self._entry(frame.name)
+            entry['calls'] += 1
+            entry['wall_seconds'] += time.perf_counter() - frame.wall
+            entry['cpu_seconds'] += time.process_time() - frame.cpu
+            if self._trace_memory:
+                entry['peak_memory_bytes'] = max(entry['peak_memory_bytes'], frame.peak_memory - frame.base_memory)
+            if frame.name == 'total':
+                entry.update(self._totals)
+
+
+class CountingFileIO(io.FileIO):
+    """
+    A local file which reports the bytes read from it to the active recorder
+    """
+
+    def read(self, size=-1):
+        data = super().read(size)
+        count('bytes_read', len(data))
+        return data
+
+    def readinto(self, b):
+        size = super().readinto(b)
+        count('bytes_read', size or 0)
+        return size
+
+
+class _MeteredMember(io.RawIOBase):
+    """
+    Wraps an open zip member and reports the bytes it decompresses
+    """
+
+    def __init__(self, member_fp) -> None:
+        super().__init__()
+        self._member_fp = member_fp
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._member_fp.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        before = self._member_fp.tell()
+        pos = self._member_fp.seek(offset, whence)
+        # ZipExtFile seeks by decompressing: forward from where it is, backward from the start of the member
+        count('bytes_decompressed', pos - before if pos >= before else pos)
+        return pos
+
+    def tell(self):
+        return self._member_fp.tell()
+
+    def read(self, size=-1):
+        data = self._member_fp.read(size)
+        count('bytes_decompressed', len(data))
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._member_fp.close()
+        super().close()
+
+
+# zipfile.Path re-classes a plain ZipFile to FastLookup, which would drop our open(). Being one already avoids that.
+_ZipFileBase = getattr(zipfile, 'FastLookup', zipfile.CompleteDirs)
+
+
+class MeteredZipFile(_ZipFileBase):
+    """
+    ZipFile whose member reads are reported to the active recorder as decompressed bytes. A path is opened as a
+    CountingFileIO so the compressed bytes read are reported too; ByteSources count their own fetches.
+    """
+
+    def __init__(self, file, mode='r', *args, **kwargs) -> None:
+        self._counted_fp = None
+        if isinstance(file, (str, os.PathLike)) and mode == 'r':
+            file = self._counted_fp = CountingFileIO(file)
+        try:
+            super().__init__(file, mode, *args, **kwargs)
+        except BaseException:
+            if self._counted_fp is not None:
+                self._counted_fp.close()
+            raise
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._counted_fp is not None:
+                self._counted_fp.close()
+
+    def open(self, name, mode='r', pwd=None, *, force_zip64=False):
+        member_fp = super().open(name, mode, pwd, force_zip64=force_zip64)
+        if mode != 'r':
+            return member_fp
+        return _MeteredMember(member_fp)
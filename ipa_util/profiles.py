@@ -0,0 +1,295 @@
+import os
+from bisect import bisect_right
+from datetime import datetime
+
+from ipa_util.cms import SignedData
+from ipa_util.info_plist import EmbeddedProvisioningPlistScanner
+from ipa_util.lazy_plist import LazyPlist
+
+
+class _ProfileGroup:
+    """
+    The profiles sharing one app id. Kept ranked by expiry, latest first, so lookups only ever concatenate groups.
+    """
+    __slots__ = ('uuids', '_ranked', '_keys')
+
+    def __init__(self) -> None:
+        self.uuids = set()
+        self._ranked = None
+        self._keys = None
+
+    def add(self, uuid):
+        self.uuids.add(uuid)
+        self._ranked = None
+
+    def discard(self, uuid):
+        self.uuids.discard(uuid)
+        self._ranked = None
+
+    def ranked(self, expiration):
+        """
+        :param expiration: Dict of UUID => expiry timestamp
+        :return: Tuple of the UUIDs latest expiry first, and the negated expiry of each (ascending, for bisect)
+        """
+        if self._ranked is None:
+            order = sorted(self.uuids, key=lambda uuid: (-expiration[uuid], uuid))
+            self._ranked = order
+            self._keys = [-expiration[uuid] for uuid in order]
+        return self._ranked, self._keys
+
+
+class _TrieNode:
+    """
+    One label of a reverse-domain app id, com -> acme -> app1
+    """
+    __slots__ = ('children', 'exact', 'wildcards')
+
+    def __init__(self) -> None:
+        self.children = {}
+        # Profiles whose app id ends at this label
+        self.exact = _ProfileGroup()
+        # Wildcard app ids continuing from this label: label prefix before the '*' => _ProfileGroup.
+        # com.acme.* is stored under acme with prefix '', com.ac* under com with prefix 'ac'.
+        self.wildcards = {}
+
+
+class ProfileLibrary:
+    """
+    An in-memory library of provisioning profiles, answering "which profiles can sign this bundle id" without
+    scanning them all.
+
+    Profiles are decoded once and kept by UUID. Their app ids go into a trie keyed on the dot separated labels, with
+    wildcard app ids hung off the label before the '*', so a lookup walks one path of the trie whatever the size of
+    the library. Each team also gets its own trie, and the device filter is a set lookup against an index of UDIDs.
+    The wildcard semantics are the ones Validate._validate_app_id applies: the app id up to the '*' is a prefix of
+    the bundle id.
+    """
+    PROFILE_SUFFIX = '.mobileprovision'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._profiles = {}
+        self._expiration = {}
+        self._teams = {}
+        self._by_device = {}
+        self._all_devices = set()
+        # One trie over the whole library, plus one per team so a team lookup never sees other teams' profiles
+        self._tries = {None: _TrieNode()}
+        # path => ((size, mtime), UUID), so reloading a directory only decodes new or changed files
+        self._files = {}
+        # (path, message) of every file that couldn't be decoded, for the caller to report
+        self.errors = []
+
+    def __len__(self):
+        return len(self._profiles)
+
+    @property
+    def error_count(self):
+        return len(self.errors)
+
+    def load_directory(self, directory):
+        """
+        Load every .mobileprovision file in a folder (not recursive). Calling it again picks up new, changed and
+        removed files.
+        :param directory: Folder of profiles
+        :return: Number of profiles decoded by this call
+        """
+        seen = set()
+        decoded = 0
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.endswith(ProfileLibrary.PROFILE_SUFFIX):
+                continue
+            seen.add(entry.path)
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            known = self._files.get(entry.path)
+            if known is not None and known[0] == signature:
+                continue
+            if known is not None:
+                self._release(entry.path)
+            try:
+                uuid = self.add_profile(entry.path)
+            except Exception as e:
+                self.errors.append((entry.path, str(e)))
+                continue
+            self._files[entry.path] = (signature, uuid)
+            decoded += 1
+        directory_prefix = os.path.join(directory, '')
+        for path in [path for path in self._files if path.startswith(directory_prefix) and path not in seen]:
+            self._release(path)
+        return decoded
+
+    def _release(self, path):
+        """
+        Forget a file, and its profile unless another file carries the same UUID
+        """
+        uuid = self._files.pop(path)[1]
+        if not any(known[1] == uuid for known in self._files.values()):
+            self._remove(uuid)
+
+    def add_profile(self, profile_path, data=None):
+        """
+        Decode a profile and add it to the indexes. A profile whose UUID is already in the library isn't decoded again.
+        :param profile_path: Path of the .mobileprovision file, also reported in the results
+        :param data: The file contents, read from profile_path if not given
+        :return: The profile's UUID
+        """
+        if data is None:
+            with open(profile_path, 'rb') as fp:
+                data = fp.read()
+        plist_dict = LazyPlist(SignedData(data).content)
+        uuid = plist_dict.get('UUID')
+        if uuid is None:
+            raise Exception('The provisioning profile has no UUID')
+        if uuid in self._profiles:
+            return uuid
+        profile = EmbeddedProvisioningPlistScanner(plist_dict).dump_info().to_dict()
+        profile['path'] = str(profile_path)
+        app_identifier = profile.setdefault('application-identifier', '')
+        self._profiles[uuid] = profile
+        expiration = plist_dict.get('ExpirationDate')
+        self._expiration[uuid] = expiration.timestamp() if expiration is not None else float('-inf')
+        for device in plist_dict.get('ProvisionedDevices', ()):
+            self._by_device.setdefault(device, set()).add(uuid)
+        if plist_dict.get('ProvisionsAllDevices'):
+            self._all_devices.add(uuid)
+        prefix, app_id = self._split_app_id(app_identifier)
+        self._group(None, app_id, True).add(uuid)
+        self._teams[uuid] = sorted({prefix, *profile.get('TeamIdentifier', ())})
+        for team in self._teams[uuid]:
+            self._group(team, app_id, True).add(uuid)
+        return uuid
+
+    def profile(self, uuid):
+        """
+        :return: The profile's value object, or None if it isn't in the library
+        """
+        return self._profiles.get(uuid)
+
+    def match(self, bundle_id, team=None, device=None, include_expired=False, now=None):
+        """
+        Find the profiles which can sign a bundle id
+        :param bundle_id: CFBundleIdentifier of the app
+        :param team: Only profiles of this team identifier / app id prefix
+        :param device: Only profiles that can install on this device UDID
+        :param include_expired: Include profiles past their ExpirationDate
+        :param now: The time to check expiry against, defaults to now
+        :return: List of profile value objects, most specific app id first, then latest expiry first
+        """
+        return self._rank(self._candidates(bundle_id, team), self._allowed(device), include_expired, now or datetime.now())
+
+    def match_many(self, bundle_ids, team=None, device=None, include_expired=False, now=None):
+        """
+        match() for many bundle ids at once. The device filter is resolved once for the whole batch.
+        :return: Dict of bundle id => list of profile value objects
+        """
+        now = now or datetime.now()
+        allowed = self._allowed(device)
+        results = {}
+        for bundle_id in bundle_ids:
+            if bundle_id not in results:
+                results[bundle_id] = self._rank(self._candidates(bundle_id, team), allowed, include_expired, now)
+        return results
+
+    def _candidates(self, bundle_id, team):
+        """
+        Walk the trie along the bundle id's labels, collecting the exact group at the end and the wildcard groups
+        on the way
+        :param team: Walk this team's trie rather than the whole library's
+        :return: List of _ProfileGroup, most specific app id first
+        """
+        labels = bundle_id.split('.')
+        found = []
+        node = self._tries.get(team)
+        if node is None:
+            return found
+        matched = 0
+        for label in labels:
+            for label_prefix, group in node.wildcards.items():
+                if label.startswith(label_prefix):
+                    found.append((matched + len(label_prefix), group))
+            node = node.children.get(label)
+            if node is None:
+                break
+            matched += len(label) + 1
+        else:
+            found.append((len(bundle_id) + 1, node.exact))
+        found.sort(key=lambda item: item[0], reverse=True)
+        return [group for specificity, group in found]
+
+    def _allowed(self, device):
+        """
+        :return: The set of UUIDs which can install on the device, or None when there's no device filter
+        """
+        if device is None:
+            return None
+        return self._by_device.get(device, set()) | self._all_devices
+
+    def _rank(self, groups, allowed, include_expired, now):
+        """
+        :param groups: From _candidates()
+        :param allowed: From _allowed()
+        :return: The profile value objects, most specific first, then latest expiry first
+        """
+        profiles = self._profiles
+        results = []
+        for group in groups:
+            ranked, keys = group.ranked(self._expiration)
+            if not include_expired:
+                # Everything after the cut expired before now
+                ranked = ranked[:bisect_right(keys, -now.timestamp())]
+            if allowed is None:
+                results.extend([profiles[uuid] for uuid in ranked])
+            else:
+                results.extend([profiles[uuid] for uuid in ranked if uuid in allowed])
+        return results
+
+    @staticmethod
+    def _split_app_id(app_identifier):
+        """
+        :return: Tuple of the app id prefix (the team) and the app id, ABC123.com.acme.* => (ABC123, com.acme.*)
+        """
+        ix = app_identifier.find('.')
+        return (app_identifier[:ix], app_identifier[ix + 1:]) if ix >= 0 else (app_identifier, '')
+
+    def _group(self, team, app_id, create):
+        """
+        :param team: Team whose trie to look in, None for the whole library's
+        :return: The _ProfileGroup for an app id, or None if it isn't in the trie and create is False
+        """
+        if team not in self._tries:
+            if not create:
+                return None
+            self._tries[team] = _TrieNode()
+        node = self._tries[team]
+        ix = app_id.find('*')
+        labels = (app_id[:ix] if ix >= 0 else app_id).split('.')
+        for label in labels[:-1]:
+            if label not in node.children:
+                if not create:
+                    return None
+                node.children[label] = _TrieNode()
+            node = node.children[label]
+        if ix >= 0:
+            if labels[-1] not in node.wildcards and create:
+                node.wildcards[labels[-1]] = _ProfileGroup()
+            return node.wildcards.get(labels[-1])
+        if labels[-1] not in node.children:
+            if not create:
+                return None
+            node.children[labels[-1]] = _TrieNode()
+        return node.children[labels[-1]].exact
+
+    def _remove(self, uuid):
+        profile = self._profiles.pop(uuid, None)
+        if profile is None:
+            return
+        self._expiration.pop(uuid, None)
+        self._all_devices.discard(uuid)
+        for uuids in self._by_device.values():
+            uuids.discard(uuid)
+        app_id = self._split_app_id(profile['application-identifier'])[1]
+        for team in [None] + self._teams.pop(uuid, []):
+            group = self._group(team, app_id, False)
+            if group is not None:
+                group.discard(uuid)
@@ -0,0 +1,318 @@
+import io
+import os
+from datetime import datetime
+from collections.abc import Mapping
+from json.encoder import encode_basestring_ascii
+
+# A field that was never set, as opposed to one set to None
+_UNSET = object()
+# Dates are naive UTC when plistlib decodes them
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class ResultObject(Mapping):
+    """
+    Base of the typed result objects. Fields live in __slots__, so a result costs a few pointers per field rather
+    than a dict per object, and the output keys are declared once per class in FIELDS.
+    A result reads like a read-only dict of its set fields, so code written against plain dict results (and results
+    read back from JSON, such as cached ones) works with either.
+    """
+    __slots__ = ()
+    # (output key, attribute) in output order
+    FIELDS = ()
+    # Attributes holding results whose fields are output inline, ahead of FIELDS
+    INLINE = ()
+    # Treat fields set to None as missing, like PlistScanner._safe_dict_copy() did
+    OMIT_NONE = False
+    # Output key => attribute, filled in for each subclass
+    _ATTRS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._ATTRS = {key: attr for key, attr in cls.FIELDS}
+
+    def __init__(self, **fields) -> None:
+        """
+        __init__
+        :param fields: Attribute values. Anything not given is left unset and doesn't appear in the output.
+        """
+        super().__init__()
+        for attr, value in fields.items():
+            setattr(self, attr, value)
+
+    def iter_fields(self):
+        """
+        :return: Iterator of (output key, value) for every field which is set, in output order
+        """
+        for attr in self.INLINE:
+            part = getattr(self, attr, None)
+            if part is not None:
+                yield from part.iter_fields()
+        omit_none = self.OMIT_NONE
+        for key, attr in self.FIELDS:
+            value = getattr(self, attr, _UNSET)
+            if value is _UNSET or (omit_none and value is None):
+                continue
+            yield key, value
+
+    def __getitem__(self, key):
+        attr = self._ATTRS.get(key)
+        if attr is not None:
+            value = getattr(self, attr, _UNSET)
+            if value is _UNSET or (self.OMIT_NONE and value is None):
+                raise KeyError(key)
+            return value
+        for part_attr in self.INLINE:
+            part = getattr(self, part_attr, None)
+            if part is not None and key in part:
+                return part[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (key for key, value in self.iter_fields())
+
+    def __len__(self):
+        return sum(1 for _ in self.iter_fields())
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join('{0}={1!r}'.format(key, value)
+                                                              for key, value in self.iter_fields()))
+
+    def to_dict(self):
+        """
+        :return: A plain dict of the result, nested results included
+        """
+        return {key: _plain(value) for key, value in self.iter_fields()}
+
+
+def _plain(value):
+    if isinstance(value, ResultObject):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+class AppMeta(ResultObject):
+    """
+    Metadata from Info.plist
+    """
+    __slots__ = ('name', 'display_name', 'identifier', 'version', 'short_version', 'ios_sdk', 'minimum_os_version',
+                 'orientations', 'required_capabilities', 'executable')
+    FIELDS = (('CFBundleName', 'name'), ('CFBundleDisplayName', 'display_name'),
+              ('CFBundleIdentifier', 'identifier'), ('CFBundleVersion', 'version'),
+              ('CFBundleShortVersionString', 'short_version'), ('ios_sdk', 'ios_sdk'),
+              ('MinimumOSVersion', 'minimum_os_version'), ('UISupportedInterfaceOrientations', 'orientations'),
+              ('UIRequiredDeviceCapabilities', 'required_capabilities'), ('CFBundleExecutable', 'executable'))
+    OMIT_NONE = True
+
+
+class ProvisioningInfo(ResultObject):
+    """
+    Details of the embedded provisioning profile
+    """
+    __slots__ = ('app_id_name', 'app_id_prefix', 'get_task_allow', 'application_identifier', 'expiration_date',
+                 'team_name', 'uuid', 'distribution_type', 'name', 'platform', 'provisions_all_devices',
+                 'team_identifier', 'creation_date', 'profile_is_expired', 'signer_certificates')
+    FIELDS = (('AppIDName', 'app_id_name'), ('ApplicationIdentifierPrefix', 'app_id_prefix'),
+              ('get-task-allow', 'get_task_allow'), ('application-identifier', 'application_identifier'),
+              ('ExpirationDate', 'expiration_date'), ('TeamName', 'team_name'), ('UUID', 'uuid'),
+              ('distribution_type', 'distribution_type'), ('Name', 'name'), ('Platform', 'platform'),
+              ('ProvisionsAllDevices', 'provisions_all_devices'), ('TeamIdentifier', 'team_identifier'),
+              ('CreationDate', 'creation_date'), ('profile_is_expired', 'profile_is_expired'),
+              ('signer_certificates', 'signer_certificates'))
+    OMIT_NONE = True
+
+
+class ArchSlice(ResultObject):
+    """
+    One architecture of a Mach-O. The load command fields are unset when the load commands weren't walked.
+    """
+    __slots__ = ('cpu_type', 'cpu_subtype', 'offset', 'size', 'file_type', 'uuid', 'platform', 'min_os', 'sdk',
+                 'cryptid', 'segments', 'dylibs', 'code_signature')
+    FIELDS = tuple((attr, attr) for attr in __slots__)
+
+
+class BinaryInfo(ResultObject):
+    """
+    A Mach-O file and its architecture slices
+    """
+    __slots__ = ('binary_name', 'binary_type', 'arch_slices')
+    FIELDS = tuple((attr, attr) for attr in __slots__)
+
+
+class BundleBinary(ResultObject):
+    """
+    A binary found in the bundle, with whether it passed validation
+    """
+    __slots__ = ('path', 'binary_info', 'valid', 'error')
+    FIELDS = tuple((attr, attr) for attr in __slots__)
+
+
+class IpaInfo(ResultObject):
+    """
+    The result for a whole .ipa. The app metadata and provisioning fields are flat at the top level, as in
+    sample_files/sample_output.json, followed by the binaries.
+    """
+    __slots__ = ('app_meta', 'provisioning', 'binary_info', 'bundle_binaries')
+    INLINE = ('app_meta', 'provisioning')
+    FIELDS = (('binary_info', 'binary_info'), ('bundle_binaries', 'bundle_binaries'))
+
+
+class Finding(ResultObject):
+    """
+    An error or warning from a validation rule. path is the binary it concerns, relative to the .app folder, if any.
+    """
+    __slots__ = ('rule', 'severity', 'path', 'message')
+    FIELDS = tuple((attr, attr) for attr in __slots__)
+    OMIT_NONE = True
+
+
+class JsonWriter:
+    """
+    Writes results as JSON while walking them, field by field, so a result is never turned into one big dict or
+    string first. Output is collected in a small buffer and written out every BUFFER_SIZE characters.
+    Strings are escaped like json.dumps() does by default, datetimes are written as ISO 8601 UTC and anything else
+    json can't represent is written as its str(), as with json.dumps(default=str).
+    """
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, fp, indent=None) -> None:
+        """
+        __init__
+        :param fp: Text stream to write to, or an int file descriptor
+        :param indent: Spaces to indent nested values by. The output is compact on one line if not given.
+        """
+        super().__init__()
+        self._fp = fp
+        self._indent = indent
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, value):
+        """
+        Write one JSON value, with nothing after it
+        :return: None
+        """
+        self._encode(value, 0)
+        self.flush()
+
+    def write_line(self, value):
+        """
+        Write a value followed by a newline. With no indent that's one JSON Lines record.
+        :return: None
+        """
+        self._encode(value, 0)
+        self._append('\n')
+        self.flush()
+
+    def flush(self):
+        if self._buffer:
+            text = ''.join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            if isinstance(self._fp, int):
+                data = text.encode('utf-8')
+                while data:
+                    data = data[os.write(self._fp, data):]
+            else:
+                self._fp.write(text)
+        if not isinstance(self._fp, int):
+            self._fp.flush()
+
+    def _append(self, text):
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= JsonWriter.BUFFER_SIZE:
+            self.flush()
+
+    def _encode(self, value, level):
+        append = self._append
+        if isinstance(value, str):
+            append(encode_basestring_ascii(value))
+        elif value is None:
+            append('null')
+        elif value is True:
+            append('true')
+        elif value is False:
+            append('false')
+        elif isinstance(value, int):
+            append(int.__repr__(value))
+        elif isinstance(value, float):
+            append(self._float(value))
+        elif isinstance(value, ResultObject):
+            self._encode_items(value.iter_fields(), level)
+        elif isinstance(value, Mapping):
+            self._encode_items(value.items(), level)
+        elif isinstance(value, (list, tuple)):
+            self._encode_list(value, level)
+        elif isinstance(value, datetime):
+            append(encode_basestring_ascii(format_date(value)))
+        else:
+            append(encode_basestring_ascii(str(value)))
+
+    def _encode_items(self, items, level):
+        append = self._append
+        separator = self._newline(level + 1)
+        first = True
+        for key, value in items:
+            if first:
+                append('{' + separator[1:])
+                first = False
+            else:
+                append(separator)
+            if not isinstance(key, str):
+                # As json.dumps() does for keys
+                if isinstance(key, float):
+                    key = self._float(key)
+                else:
+                    key = 'null' if key is None else 'true' if key is True else 'false' if key is False else str(key)
+            append(encode_basestring_ascii(key))
+            append(': ' if self._indent is not None else ':')
+            self._encode(value, level + 1)
+        append('{}' if first else self._newline(level)[1:] + '}')
+
+    def _encode_list(self, values, level):
+        if not values:
+            self._append('[]')
+            return
+        separator = self._newline(level + 1)
+        self._append('[' + separator[1:])
+        for ix, value in enumerate(values):
+            if ix:
+                self._append(separator)
+            self._encode(value, level + 1)
+        self._append(self._newline(level)[1:] + ']')
+
+    def _newline(self, level):
+        """
+        :return: The item separator for the nesting level. Without indent it's a bare comma.
+        """
+        if self._indent is None:
+            return ','
+        return ',\n' + ' ' * (self._indent * level)
+
+    @staticmethod
+    def _float(value):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return float.__repr__(value)
+
+
+def format_date(dt):
+    """
+    :param dt: A naive UTC datetime, as plistlib decodes them
+    :return: ISO 8601 with a Z suffix, 2016-10-10T15:54:24Z
+    """
+    return dt.strftime(DATE_FORMAT)
+
+
+def dumps(value, indent=None):
+    """
+    :return: The value as a JSON string, encoded by JsonWriter
+    """
+    out = io.StringIO()
+    JsonWriter(out, indent).write(value)
+    return out.getvalue()
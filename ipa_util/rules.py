@@ -0,0 +1,515 @@
+import os
+import posixpath
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ipa_util.bundle import BundleInventory
+from ipa_util.mach_o import MachO
+from ipa_util.result import ArchSlice, BinaryInfo, BundleBinary, Finding
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+class ArtifactUnavailable(Exception):
+    """
+    An artifact a rule needs couldn't be loaded. name is the artifact that failed first, which may be one the
+    requested artifact depends on.
+    """
+
+    def __init__(self, name, error) -> None:
+        super().__init__('{0}: {1}'.format(name, error))
+        self.name = name
+        self.error = error
+
+
+class _Member:
+    """
+    One binary of the bundle. It's opened and parsed once, whichever artifact reads it first, and stays open for
+    the others until Artifacts.close().
+    """
+    __slots__ = ('macho', 'lock', 'info', 'error')
+
+    def __init__(self, macho) -> None:
+        self.macho = macho
+        # MachO reads through one file object, so only one thread may use it at a time
+        self.lock = threading.Lock()
+        self.info = None
+        self.error = None
+
+
+class Artifacts:
+    """
+    The parts of a build the rules look at. Each is loaded on first use, once, and shared by every rule that needs
+    it; a failed load is remembered too, so every rule sees the same error. Loads are guarded per artifact, so rules
+    on different threads wait for each other's loads rather than repeat them.
+    """
+    # Artifacts which read every binary in the bundle, rather than a header or a small file
+    EXPENSIVE = ('bundle_binaries', 'page_hashes')
+
+    def __init__(self, unpacker, max_workers=None) -> None:
+        """
+        __init__
+        :param unpacker: Unpack instance for the .ipa, read in-archive
+        :param max_workers: Threads used to analyze the bundle's binaries
+        """
+        super().__init__()
+        self._unpacker = unpacker
+        self._max_workers = max_workers
+        self.validate = Validate(unpacker.open_ipa())
+        self._loaders = {
+            'payload': self._load_payload,
+            'app_dir': self._load_app_dir,
+            'info_plist': self._load_info_plist,
+            'profile': self._load_profile,
+            'mach_info': self._load_mach_info,
+            'bundle_binaries': self._load_bundle_binaries,
+            'page_hashes': self._load_page_hashes,
+        }
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        self._values = {}
+        self._errors = {}
+        self._hash_pool = None
+        # Path relative to the .app folder => _Member
+        self._members = {}
+        self._members_lock = threading.Lock()
+        # Names in the order they were read, including the ones that failed to load, but not the ones that
+        # failed because an artifact they depend on did
+        self.loaded = []
+
+    def get(self, name):
+        """
+        :param name: One of the artifact names
+        :return: The artifact, loading it if this is the first time it's asked for
+        :raises ArtifactUnavailable: It, or an artifact it depends on, failed to load
+        """
+        with self._locks[name]:
+            if name not in self._values and name not in self._errors:
+                try:
+                    self._values[name] = self._loaders[name]()
+                    self.loaded.append(name)
+                except ArtifactUnavailable as e:
+                    self._errors[name] = e
+                except Exception as e:
+                    self._errors[name] = ArtifactUnavailable(name, e)
+                    self.loaded.append(name)
+            if name in self._errors:
+                raise self._errors[name]
+            return self._values[name]
+
+    def close(self):
+        if self._hash_pool is not None:
+            self._hash_pool.shutdown()
+            self._hash_pool = None
+        for member in self._members.values():
+            member.macho.close()
+        self._members = {}
+
+    def _load_payload(self):
+        self.validate.check_payload()
+        return self.validate.payload_path
+
+    def _load_app_dir(self):
+        self.get('payload')
+        self.validate.check_app_dir()
+        return self.validate.app_dir
+
+    def _load_info_plist(self):
+        self.get('app_dir')
+        self.validate.check_info_plist()
+        return self.validate.extract_plist()
+
+    def _load_profile(self):
+        app_dir = self.get('app_dir')
+        if not (app_dir / 'embedded.mobileprovision').is_file():
+            raise Exception('embedded.mobileprovision file was not found in the app bundle')
+        signed_data = self._unpacker.extract_provisioning_info(app_dir)
+        return self.validate.extract_provisioning_plist(signed_data.content)
+
+    def _load_mach_info(self):
+        """
+        Headers, load commands and code signature of the main executable, for its signed entitlements. The binary
+        parsed for bundle_binaries is reused, only the signature is read.
+        """
+        self.get('info_plist')
+        if not self.validate.executable_name:
+            raise Exception('Info.plist has no CFBundleExecutable')
+        return self._signed_info(self.validate.executable_name, self.validate.executable_path)
+
+    def _load_bundle_binaries(self):
+        """
+        Headers and load commands of every binary in the bundle, the main executable included. Code signatures are
+        only located, not read.
+        :return: List of result.BundleBinary, in bundle path order
+        """
+        binaries = BundleInventory(self.get('app_dir')).find_binaries()
+        return self._map(self._bundle_binary, binaries)
+
+    def _load_page_hashes(self):
+        """
+        Every binary in the bundle with its code signature read and each code page checked against it. The binaries
+        parsed for bundle_binaries are reused, only the signatures and pages are read.
+        :return: List of result.BundleBinary whose code signatures have their contents and 'pages', in bundle path
+                 order
+        """
+        binaries = self.get('bundle_binaries')
+        self._hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return self._map(self._verified_binary, [(binary,) for binary in binaries])
+
+    def _map(self, fn, args_list):
+        """
+        Run fn over the binaries on a thread pool, as BundleInventory.analyze() does
+        """
+        if not args_list:
+            return []
+        max_workers = self._max_workers or min(BundleInventory.DEFAULT_WORKERS, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, fn, *args) for args in args_list]
+            return [future.result() for future in futures]
+
+    def _member(self, rel_name, binary_path):
+        with self._members_lock:
+            member = self._members.get(rel_name)
+            if member is None:
+                member = _Member(MachO(binary_path, posixpath.basename(rel_name)))
+                self._members[rel_name] = member
+            return member
+
+    def _binary_info(self, rel_name, binary_path):
+        """
+        :return: The result.BinaryInfo of a binary, headers and load commands, parsed on first use
+        """
+        member = self._member(rel_name, binary_path)
+        with member.lock:
+            if member.info is None and member.error is None:
+                try:
+                    member.macho.open()
+                    member.info = member.macho.get_mach_info()
+                except Exception as e:
+                    member.error = e
+                    member.macho.close()
+            if member.error is not None:
+                raise member.error
+            return member.info
+
+    def _signed_info(self, rel_name, binary_path, verify_pages=False):
+        """
+        :return: A copy of the binary's result.BinaryInfo with the contents of each slice's code signature, and with
+                 verify_pages their page hashes. The shared one is left as it is.
+        """
+        info = self._binary_info(rel_name, binary_path)
+        member = self._members[rel_name]
+        with member.lock:
+            signatures = [mach_slice.signature_info(True, verify_pages, self._hash_pool)
+                          for mach_slice in member.macho.slices()]
+        arch_slices = [self._with_signature(arch_slice, signature)
+                       for arch_slice, signature in zip(info['arch_slices'], signatures)]
+        return BinaryInfo(binary_name=info['binary_name'], binary_type=info['binary_type'], arch_slices=arch_slices)
+
+    def _bundle_binary(self, rel_name, binary_path):
+        report = BundleBinary(path=rel_name)
+        try:
+            report.binary_info = self._binary_info(rel_name, binary_path)
+            report.valid = True
+        except Exception as e:
+            report.valid = False
+            report.error = str(e)
+        return report
+
+    def _verified_binary(self, binary):
+        """
+        :param binary: One of the bundle_binaries
+        :return: A copy of it with the code signature and page hashes of each signed slice
+        """
+        if not binary['valid']:
+            return binary
+        report = BundleBinary(path=binary['path'])
+        try:
+            report.binary_info = self._signed_info(binary['path'], None, True)
+            report.valid = True
+        except Exception as e:
+            report.valid = False
+            report.error = str(e)
+        return report
+
+    @staticmethod
+    def _with_signature(arch_slice, signature):
+        """
+        :return: A copy of a result.ArchSlice with another code signature, the shared one is left as it is
+        """
+        if signature is None:
+            return arch_slice
+        fields = {attr: getattr(arch_slice, attr) for attr in ArchSlice.__slots__ if hasattr(arch_slice, attr)}
+        fields['code_signature'] = signature
+        return ArchSlice(**fields)
+
+
+class _Rule:
+    """
+    One of the requirements in the Validate docstring. The artifacts in REQUIRES are loaded before check() runs;
+    anything check() raises is reported as an error.
+    """
+    ID = None
+    SEVERITY = 'error'
+    REQUIRES = ()
+    # The artifact this rule answers for: if it can't be loaded that's this rule's error, and the rules which
+    # merely need it are skipped
+    PROVIDES = None
+
+    def check(self, artifacts):
+        """
+        :param artifacts: The shared Artifacts
+        :return: Iterable of Finding
+        """
+        return ()
+
+    def finding(self, message, path=None, severity=None):
+        return Finding(rule=self.ID, severity=severity or self.SEVERITY, path=path, message=message)
+
+    @classmethod
+    def is_expensive(cls):
+        return any(name in Artifacts.EXPENSIVE for name in cls.REQUIRES)
+
+
+class _PayloadRule(_Rule):
+    ID = 'req-001'
+    REQUIRES = ('payload',)
+    PROVIDES = 'payload'
+
+
+class _AppDirRule(_Rule):
+    ID = 'req-002'
+    REQUIRES = ('app_dir',)
+    PROVIDES = 'app_dir'
+
+
+class _InfoPlistRule(_Rule):
+    ID = 'req-003'
+    REQUIRES = ('info_plist',)
+    PROVIDES = 'info_plist'
+
+
+class _AppIdPrefixRule(_Rule):
+    ID = 'req-004'
+    REQUIRES = ('profile',)
+    PROVIDES = 'profile'
+
+    def check(self, artifacts):
+        artifacts.validate.check_app_id_prefix(artifacts.get('profile'))
+        return ()
+
+
+class _ExpirationRule(_Rule):
+    ID = 'req-005'
+    SEVERITY = 'warning'
+    REQUIRES = ('profile',)
+
+    def check(self, artifacts):
+        warning = artifacts.validate.check_expiration(artifacts.get('profile'))
+        return [self.finding(warning)] if warning is not None else ()
+
+
+class _AppIdRule(_Rule):
+    ID = 'req-006'
+    REQUIRES = ('info_plist', 'profile')
+
+    def check(self, artifacts):
+        artifacts.validate.check_app_id(artifacts.get('profile'))
+        return ()
+
+
+class _ArchitectureRule(_Rule):
+    ID = 'req-007'
+    REQUIRES = ('bundle_binaries',)
+    PROVIDES = 'bundle_binaries'
+
+    def check(self, artifacts):
+        findings = []
+        for binary in artifacts.get('bundle_binaries'):
+            try:
+                if binary.get('error') is not None:
+                    raise Exception(binary['error'])
+                artifacts.validate.check_architectures(binary['binary_info'])
+            except Exception as e:
+                findings.append(self.finding(str(e), binary['path']))
+        return findings
+
+
+class _CodeSignatureRule(_Rule):
+    ID = 'req-008'
+    REQUIRES = ('page_hashes',)
+    PROVIDES = 'page_hashes'
+
+    def check(self, artifacts):
+        findings = []
+        for binary in artifacts.get('page_hashes'):
+            try:
+                if binary.get('error') is not None:
+                    raise Exception(binary['error'])
+                for warning in artifacts.validate.check_code_signature(binary['binary_info']):
+                    findings.append(self.finding(warning, binary['path'], 'warning'))
+            except Exception as e:
+                findings.append(self.finding(str(e), binary['path']))
+        return findings
+
+
+class _EntitlementsRule(_Rule):
+    ID = 'req-009'
+    REQUIRES = ('profile', 'mach_info')
+    PROVIDES = 'mach_info'
+
+    def check(self, artifacts):
+        artifacts.validate.check_entitlements(artifacts.get('profile'), artifacts.get('mach_info'))
+        return ()
+
+
+RULES = {rule.ID: rule for rule in (_PayloadRule, _AppDirRule, _InfoPlistRule, _AppIdPrefixRule, _ExpirationRule,
+                                    _AppIdRule, _ArchitectureRule, _CodeSignatureRule, _EntitlementsRule)}
+
+
+class RuleEngine:
+    """
+    Checks a build against the rules in RULES and reports every error and warning, rather than stopping at the
+    first like the analysis pipeline does.
+
+    Each rule declares the artifacts it needs (Info.plist, the provisioning profile, Mach-O headers, page hashes),
+    which are loaded lazily and shared, see Artifacts. The rules run concurrently, each starting as soon as a worker
+    is free and blocking only on the artifacts it needs. With fail_fast the rules needing none of the EXPENSIVE
+    artifacts run first, nothing more is started after the first error, and the expensive artifacts are only loaded
+    if every cheap rule passed.
+    """
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, src_path, rules=None, fail_fast=False, max_workers=None) -> None:
+        """
+        __init__
+        :param src_path: Path or URL of the .ipa file, or a source.ByteSource
+        :param rules: Ids of the rules to check, from RULES. All of them by default.
+        :param fail_fast: Stop at the first error
+        :param max_workers: Threads the rules run on, also used to analyze the bundle's binaries
+        """
+        super().__init__()
+        self._src_path = src_path
+        self._rules = [RULES[rule_id]() for rule_id in sorted(rules or RULES)]
+        self._fail_fast = fail_fast
+        self._max_workers = max_workers or min(RuleEngine.DEFAULT_WORKERS, os.cpu_count() or 1)
+
+    def run(self):
+        """
+        :return: {'valid': ..., 'error_count': ..., 'warning_count': ..., 'findings': [...], 'skipped': [...],
+                  'artifacts': [...]}, findings in rule order
+        """
+        src = None
+        unpacker = None
+        artifacts = None
+        findings = []
+        try:
+            try:
+                src = open_source(self._src_path)
+                unpacker = Unpack(src, None)
+                artifacts = Artifacts(unpacker, self._max_workers)
+            except Exception as e:
+                # Not a zip, a truncated archive, an unreachable URL: there's no Payload to find, whichever rules
+                # were asked for
+                findings.append(Finding(rule=_PayloadRule.ID, severity='error',
+                                        message='Could not open the .ipa: {0}'.format(e)))
+                results = {rule.ID: [] if rule.ID == _PayloadRule.ID else 'needs the .ipa' for rule in self._rules}
+            else:
+                results = self._run_rules(artifacts)
+        finally:
+            if artifacts is not None:
+                artifacts.close()
+            if unpacker is not None:
+                unpacker.close_ipa()
+            if src is not None and src is not self._src_path:
+                src.close()
+        skipped = []
+        for rule in self._rules:
+            result = results.get(rule.ID)
+            if result is None:
+                skipped.append({'rule': rule.ID, 'reason': 'fail-fast'})
+            elif isinstance(result, str):
+                skipped.append({'rule': rule.ID, 'reason': result})
+            else:
+                findings.extend(result)
+        val_obj = {}
+        val_obj['error_count'] = sum(1 for f in findings if f.severity == 'error')
+        val_obj['warning_count'] = len(findings) - val_obj['error_count']
+        val_obj['valid'] = val_obj['error_count'] == 0
+        val_obj['findings'] = findings
+        val_obj['skipped'] = skipped
+        val_obj['artifacts'] = list(artifacts.loaded) if artifacts is not None else []
+        return val_obj
+
+    def _run_rules(self, artifacts):
+        """
+        :return: Dict of rule id => list of Finding, or the reason the rule was skipped. Rules fail-fast never
+                 started are missing.
+        """
+        if self._fail_fast:
+            tiers = [[rule for rule in self._rules if not rule.is_expensive()],
+                     [rule for rule in self._rules if rule.is_expensive()]]
+        else:
+            tiers = [self._rules]
+        owners = {rule.PROVIDES for rule in self._rules if rule.PROVIDES is not None}
+        results = {}
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            for tier in tiers:
+                # Each rule runs in a copy of our context, as BundleInventory does, so metrics land in the current stage
+                futures = {pool.submit(contextvars.copy_context().run, self._run_rule, rule, artifacts, owners): rule
+                           for rule in tier}
+                failed = False
+                while futures:
+                    done, pending = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rule = futures.pop(future)
+                        results[rule.ID] = future.result()
+                        failed = failed or self._has_error(results[rule.ID])
+                    if failed and self._fail_fast:
+                        # Rules already running finish, the rest never start
+                        for future in pending:
+                            if future.cancel():
+                                futures.pop(future)
+                if failed and self._fail_fast:
+                    break
+        return results
+
+    @staticmethod
+    def _run_rule(rule, artifacts, owners):
+        """
+        :param owners: Artifacts some running rule answers for
+        :return: List of Finding, or the reason the rule was skipped
+        """
+        try:
+            for name in rule.REQUIRES:
+                artifacts.get(name)
+        except ArtifactUnavailable as e:
+            if e.name == rule.PROVIDES:
+                return [rule.finding(str(e.error))]
+            if e.name in owners:
+                return 'needs {0}'.format(e)
+            return [rule.finding('Could not load {0}'.format(e))]
+        try:
+            return list(rule.check(artifacts))
+        except Exception as e:
+            return [rule.finding(str(e))]
+
+    @staticmethod
+    def _has_error(result):
+        return not isinstance(result, str) and any(f.severity == 'error' for f in result)
+
+    @staticmethod
+    def format_report(report):
+        """
+        :return: The report as text, one line per finding
+        """
+        lines = []
+        for finding in report['findings']:
+            path = ' {0}:'.format(finding['path']) if 'path' in finding else ''
+            lines.append('{0:<8} {1}{2} {3}'.format(finding['severity'], finding['rule'], path, finding['message']))
+        for skipped in report['skipped']:
+            lines.append('{0:<8} {1} {2}'.format('skipped', skipped['rule'], skipped['reason']))
+        lines.append('{0} errors, {1} warnings. Loaded: {2}'.format(
+            report['error_count'], report['warning_count'], ', '.join(report['artifacts']) or 'nothing'))
+        return '\n'.join(lines)
@@ -0,0 +1,419 @@
+import io
+import os
+import json
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from ipa_util.batch import analyze_one
+from ipa_util.cache import ResultCache
+from ipa_util.metrics import MetricsRecorder
+from ipa_util.result import dumps
+
+
+def _warm_worker():
+    """
+    Run once in each pool process so the first real request doesn't pay for process start up
+    """
+    return os.getpid()
+
+
+def analyze_upload(data, name, in_archive=True, cache_path=None, cache_max_bytes=ResultCache.DEFAULT_MAX_BYTES,
+                   metrics=False, trace_memory=True):
+    """
+    Worker entry point for .ipa bytes posted to the service
+    :param data: The .ipa file contents
+    :param name: Name to report the upload under
+    :return: A JSON serializable record, see batch.analyze_one()
+    """
+    src = io.BytesIO(data)
+    # ZipFile takes its filename from here, which the pipeline uses in its messages
+    src.name = name
+    return analyze_one(src, in_archive, cache_path, cache_max_bytes, metrics, trace_memory)
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisService:
+    """
+    Long running analysis daemon. Speaks a minimal HTTP/1.1 over TCP or a Unix socket and hands the work to a
+    pre-warmed process pool running the usual pipeline, so a request doesn't pay for interpreter start up, imports
+    or an openssl spawn.
+
+    POST /analyze   The raw .ipa as application/octet-stream, or a JSON body {"path": "..."} naming a local path
+                    or URL. The JSON form is off unless the service is given the local folders (source_roots) or
+                    URL schemes (source_schemes) it may read from, so callers can't have it open arbitrary files
+                    or fetch arbitrary URLs.
+    GET  /health    Liveness and load
+    GET  /metrics   Prometheus text format counters, including per-stage time and I/O totals
+    """
+    DEFAULT_TIMEOUT = 60.0
+    # Uploads bigger than this are spooled to a temp file and passed to the worker by path
+    SPOOL_THRESHOLD = 64 * 1024 * 1024
+    MAX_UPLOAD = 8 * 1024 * 1024 * 1024
+    MAX_HEADER_LINES = 100
+    READ_CHUNK = 1024 * 1024
+    STATUS_TEXT = {
+        200: 'OK',
+        400: 'Bad Request',
+        403: 'Forbidden',
+        404: 'Not Found',
+        405: 'Method Not Allowed',
+        408: 'Request Timeout',
+        411: 'Length Required',
+        413: 'Payload Too Large',
+        422: 'Unprocessable Entity',
+        431: 'Request Header Fields Too Large',
+        503: 'Service Unavailable',
+        504: 'Gateway Timeout',
+    }
+
+    def __init__(self, workers=None, max_concurrency=None, max_queue=None, timeout=DEFAULT_TIMEOUT, in_archive=True,
+                 cache_path=None, cache_max_bytes=ResultCache.DEFAULT_MAX_BYTES, metrics=True, source_roots=(),
+                 source_schemes=()) -> None:
+        """
+        __init__
+        :param workers: Number of pool processes, defaults to the CPU count
+        :param max_concurrency: Analyses dispatched to the pool at once, defaults to the worker count
+        :param max_queue: Requests allowed to wait for a slot. Anything beyond that is turned away with a 503.
+        :param timeout: Per request timeout in seconds, for reading the body and again for the analysis
+        :param in_archive: Analyze in-archive (the default) rather than unpacking to a temp folder
+        :param cache_path: Optional path to a ResultCache database
+        :param cache_max_bytes: Size limit for the cache
+        :param metrics: Instrument each analysis (without tracemalloc) and export the stage totals on /metrics
+        :param source_roots: Folders a {"path": ...} request may read .ipa files from
+        :param source_schemes: URL schemes ('http', 'https') a {"path": ...} request may fetch from
+        """
+        super().__init__()
+        self._workers = workers or os.cpu_count() or 1
+        self._max_concurrency = max_concurrency or self._workers
+        self._max_queue = max_queue if max_queue is not None else self._max_concurrency * 4
+        self._timeout = timeout
+        self._in_archive = in_archive
+        self._cache_path = cache_path
+        self._cache_max_bytes = cache_max_bytes
+        self._metrics = metrics
+        self._source_roots = [os.path.realpath(root) for root in source_roots]
+        self._source_schemes = tuple(source_schemes)
+        self._pool = None
+        self._slots = None
+        self._servers = []
+        self._waiting = 0
+        self._in_flight = 0
+        self._started = None
+        self._counters = {}
+        self._request_seconds = 0.0
+
+    async def start(self, host=None, port=None, unix_path=None):
+        """
+        Start the pool and begin listening
+        :param host: TCP host to bind
+        :param port: TCP port to bind
+        :param unix_path: Path of a Unix socket to listen on, instead of or as well as TCP
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        # Workers are started lazily, one ping per worker brings them all up now
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _warm_worker) for i in range(self._workers)])
+        self._slots = asyncio.Semaphore(self._max_concurrency)
+        self._started = time.time()
+        if port is not None:
+            self._servers.append(await asyncio.start_server(self._handle_connection, host, port))
+        if unix_path is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle_connection, unix_path))
+        if not self._servers:
+            raise Exception('Nothing to listen on, give a port or a unix socket path')
+
+    async def serve_forever(self):
+        try:
+            await asyncio.gather(*[server.serve_forever() for server in self._servers])
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def run(self, host=None, port=None, unix_path=None):
+        """
+        Blocking entry point
+        """
+        async def _main():
+            await self.start(host, port, unix_path)
+            print('vipa service listening on {0}'.format(', '.join(self._addresses())))
+            await self.serve_forever()
+        try:
+            asyncio.run(_main())
+        except KeyboardInterrupt:
+            pass
+
+    def _addresses(self):
+        addresses = []
+        for server in self._servers:
+            for sock in server.sockets:
+                name = sock.getsockname()
+                addresses.append(name if isinstance(name, str) else '{0}:{1}'.format(name[0], name[1]))
+        return addresses
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Serve requests on one connection until the client closes it or asks us to
+        """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except _HttpError as e:
+                    await self._respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                start = time.perf_counter()
+                try:
+                    status, body = await self._dispatch(method, path, headers, reader)
+                except _HttpError as e:
+                    status, body = e.status, {'error': str(e)}
+                    # The body may not have been consumed, the connection can't be reused
+                    keep_alive = False
+                self._request_seconds += time.perf_counter() - start
+                self._count('vipa_requests_total{{status="{0}"}}'.format(status))
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """
+        :return: Tuple of method, path, headers (lower cased names), or None at end of stream
+        """
+        line = await self._readline(reader, 400, 'Request line is too long')
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise _HttpError(400, 'Malformed request line')
+        headers = {}
+        for i in range(AnalysisService.MAX_HEADER_LINES):
+            line = await self._readline(reader, 431, 'Header line is too long')
+            if line in (b'\r\n', b'\n', b''):
+                return parts[0], parts[1], headers
+            name, sep, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise _HttpError(431, 'Too many headers')
+
+    @staticmethod
+    async def _readline(reader, status, message):
+        """
+        readline(), turning a line longer than the stream's limit into an error response
+        """
+        try:
+            return await reader.readline()
+        except ValueError:
+            # asyncio.LimitOverrunError, re-raised as a ValueError by readline()
+            raise _HttpError(status, message)
+
+    async def _receive(self, aw):
+        """
+        Read the request body, or part of it, within the request timeout, so a slow client can't hold on to a
+        connection or a spool file
+        """
+        try:
+            return await asyncio.wait_for(aw, self._timeout)
+        except asyncio.TimeoutError:
+            self._count('vipa_timeouts_total')
+            raise _HttpError(408, 'Timed out reading the request body')
+
+    async def _dispatch(self, method, path, headers, reader):
+        """
+        Route a request
+        :return: Tuple of status, body (a JSON serializable object, or str for plain text)
+        """
+        if path == '/health':
+            return 200, self._health()
+        if path == '/metrics':
+            return 200, self._metrics_text()
+        if path != '/analyze':
+            raise _HttpError(404, 'Unknown path {0}'.format(path))
+        if method != 'POST':
+            raise _HttpError(405, 'Use POST to analyze')
+        if 'content-length' not in headers:
+            raise _HttpError(411, 'Content-Length is required')
+        raw_length = headers['content-length']
+        # int() alone would take ' -5', '1_000' and non-ASCII digits
+        if not (raw_length.isascii() and raw_length.isdecimal()):
+            raise _HttpError(400, 'Content-Length must be a non-negative number of bytes')
+        length = int(raw_length)
+        if length > AnalysisService.MAX_UPLOAD:
+            raise _HttpError(413, 'Upload is larger than {0} bytes'.format(AnalysisService.MAX_UPLOAD))
+        # Backpressure: refuse before reading the body when too many requests are already waiting
+        if self._waiting >= self._max_queue:
+            self._count('vipa_rejected_total')
+            raise _HttpError(503, 'Too many requests waiting, try again later')
+        content_type = headers.get('content-type', '').split(';')[0].strip()
+        on_done = None
+        if content_type == 'application/json':
+            try:
+                params = json.loads(await self._receive(reader.readexactly(length)))
+                src = params['path']
+            except (ValueError, KeyError, TypeError):
+                raise _HttpError(400, 'Expected a JSON object with a "path"')
+            args = (analyze_one, self._check_source(src), self._in_archive)
+        elif length > AnalysisService.SPOOL_THRESHOLD:
+            # Cancelling _spool() on a timeout deletes the partial file
+            spool_path = await self._receive(self._spool(reader, length))
+            args = (analyze_one, spool_path, self._in_archive)
+            # A timed out job keeps reading the spool in the worker, it's only deleted once the job is done
+            on_done = lambda: os.unlink(spool_path)
+        else:
+            data = await self._receive(reader.readexactly(length))
+            args = (analyze_upload, data, '<upload>', self._in_archive)
+        record = await self._run_in_pool(args + (self._cache_path, self._cache_max_bytes, self._metrics, False), on_done)
+        if 'metrics' in record:
+            self._count_stages(record['metrics'])
+        if 'error' in record:
+            return 422, record
+        return 200, record
+
+    def _check_source(self, src):
+        """
+        Only let a {"path": ...} request at the folders and URL schemes the service was started with
+        :return: The source to analyze
+        """
+        if not isinstance(src, str) or not src:
+            raise _HttpError(400, 'Expected "path" to be a path or URL')
+        if not self._source_roots and not self._source_schemes:
+            raise _HttpError(403, 'Analyzing by path or URL is disabled, upload the .ipa instead')
+        # The URLs open_source() fetches, anything else is a local path
+        scheme = src.split('://', 1)[0] if src.startswith(('http://', 'https://')) else None
+        if scheme is not None:
+            if scheme not in self._source_schemes:
+                raise _HttpError(403, '{0} URLs are not allowed'.format(scheme))
+            return src
+        # realpath() so neither .. nor a symlink can lead outside the allowed folders
+        real_path = os.path.realpath(src)
+        for root in self._source_roots:
+            if os.path.commonpath([root, real_path]) == root:
+                return real_path
+        raise _HttpError(403, 'Path is outside the allowed folders')
+
+    async def _spool(self, reader, length):
+        """
+        Copy a large upload to a temp file
+        :return: Path of the temp file, the caller deletes it
+        """
+        fd, spool_path = tempfile.mkstemp(prefix='vipa_upload_', suffix='.ipa')
+        try:
+            with os.fdopen(fd, 'wb') as spool_fp:
+                left = length
+                while left > 0:
+                    chunk = await reader.readexactly(min(left, AnalysisService.READ_CHUNK))
+                    spool_fp.write(chunk)
+                    left -= len(chunk)
+        except BaseException:
+            os.unlink(spool_path)
+            raise
+        return spool_path
+
+    async def _run_in_pool(self, args, on_done=None):
+        """
+        Wait for a free slot, run the job in the pool and enforce the request timeout.
+        A timed out job can't be interrupted in the worker, so its slot is only given back once it really finishes.
+        :param on_done: Called once the job has finished in the worker, or as soon as it's clear it never will run
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout
+        self._waiting += 1
+        acquired = False
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._timeout)
+            acquired = True
+        except asyncio.TimeoutError:
+            self._count('vipa_timeouts_total')
+            raise _HttpError(504, 'Timed out waiting for a worker')
+        finally:
+            self._waiting -= 1
+            if not acquired and on_done is not None:
+                on_done()
+        self._in_flight += 1
+        try:
+            future = loop.run_in_executor(self._pool, *args)
+        except BaseException:
+            self._in_flight -= 1
+            self._slots.release()
+            if on_done is not None:
+                on_done()
+            raise
+
+        def _release(f):
+            self._in_flight -= 1
+            self._slots.release()
+            if on_done is not None:
+                on_done()
+        future.add_done_callback(_release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self._count('vipa_timeouts_total')
+            raise _HttpError(504, 'Analysis timed out after {0} seconds'.format(self._timeout))
+
+    def _health(self):
+        health = {}
+        health['status'] = 'ok'
+        health['uptime_seconds'] = round(time.time() - self._started, 3)
+        health['workers'] = self._workers
+        health['in_flight'] = self._in_flight
+        health['waiting'] = self._waiting
+        return health
+
+    def _count(self, name, value=1):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def _count_stages(self, run_metrics):
+        """
+        Fold the metrics of one analysis into the per-stage counters
+        """
+        for stage_name, entry in run_metrics['stages'].items():
+            self._count('vipa_stage_calls_total{{stage="{0}"}}'.format(stage_name), entry['calls'])
+            self._count('vipa_stage_seconds_total{{stage="{0}"}}'.format(stage_name), entry['wall_seconds'])
+            self._count('vipa_stage_cpu_seconds_total{{stage="{0}"}}'.format(stage_name), entry['cpu_seconds'])
+            for name in MetricsRecorder.COUNTERS:
+                self._count('vipa_stage_{0}_total{{stage="{1}"}}'.format(name, stage_name), entry[name])
+
+    def _metrics_text(self):
+        lines = []
+        lines.append('vipa_workers {0}'.format(self._workers))
+        lines.append('vipa_in_flight {0}'.format(self._in_flight))
+        lines.append('vipa_waiting {0}'.format(self._waiting))
+        lines.append('vipa_request_seconds_total {0:.6f}'.format(self._request_seconds))
+        for name in sorted(self._counters):
+            lines.append('{0} {1}'.format(name, self._counters[name]))
+        return '\n'.join(lines) + '\n'
+
+    async def _respond(self, writer, status, body, keep_alive):
+        if isinstance(body, str):
+            payload = body.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            payload = dumps(body).encode('utf-8')
+            content_type = 'application/json'
+        head = 'HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\nConnection: {4}\r\n\r\n'.format(
+            status, AnalysisService.STATUS_TEXT.get(status, ''), content_type, len(payload),
+            'keep-alive' if keep_alive else 'close')
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
@@ -0,0 +1,226 @@
+import posixpath
+import zipfile
+
+from ipa_util.bundle import BundleInventory
+from ipa_util.mach_o import MachO
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+class _SizeNode:
+    """
+    A folder or file in the size tree
+    """
+    __slots__ = ('name', 'size', 'compressed_size', 'file_count', 'children')
+
+    def __init__(self, name) -> None:
+        self.name = name
+        self.size = 0
+        self.compressed_size = 0
+        self.file_count = 0
+        self.children = None
+
+    def child(self, name):
+        if self.children is None:
+            self.children = {}
+        node = self.children.get(name)
+        if node is None:
+            node = _SizeNode(name)
+            self.children[name] = node
+        return node
+
+    def dump_info(self, depth):
+        """
+        :param depth: Levels of children to include, None for all of them
+        :return: A python value object, children largest first
+        """
+        val_obj = {}
+        val_obj['name'] = self.name
+        val_obj['size'] = self.size
+        val_obj['compressed_size'] = self.compressed_size
+        val_obj['file_count'] = self.file_count
+        if self.children is not None and (depth is None or depth > 0):
+            children = sorted(self.children.values(), key=lambda node: (-node.size, node.name))
+            val_obj['children'] = [node.dump_info(None if depth is None else depth - 1) for node in children]
+        return val_obj
+
+
+class SizeReport:
+    """
+    Breaks the size of a build down by folder, by category (assets, frameworks, localizations, the executable...)
+    and by file type, with compressed and uncompressed figures.
+    Everything comes from the zip central directory in one pass over the entries. The only member data read is
+    Info.plist, to find the executable, the first bytes of the files which could be binaries by their name (see
+    likely_binary()), to find the Mach-Os among them the way BundleInventory does, and the headers of those for
+    their architecture slices.
+    """
+    # Checked in order, the first match wins
+    CATEGORIES = ('executable', 'frameworks', 'plugins', 'localizations', 'signature', 'assets', 'other', 'outside_app')
+    ASSET_EXTENSIONS = ('.car', '.png', '.jpg', '.jpeg', '.gif', '.heic', '.webp', '.pdf', '.svg', '.mp3', '.m4a',
+                        '.wav', '.caf', '.aiff', '.mp4', '.mov', '.m4v', '.ttf', '.otf', '.ttc', '.nib', '.storyboardc',
+                        '.scnassets', '.bundle')
+    SIGNATURE_FILES = ('embedded.mobileprovision', '_CodeSignature')
+    # Folders of the .app whose direct children are sniffed whatever their name: loose dylibs, .framework, .appex
+    BINARY_FOLDERS = ('Frameworks', 'PlugIns')
+
+    def __init__(self, src_path, depth=None) -> None:
+        """
+        __init__
+        :param src_path: Path or URL of the .ipa file, or a source.ByteSource
+        :param depth: Levels of the folder tree to include in the report, None for the whole tree
+        """
+        super().__init__()
+        self._src_path = src_path
+        self._depth = depth
+
+    def report(self):
+        """
+        :return: {'total': ..., 'categories': ..., 'file_types': ..., 'binaries': ..., 'tree': ...}
+        """
+        src = open_source(self._src_path)
+        unpacker = Unpack(src, None)
+        try:
+            validate = Validate(unpacker.open_ipa())
+            validate.validate_structure()
+            validate.extract_plist()
+            prefix = validate.app_dir.at
+            executable = prefix + validate.executable_name if validate.executable_name else None
+            # Frameworks, app extensions, loose dylibs: the likely binaries which sniff as a Mach-O, the executable
+            # included
+            inventory = BundleInventory(validate.app_dir)
+            binary_names = {prefix + rel_name for rel_name, path in inventory.find_binaries(
+                lambda rel_name: self.likely_binary(rel_name, validate.executable_name))}
+            root = _SizeNode(posixpath.basename(getattr(src, 'name', str(self._src_path))))
+            categories = {name: _SizeNode(name) for name in SizeReport.CATEGORIES}
+            file_types = {}
+            binaries = []
+            for info in unpacker.ipa_zip.infolist():
+                if info.is_dir():
+                    continue
+                parts = info.filename.split('/')
+                node = root
+                self._add(node, info)
+                for part in parts:
+                    node = node.child(part)
+                    self._add(node, info)
+                self._add(categories[self.category(info.filename, prefix, executable)], info)
+                ext = posixpath.splitext(parts[-1])[1].lower() or '(none)'
+                if ext not in file_types:
+                    file_types[ext] = _SizeNode(ext)
+                self._add(file_types[ext], info)
+                if info.filename == executable or info.filename in binary_names:
+                    binaries.append(info)
+            val_obj = {}
+            val_obj['total'] = {'size': root.size, 'compressed_size': root.compressed_size, 'file_count': root.file_count}
+            val_obj['categories'] = {name: self._totals(node) for name, node in categories.items() if node.file_count}
+            val_obj['file_types'] = {node.name: self._totals(node)
+                                     for node in sorted(file_types.values(), key=lambda n: (-n.size, n.name))}
+            val_obj['binaries'] = [self._binary_info(unpacker.ipa_zip, info, prefix) for info in binaries]
+            val_obj['tree'] = root.dump_info(self._depth)
+            return val_obj
+        finally:
+            unpacker.close_ipa()
+            if src is not self._src_path:
+                src.close()
+
+    @staticmethod
+    def category(filename, prefix, executable):
+        """
+        :param filename: Member name
+        :param prefix: Member name prefix of the .app folder
+        :param executable: Member name of the main executable
+        :return: One of CATEGORIES
+        """
+        if filename == executable:
+            return 'executable'
+        if not filename.startswith(prefix):
+            return 'outside_app'
+        parts = filename[len(prefix):].split('/')
+        if parts[0] == 'Frameworks':
+            return 'frameworks'
+        if parts[0] in ('PlugIns', 'Extensions', 'Watch', 'AppClips'):
+            return 'plugins'
+        if any(part.endswith('.lproj') for part in parts[:-1]):
+            return 'localizations'
+        if parts[0] in SizeReport.SIGNATURE_FILES:
+            return 'signature'
+        if any(posixpath.splitext(part)[1].lower() in SizeReport.ASSET_EXTENSIONS for part in parts):
+            return 'assets'
+        return 'other'
+
+    @staticmethod
+    def likely_binary(rel_name, executable_name):
+        """
+        Bundle executables have no extension (Info.plist names them, Foo.framework/Foo, Bar.appex/Bar) and
+        libraries end in .dylib, so only those and what sits right in BINARY_FOLDERS need sniffing
+        :param rel_name: Path relative to the .app folder
+        :param executable_name: CFBundleExecutable of the app
+        :return: True if the file could be a Mach-O
+        """
+        parts = rel_name.split('/')
+        if rel_name == executable_name:
+            return True
+        if parts[0] in SizeReport.SIGNATURE_FILES:
+            return False
+        ext = posixpath.splitext(parts[-1])[1].lower()
+        return not ext or ext == '.dylib' or (len(parts) == 2 and parts[0] in SizeReport.BINARY_FOLDERS)
+
+    @staticmethod
+    def _binary_info(ipa_zip, info, prefix):
+        """
+        Sizes of a binary and of each of its architecture slices. Only the fat header is decompressed.
+        """
+        val_obj = {}
+        val_obj['path'] = info.filename[len(prefix):]
+        val_obj['size'] = info.file_size
+        val_obj['compressed_size'] = info.compress_size
+        macho = MachO(zipfile.Path(ipa_zip, info.filename), posixpath.basename(info.filename))
+        try:
+            val_obj['slices'] = [{'cpu_type': s.cpu_type, 'cpu_subtype': s.cpu_subtype, 'offset': s.offset,
+                                  'size': s.size} for s in macho.slices()]
+        except Exception as e:
+            val_obj['slices'] = []
+            val_obj['error'] = str(e)
+        finally:
+            macho.close()
+        return val_obj
+
+    @staticmethod
+    def _add(node, info):
+        node.size += info.file_size
+        node.compressed_size += info.compress_size
+        node.file_count += 1
+
+    @staticmethod
+    def _totals(node):
+        return {'size': node.size, 'compressed_size': node.compressed_size, 'file_count': node.file_count}
+
+    @staticmethod
+    def format_report(report):
+        """
+        :return: The report as text: the totals, categories, the 10 largest file types, slices and the folder tree
+        """
+        lines = []
+        total = report['total']
+        lines.append('{0:>12} {1:>12}  {2}'.format('size', 'compressed', 'files'))
+        lines.append('{0:>12} {1:>12}  {2} files in total'.format(total['size'], total['compressed_size'], total['file_count']))
+        lines.append('')
+        for name, totals in sorted(report['categories'].items(), key=lambda item: -item[1]['size']):
+            lines.append('{0:>12} {1:>12}  {2} ({3} files)'.format(totals['size'], totals['compressed_size'], name, totals['file_count']))
+        lines.append('')
+        for ext, totals in list(report['file_types'].items())[:10]:
+            lines.append('{0:>12} {1:>12}  {2} ({3} files)'.format(totals['size'], totals['compressed_size'], ext, totals['file_count']))
+        for binary in report['binaries']:
+            lines.append('')
+            lines.append('{0:>12} {1:>12}  {2}'.format(binary['size'], binary['compressed_size'], binary['path']))
+            for s in binary['slices']:
+                lines.append('{0:>12} {1:>12}    {2} {3}'.format(s['size'], '', s['cpu_type'], s['cpu_subtype']).rstrip())
+        lines.append('')
+
+        def walk(node, indent):
+            lines.append('{0:>12} {1:>12}  {2}{3}'.format(node['size'], node['compressed_size'], '  ' * indent, node['name']))
+            for child in node.get('children', ()):
+                walk(child, indent + 1)
+        walk(report['tree'], 0)
+        return '\n'.join(lines)
@@ -0,0 +1,231 @@
+import io
+import os
+import threading
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from ipa_util import metrics
+
+
+class ByteSource(io.RawIOBase):
+    """
+    Seekable, read-only byte source which ZipFile (and so Unpack) can open in place of a local path.
+    Subclasses only implement _read_range(). Reads are cut into fixed size blocks which are kept in a small LRU
+    cache, and runs of adjacent missing blocks are fetched with a single _read_range() call, so the few regions a
+    zip reader touches (end of central directory, central directory, the member headers we need) cost one
+    round trip each.
+    """
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+    DEFAULT_CACHE_BLOCKS = 256
+
+    def __init__(self, name, size, block_size=DEFAULT_BLOCK_SIZE, cache_blocks=DEFAULT_CACHE_BLOCKS) -> None:
+        """
+        __init__
+        :param name: Path or URL of the source. ZipFile picks this up as its filename.
+        :param size: Total size of the source in bytes
+        :param block_size: Granularity of fetches and of the block cache
+        :param cache_blocks: Number of blocks kept in the cache
+        """
+        super().__init__()
+        self.name = name
+        self._size = size
+        self._block_size = block_size
+        self._cache_blocks = cache_blocks
+        self._blocks = OrderedDict()
+        self._pos = 0
+        self._lock = threading.Lock()
+        self.bytes_fetched = 0
+        self.fetch_count = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError('Invalid whence: {0}'.format(whence))
+        if pos < 0:
+            raise ValueError('Negative seek position {0}'.format(pos))
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        size = min(len(b), max(0, self._size - self._pos))
+        if size == 0:
+            return 0
+        data = self.read_at(self._pos, size)
+        b[:size] = data
+        self._pos += size
+        return size
+
+    def read_at(self, offset, size):
+        """
+        Read size bytes at offset, going through the block cache
+        :return: bytes
+        """
+        bs = self._block_size
+        first = offset // bs
+        last = (offset + size - 1) // bs
+        with self._lock:
+            missing = [i for i in range(first, last + 1) if i not in self._blocks]
+            # Coalesce runs of adjacent missing blocks into one fetch each
+            run_start = None
+            for n, block in enumerate(missing):
+                if run_start is None:
+                    run_start = block
+                if n + 1 == len(missing) or missing[n + 1] != block + 1:
+                    self._fetch_blocks(run_start, block)
+                    run_start = None
+            parts = []
+            for i in range(first, last + 1):
+                self._blocks.move_to_end(i)
+                parts.append(self._blocks[i])
+            self._evict()
+        data = b''.join(parts)
+        start = offset - first * bs
+        return data[start:start + size]
+
+    def _fetch_blocks(self, first, last):
+        bs = self._block_size
+        start = first * bs
+        end = min((last + 1) * bs, self._size)
+        data = self._read_range(start, end - start)
+        if len(data) != end - start:
+            raise Exception('Short read from {0}: wanted {1} bytes at {2}, got {3}'.format(self, end - start, start, len(data)))
+        self.bytes_fetched += len(data)
+        self.fetch_count += 1
+        metrics.count('bytes_read', len(data))
+        for i in range(first, last + 1):
+            self._blocks[i] = data[(i - first) * bs:(i - first + 1) * bs]
+
+    def _evict(self):
+        while len(self._blocks) > self._cache_blocks:
+            self._blocks.popitem(last=False)
+
+    def _read_range(self, offset, size):
+        """
+        Fetch exactly size bytes starting at offset from the underlying storage
+        """
+        raise NotImplementedError()
+
+
+class LocalFileSource(ByteSource):
+    """
+    ByteSource over a local file. Mostly useful for its fetch counters; ZipFile can open a plain path directly.
+    """
+
+    def __init__(self, file_path, block_size=ByteSource.DEFAULT_BLOCK_SIZE, cache_blocks=ByteSource.DEFAULT_CACHE_BLOCKS) -> None:
+        self._fp = open(str(file_path), 'rb')
+        super().__init__(str(file_path), os.fstat(self._fp.fileno()).st_size, block_size, cache_blocks)
+
+    def __repr__(self):
+        return 'LocalFileSource({0!r})'.format(self.name)
+
+    def _read_range(self, offset, size):
+        return os.pread(self._fp.fileno(), size, offset)
+
+    def close(self):
+        if not self.closed:
+            self._fp.close()
+        super().close()
+
+
+class HttpRangeSource(ByteSource):
+    """
+    ByteSource backed by HTTP Range requests, so an .ipa in an artifact store can be analyzed without downloading
+    it. One persistent connection is reused for every request.
+    """
+
+    def __init__(self, url, block_size=ByteSource.DEFAULT_BLOCK_SIZE, cache_blocks=ByteSource.DEFAULT_CACHE_BLOCKS,
+                 timeout=60) -> None:
+        """
+        __init__
+        :param url: http:// or https:// URL of the .ipa file
+        :param timeout: Socket timeout for each request, in seconds
+        """
+        self._url = url
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise Exception('Unsupported URL scheme: {0}'.format(url))
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._path = parts.path or '/'
+        if parts.query:
+            self._path += '?' + parts.query
+        self._timeout = timeout
+        self._conn = None
+        # A one byte range request tells us the total size and that ranges are supported at all
+        status, headers, body = self._request(0, 1)
+        content_range = headers.get('Content-Range', '')
+        if status != 206 or '/' not in content_range:
+            raise Exception('{0} does not support range requests (status {1})'.format(url, status))
+        super().__init__(url, int(content_range.rsplit('/', 1)[1]), block_size, cache_blocks)
+
+    def __repr__(self):
+        return 'HttpRangeSource({0!r})'.format(self._url)
+
+    def _read_range(self, offset, size):
+        status, headers, body = self._request(offset, size)
+        if status != 206:
+            raise Exception('Range request for {0} failed with status {1}'.format(self._url, status))
+        return body
+
+    def _request(self, offset, size):
+        """
+        Issue a GET for [offset, offset + size), reconnecting once if the kept-alive connection has gone away
+        :return: Tuple of status, headers, body
+        """
+        headers = {'Range': 'bytes={0}-{1}'.format(offset, offset + size - 1)}
+        for attempt in range(2):
+            if self._conn is None:
+                if self._scheme == 'https':
+                    self._conn = http.client.HTTPSConnection(self._netloc, timeout=self._timeout)
+                else:
+                    self._conn = http.client.HTTPConnection(self._netloc, timeout=self._timeout)
+            try:
+                self._conn.request('GET', self._path, headers=headers)
+                resp = self._conn.getresponse()
+                body = resp.read()
+                if resp.will_close:
+                    self._close_conn()
+                return resp.status, resp.headers, body
+            except (http.client.HTTPException, ConnectionError):
+                self._close_conn()
+                if attempt == 1:
+                    raise
+
+    def _close_conn(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self):
+        self._close_conn()
+        super().close()
+
+
+def open_source(src):
+    """
+    Turn an input spec into something Unpack can open
+    :param src: A local path, an http(s) URL, or an already open ByteSource
+    :return: A path or a ByteSource
+    """
+    if isinstance(src, str) and (src.startswith('http://') or src.startswith('https://')):
+        return HttpRangeSource(src)
+    return src
@@ -0,0 +1,118 @@
+import posixpath
+
+from ipa_util.bundle import BundleInventory
+from ipa_util.mach_o import MachO
+from ipa_util.source import open_source
+from ipa_util.unpack import Unpack
+from ipa_util.validate import Validate
+
+
+class SymbolReport:
+    """
+    Linked libraries, symbols and Objective-C classes of every Mach-O in a build, per architecture slice, with any
+    denylist matches. Binaries are read in-archive, and only their load commands and symbol tables are touched.
+    """
+
+    def __init__(self, src_path, denylist=None, all_symbols=False) -> None:
+        """
+        __init__
+        :param src_path: Path or URL of the .ipa file, or a source.ByteSource
+        :param denylist: Optional SymbolDenylist
+        :param all_symbols: List every undefined and exported symbol, not just the counts
+        """
+        super().__init__()
+        self._src_path = src_path
+        self._denylist = denylist
+        self._all_symbols = all_symbols
+
+    def report(self):
+        """
+        :return: List of {'path': ..., 'slices': [...]} for every binary in the bundle, in bundle path order
+        """
+        src = open_source(self._src_path)
+        unpacker = Unpack(src, None)
+        try:
+            validate = Validate(unpacker.open_ipa())
+            validate.validate_structure()
+            binaries = BundleInventory(validate.app_dir).find_binaries()
+            return [self._binary_report(rel_name, binary_path) for rel_name, binary_path in binaries]
+        finally:
+            unpacker.close_ipa()
+            if src is not self._src_path:
+                src.close()
+
+    def _binary_report(self, rel_name, binary_path):
+        val_obj = {}
+        val_obj['path'] = rel_name
+        try:
+            with MachO(binary_path, posixpath.basename(rel_name)) as macho:
+                val_obj['slices'] = [self.slice_report(s, self._denylist, self._all_symbols) for s in macho.slices()]
+        except Exception as e:
+            val_obj['slices'] = []
+            val_obj['error'] = str(e)
+        return val_obj
+
+    @staticmethod
+    def slice_report(mach_slice, denylist=None, all_symbols=False):
+        """
+        :param mach_slice: A mach_o.MachSlice
+        :return: A python value object for the slice
+        """
+        val_obj = {}
+        val_obj['cpu_type'] = mach_slice.cpu_type
+        val_obj['cpu_subtype'] = mach_slice.cpu_subtype
+        val_obj['dylibs'] = [dylib['name'] for dylib in mach_slice.dylibs if dylib['kind'] != 'weak']
+        val_obj['weak_dylibs'] = [dylib['name'] for dylib in mach_slice.dylibs if dylib['kind'] == 'weak']
+        symbols = mach_slice.symbol_table
+        if symbols is None:
+            val_obj['symbols'] = None
+        else:
+            val_obj['symbols'] = {}
+            val_obj['symbols']['count'] = len(symbols)
+            val_obj['symbols']['undefined_count'] = len(symbols.undefined_names)
+            val_obj['symbols']['exported_count'] = len(symbols.exported_names)
+            val_obj['symbols']['objc_classes'] = symbols.objc_classes
+            val_obj['symbols']['objc_class_refs'] = symbols.objc_class_refs
+            if all_symbols:
+                val_obj['symbols']['undefined'] = symbols.undefined
+                val_obj['symbols']['exported'] = symbols.exported
+        if denylist is not None:
+            val_obj['denied'] = {}
+            val_obj['denied']['dylibs'] = denylist.match_dylibs(dylib['name'] for dylib in mach_slice.dylibs)
+            val_obj['denied']['symbols'] = denylist.match_symbols(symbols.undefined_names) if symbols is not None else []
+        return val_obj
+
+    @staticmethod
+    def denied_count(report):
+        """
+        :return: Number of denylist matches across every binary and slice of a report
+        """
+        return sum(len(s['denied']['dylibs']) + len(s['denied']['symbols'])
+                   for binary in report for s in binary['slices'] if 'denied' in s)
+
+    @staticmethod
+    def format_report(report):
+        """
+        :return: The report as text: per binary and slice, the symbol counts, weak libraries and denylist matches
+        """
+        lines = []
+        for binary in report:
+            lines.append(binary['path'])
+            if 'error' in binary:
+                lines.append('  error: {0}'.format(binary['error']))
+            for s in binary['slices']:
+                arch = '{0} {1}'.format(s['cpu_type'], s['cpu_subtype']).strip()
+                symbols = s['symbols']
+                if symbols is None:
+                    lines.append('  {0}: {1} libraries, no symbol table'.format(arch, len(s['dylibs']) + len(s['weak_dylibs'])))
+                else:
+                    lines.append('  {0}: {1} libraries, {2} symbols, {3} undefined, {4} exported, {5} ObjC classes'.format(
+                        arch, len(s['dylibs']) + len(s['weak_dylibs']), symbols['count'], symbols['undefined_count'],
+                        symbols['exported_count'], len(symbols['objc_classes'])))
+                for name in s['weak_dylibs']:
+                    lines.append('    weak: {0}'.format(name))
+                for name in s.get('denied', {}).get('dylibs', ()):
+                    lines.append('    DENIED library: {0}'.format(name))
+                for name in s.get('denied', {}).get('symbols', ()):
+                    lines.append('    DENIED symbol: {0}'.format(name))
+        return '\n'.join(lines)
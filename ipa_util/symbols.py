@@ -0,0 +1,239 @@
+import re
+import sys
+from array import array
+from operator import add
+from itertools import accumulate, repeat
+
+
+class SymbolTable:
+    """
+    The undefined (imported) and exported symbols of a Mach-O slice, from LC_SYMTAB and LC_DYSYMTAB.
+
+    Nothing is decoded one nlist entry at a time. The string table index (n_strx) of every entry is pulled out of the
+    nlist array with a strided array slice, and the n_type bytes with a strided bytes slice, both at C speed. When
+    LC_DYSYMTAB is present its ranges give the undefined and exported symbols directly, otherwise they're picked by
+    n_type. The linker writes the names of a range of symbols one after the other, so the names of a whole range
+    usually come from a single split() of the string table, checked against n_strx; anything else falls back to a
+    find() per name. Names are kept as bytes, they're only decoded to str when asked for.
+    """
+    # n_type bits
+    N_STAB = 0xe0
+    N_PEXT = 0x10
+    N_TYPE = 0x0e
+    N_EXT = 0x01
+    N_UNDF = 0x0
+    N_SECT = 0xe
+    NLIST_SIZE = 12
+    NLIST_64_SIZE = 16
+    OBJC_CLASS_PREFIX = b'_OBJC_CLASS_$_'
+    # array type code of a 4 byte unsigned int, 'I' almost everywhere
+    UINT32 = 'I' if array('I').itemsize == 4 else 'L'
+
+    def __init__(self, data, offset, endian, is_64, symtab, dysymtab=None) -> None:
+        """
+        __init__
+        :param data: The _MappedData / _StreamData the slice lives in
+        :param offset: File offset of the slice
+        :param endian: '<' or '>'
+        :param is_64: Entries are nlist_64
+        :param symtab: (symoff, nsyms, stroff, strsize) from LC_SYMTAB
+        :param dysymtab: (ilocalsym, nlocalsym, iextdefsym, nextdefsym, iundefsym, nundefsym) from LC_DYSYMTAB
+        """
+        super().__init__()
+        symoff, nsyms, stroff, strsize = symtab
+        entry_size = SymbolTable.NLIST_64_SIZE if is_64 else SymbolTable.NLIST_SIZE
+        with data.view(offset + symoff, nsyms * entry_size) as nlists:
+            nlists = bytes(nlists)
+        with data.view(offset + stroff, strsize) as strings:
+            self._strings = bytes(strings)
+        strx = array(SymbolTable.UINT32, nlists)
+        if (endian == '<') != (sys.byteorder == 'little'):
+            strx.byteswap()
+        # n_strx is the first 4 bytes of each entry, n_type the byte after it
+        self._strx = strx[::entry_size // 4]
+        self._types = nlists[4::entry_size]
+        if dysymtab is not None and dysymtab[2] + dysymtab[3] <= nsyms and dysymtab[4] + dysymtab[5] <= nsyms:
+            iextdefsym, nextdefsym, iundefsym, nundefsym = dysymtab[2:6]
+            self._exported_ix = range(iextdefsym, iextdefsym + nextdefsym)
+            self._undefined_ix = range(iundefsym, iundefsym + nundefsym)
+        else:
+            self._exported_ix = []
+            self._undefined_ix = []
+            for ix, n_type in enumerate(self._types):
+                if n_type & SymbolTable.N_STAB or not n_type & SymbolTable.N_EXT:
+                    continue
+                kind = n_type & SymbolTable.N_TYPE
+                if kind == SymbolTable.N_UNDF:
+                    self._undefined_ix.append(ix)
+                elif kind == SymbolTable.N_SECT and not n_type & SymbolTable.N_PEXT:
+                    self._exported_ix.append(ix)
+        self._undefined = None
+        self._exported = None
+
+    def __len__(self):
+        return len(self._strx)
+
+    @property
+    def undefined_names(self):
+        """
+        :return: List of the undefined symbol names as bytes, in symbol table order
+        """
+        if self._undefined is None:
+            self._undefined = self._names(self._undefined_ix)
+        return self._undefined
+
+    @property
+    def exported_names(self):
+        """
+        :return: List of the exported (external, defined) symbol names as bytes, in symbol table order
+        """
+        if self._exported is None:
+            self._exported = self._names(self._exported_ix)
+        return self._exported
+
+    @property
+    def undefined(self):
+        return [name.decode('utf-8', errors='replace') for name in self.undefined_names]
+
+    @property
+    def exported(self):
+        return [name.decode('utf-8', errors='replace') for name in self.exported_names]
+
+    @property
+    def objc_classes(self):
+        """
+        :return: Sorted names of the Objective-C classes the slice defines, from their exported _OBJC_CLASS_$_ symbols
+        """
+        return self._objc_classes(self.exported_names)
+
+    @property
+    def objc_class_refs(self):
+        """
+        :return: Sorted names of the Objective-C classes the slice uses from other images
+        """
+        return self._objc_classes(self.undefined_names)
+
+    @staticmethod
+    def _objc_classes(names):
+        prefix = SymbolTable.OBJC_CLASS_PREFIX
+        return sorted({name[len(prefix):].decode('utf-8', errors='replace')
+                       for name in names if name.startswith(prefix)})
+
+    def _names(self, indexes):
+        """
+        :param indexes: Symbol indexes, a range when they come from LC_DYSYMTAB
+        :return: Their names from the string table, as bytes
+        """
+        if isinstance(indexes, range) and len(indexes):
+            names = self._contiguous_names(indexes)
+            if names is not None:
+                return names
+        strings = self._strings
+        find = strings.find
+        strx = self._strx
+        size = len(strings)
+        names = []
+        append = names.append
+        for ix in indexes:
+            start = strx[ix]
+            if start >= size:
+                append(b'')
+                continue
+            end = find(b'\0', start)
+            append(strings[start:end] if end >= 0 else strings[start:])
+        return names
+
+    def _contiguous_names(self, indexes):
+        """
+        :return: The names of a range of symbols if they sit back to back in the string table, else None
+        """
+        strx = self._strx[indexes.start:indexes.stop]
+        first = strx[0]
+        end = self._strings.find(b'\0', strx[-1])
+        if end < 0 or first > end:
+            return None
+        names = self._strings[first:end].split(b'\0')
+        if len(names) != len(strx):
+            return None
+        # Where each name would start if they're all back to back, compared with n_strx in one go
+        starts = array(SymbolTable.UINT32, accumulate(map(add, map(len, names), repeat(1)), initial=first))
+        starts.pop()
+        return names if starts == strx else None
+
+
+class SymbolDenylist:
+    """
+    Symbol names and library paths a build mustn't use: private frameworks, banned APIs.
+
+    Entries ending in '*' match by prefix, anything else must match exactly. Entries starting with '/' or '@' are
+    install names, checked against the linked libraries; everything else is a symbol name, checked against the
+    undefined symbols. Exact entries are a set intersection and all the prefixes go into one regular expression
+    run over the names with filter(), so matching stays well under a second for millions of symbols.
+    """
+    COMMENT = '#'
+
+    def __init__(self, entries=()) -> None:
+        """
+        __init__
+        :param entries: Iterable of entries, see the class docstring
+        """
+        super().__init__()
+        self._symbols = set()
+        self._symbol_prefixes = []
+        self._dylibs = set()
+        self._dylib_prefixes = []
+        self._patterns = None
+        for entry in entries:
+            self.add(entry)
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: Text file with one entry per line. Blank lines and lines starting with '#' are skipped.
+        :return: A SymbolDenylist
+        """
+        with open(path, 'r', encoding='utf-8') as fp:
+            return SymbolDenylist(line.strip() for line in fp
+                                  if line.strip() and not line.strip().startswith(SymbolDenylist.COMMENT))
+
+    def add(self, entry):
+        is_dylib = entry.startswith('/') or entry.startswith('@')
+        raw = entry.encode('utf-8')
+        if raw.endswith(b'*'):
+            (self._dylib_prefixes if is_dylib else self._symbol_prefixes).append(raw[:-1])
+            self._patterns = None
+        else:
+            (self._dylibs if is_dylib else self._symbols).add(raw)
+
+    def __len__(self):
+        return len(self._symbols) + len(self._symbol_prefixes) + len(self._dylibs) + len(self._dylib_prefixes)
+
+    def match_symbols(self, names):
+        """
+        :param names: Symbol names as bytes, e.g. SymbolTable.undefined_names
+        :return: Sorted list of the denied names, as str
+        """
+        return self._match(names, self._symbols, self._pattern(False))
+
+    def match_dylibs(self, install_names):
+        """
+        :param install_names: Install names of the linked libraries, as str
+        :return: Sorted list of the denied ones
+        """
+        return self._match([name.encode('utf-8') for name in install_names], self._dylibs, self._pattern(True))
+
+    def _pattern(self, dylibs):
+        """
+        :return: The compiled prefix pattern for install names or symbols, None if there are no prefix entries
+        """
+        if self._patterns is None:
+            self._patterns = tuple(re.compile(b'|'.join(re.escape(prefix) for prefix in prefixes)) if prefixes else None
+                                   for prefixes in (self._symbol_prefixes, self._dylib_prefixes))
+        return self._patterns[1 if dylibs else 0]
+
+    @staticmethod
+    def _match(names, exact, pattern):
+        matched = exact.intersection(names) if exact else set()
+        if pattern is not None:
+            matched.update(filter(pattern.match, names))
+        return sorted(name.decode('utf-8', errors='replace') for name in matched)
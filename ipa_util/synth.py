@@ -0,0 +1,531 @@
+import random
+import hashlib
+import plistlib
+import zipfile
+from struct import pack
+from datetime import datetime, timedelta
+
+from ipa_util.codesign import CodeSignature
+from ipa_util.mach_o import MachO, MachSlice
+
+
+class DerWriter:
+    """
+    Just enough of a DER encoder to build certificates and a CMS signed-data blob
+    """
+
+    @staticmethod
+    def tlv(tag, content):
+        length = len(content)
+        if length < 0x80:
+            head = bytes([tag, length])
+        else:
+            raw = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+            head = bytes([tag, 0x80 | len(raw)]) + raw
+        return head + content
+
+    @staticmethod
+    def seq(*items):
+        return DerWriter.tlv(0x30, b''.join(items))
+
+    @staticmethod
+    def set(*items):
+        return DerWriter.tlv(0x31, b''.join(items))
+
+    @staticmethod
+    def context(num, content):
+        return DerWriter.tlv(0xa0 | num, content)
+
+    @staticmethod
+    def integer(value):
+        raw = value.to_bytes((value.bit_length() + 8) // 8 or 1, 'big', signed=True)
+        return DerWriter.tlv(0x02, raw)
+
+    @staticmethod
+    def oid(dotted):
+        parts = [int(p) for p in dotted.split('.')]
+        values = [parts[0] * 40 + parts[1]] + parts[2:]
+        raw = bytearray()
+        for value in values:
+            chunk = [value & 0x7f]
+            value >>= 7
+            while value:
+                chunk.append(0x80 | (value & 0x7f))
+                value >>= 7
+            raw.extend(reversed(chunk))
+        return DerWriter.tlv(0x06, bytes(raw))
+
+    @staticmethod
+    def octets(data):
+        return DerWriter.tlv(0x04, data)
+
+    @staticmethod
+    def bits(data):
+        return DerWriter.tlv(0x03, b'\0' + data)
+
+    @staticmethod
+    def utf8(text):
+        return DerWriter.tlv(0x0c, text.encode('utf-8'))
+
+    @staticmethod
+    def utc_time(dt):
+        return DerWriter.tlv(0x17, dt.strftime('%y%m%d%H%M%SZ').encode('ascii'))
+
+    @staticmethod
+    def null():
+        return b'\x05\x00'
+
+    @staticmethod
+    def name(**attrs):
+        """
+        Build an X.509 Name from short attribute names, e.g. name(CN='...', OU='...')
+        """
+        oids = {v: k for k, v in _NAME_OIDS.items()}
+        return DerWriter.seq(*[DerWriter.set(DerWriter.seq(DerWriter.oid(oids[key]), DerWriter.utf8(value)))
+                               for key, value in attrs.items()])
+
+
+# Mirrors cms.Certificate.NAME_OIDS
+_NAME_OIDS = {
+    '2.5.4.3': 'CN',
+    '2.5.4.6': 'C',
+    '2.5.4.10': 'O',
+    '2.5.4.11': 'OU',
+}
+OID_RSA = '1.2.840.113549.1.1.1'
+OID_SHA256_RSA = '1.2.840.113549.1.1.11'
+OID_SHA256 = '2.16.840.1.101.3.4.2.1'
+OID_DATA = '1.2.840.113549.1.7.1'
+OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+
+
+class SyntheticMachO:
+    """
+    Builds Mach-O files with a realistic set of load commands, for every header magic MachO understands.
+    The code itself is filler, only the headers mean anything.
+    """
+    # Layouts accepted by build(). Fat files are always big endian on disk, slices are little endian unless
+    # the layout says otherwise.
+    LAYOUTS = ('thin32', 'thin64', 'thin32_be', 'thin64_be', 'fat', 'fat64')
+    CPU_ARM = MachO.CPU_TYPE_ARM
+    CPU_ARM64 = MachO.CPU_TYPE_ARM | MachO.ARCH_64BIT_FLAG
+    SUBTYPE_ARMV7 = 9
+    SUBTYPE_ARM64_ALL = 0
+    FILETYPE_EXECUTE = 2
+    FILETYPE_DYLIB = 6
+    FAT_ALIGN = 14
+    # struct CS_CodeDirectory, version 0x20400
+    CODE_DIRECTORY = '>IIIIIIIIIBBBBIIIIQQQQ'
+    CODE_DIRECTORY_SIZE = 88
+    CODE_DIRECTORY_VERSION = 0x20400
+    HASH_TYPE_SHA256 = 2
+    PAGE_SIZE_LOG2 = 12
+    REQUIREMENT_DESIGNATED = 3
+    # Requirement expression opcode for 'identifier "..."'
+    OP_IDENT = 2
+
+    def __init__(self, rng, dylibs=(), filetype=FILETYPE_EXECUTE, install_name=None, identifier=None, team_id=None,
+                 entitlements=None, weak_dylibs=(), symbols=None) -> None:
+        """
+        __init__
+        :param rng: random.Random used for UUIDs and filler, so output is reproducible
+        :param dylibs: Install names of the libraries to link
+        :param filetype: FILETYPE_EXECUTE or FILETYPE_DYLIB
+        :param install_name: LC_ID_DYLIB name, for dylibs
+        :param identifier: Code signing identifier. Slices are only signed when this is given.
+        :param team_id: Team identifier for the code directory
+        :param entitlements: Dict of entitlements to sign into the binary
+        :param weak_dylibs: Install names of the libraries to weak link
+        :param symbols: Tuple of (undefined, exported) symbol name lists for LC_SYMTAB / LC_DYSYMTAB. No symbol table
+                        is written if not given.
+        """
+        super().__init__()
+        self._rng = rng
+        self._dylibs = list(dylibs)
+        self._filetype = filetype
+        self._install_name = install_name
+        self._identifier = identifier
+        self._team_id = team_id
+        self._entitlements = entitlements
+        self._weak_dylibs = list(weak_dylibs)
+        self._symbols = symbols
+
+    def build(self, layout, size):
+        """
+        :param layout: One of LAYOUTS
+        :param size: Approximate size of each slice in bytes
+        :return: The file contents
+        """
+        if layout == 'thin32':
+            return self.slice(self.CPU_ARM, self.SUBTYPE_ARMV7, False, '<', size)
+        if layout == 'thin64':
+            return self.slice(self.CPU_ARM64, self.SUBTYPE_ARM64_ALL, True, '<', size)
+        if layout == 'thin32_be':
+            return self.slice(self.CPU_ARM, self.SUBTYPE_ARMV7, False, '>', size)
+        if layout == 'thin64_be':
+            return self.slice(self.CPU_ARM64, self.SUBTYPE_ARM64_ALL, True, '>', size)
+        if layout in ('fat', 'fat64'):
+            slices = [(self.CPU_ARM, self.SUBTYPE_ARMV7, self.slice(self.CPU_ARM, self.SUBTYPE_ARMV7, False, '<', size)),
+                      (self.CPU_ARM64, self.SUBTYPE_ARM64_ALL, self.slice(self.CPU_ARM64, self.SUBTYPE_ARM64_ALL, True, '<', size))]
+            return self.fat(slices, layout == 'fat64')
+        raise Exception('Unknown Mach-O layout: {0}'.format(layout))
+
+    def fat(self, slices, is_64=False):
+        """
+        :param slices: List of (cputype, cpusubtype, slice bytes)
+        :param is_64: Write fat_arch_64 entries (0xcafebabf)
+        """
+        align = 1 << self.FAT_ALIGN
+        magic = MachO.FAT64_HEADER_MAGIC if is_64 else MachO.FAT_HEADER_MAGIC
+        header = pack('>II', magic, len(slices))
+        arch_size = MachO.FAT_ARCH_64_SIZE if is_64 else MachO.FAT_ARCH_SIZE
+        offset = align * ((len(header) + arch_size * len(slices) + align - 1) // align)
+        body = b''
+        for cputype, cpusubtype, data in slices:
+            if is_64:
+                header += pack('>iIQQII', cputype, cpusubtype, offset, len(data), self.FAT_ALIGN, 0)
+            else:
+                header += pack('>iIIII', cputype, cpusubtype, offset, len(data), self.FAT_ALIGN)
+            padded = data + b'\0' * (-len(data) % align)
+            body += padded
+            offset += len(padded)
+        first = align * ((len(header) + align - 1) // align)
+        return header + b'\0' * (first - len(header)) + body
+
+    def slice(self, cputype, cpusubtype, is_64, endian, size):
+        """
+        Build a single thin Mach-O
+        :param endian: '<' or '>'
+        :param size: The slice is padded to at least this many bytes
+        """
+        e = endian
+        cmds = []
+        text_size = max(0x4000, size)
+        if is_64:
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT_64, pack(e + '16sQQQQiiII', b'__PAGEZERO', 0, 0x100000000, 0, 0, 0, 0, 0, 0)))
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT_64, pack(e + '16sQQQQiiII', b'__TEXT', 0x100000000, text_size, 0, text_size, 5, 5, 0, 0)))
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT_64, pack(e + '16sQQQQiiII', b'__LINKEDIT', 0x100000000 + text_size, 0x4000, text_size, 0, 1, 1, 0, 0)))
+        else:
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT, pack(e + '16sIIIIiiII', b'__PAGEZERO', 0, 0x4000, 0, 0, 0, 0, 0, 0)))
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT, pack(e + '16sIIIIiiII', b'__TEXT', 0x4000, text_size, 0, text_size, 5, 5, 0, 0)))
+            cmds.append(self._lc(e, MachSlice.LC_SEGMENT, pack(e + '16sIIIIiiII', b'__LINKEDIT', 0x4000 + text_size, 0x4000, text_size, 0, 1, 1, 0, 0)))
+        if self._install_name is not None:
+            cmds.append(self._dylib_lc(e, MachSlice.LC_ID_DYLIB, self._install_name))
+        cmds.append(self._lc(e, MachSlice.LC_UUID, bytes(self._rng.getrandbits(8) for i in range(16))))
+        # iOS 12.0, SDK 17.0
+        cmds.append(self._lc(e, MachSlice.LC_BUILD_VERSION, pack(e + 'IIII', 2, 0x0c0000, 0x110000, 0)))
+        crypt_cmd = MachSlice.LC_ENCRYPTION_INFO_64 if is_64 else MachSlice.LC_ENCRYPTION_INFO
+        crypt_body = pack(e + 'IIII', 0x4000, 0x4000, 0, 0) if is_64 else pack(e + 'III', 0x4000, 0x4000, 0)
+        cmds.append(self._lc(e, crypt_cmd, crypt_body))
+        for dylib in self._dylibs:
+            cmds.append(self._dylib_lc(e, MachSlice.LC_LOAD_DYLIB, dylib))
+        for dylib in self._weak_dylibs:
+            cmds.append(self._dylib_lc(e, MachSlice.LC_LOAD_WEAK_DYLIB, dylib))
+        symtab_cmd = None
+        if self._symbols is not None:
+            # Filled in once the symbol table's offset is known
+            symtab_cmd = sum(len(cmd) for cmd in cmds)
+            cmds.append(self._lc(e, MachSlice.LC_SYMTAB, pack(e + 'IIII', 0, 0, 0, 0)))
+            cmds.append(self._lc(e, MachSlice.LC_DYSYMTAB, b'\0' * 72))
+        if self._identifier is not None:
+            # Filled in once the size of the code is known, it has to stay the last command
+            cmds.append(self._lc(e, MachSlice.LC_CODE_SIGNATURE, pack(e + 'II', 0, 0)))
+        commands = b''.join(cmds)
+        if is_64:
+            magic = MachO.MACHO64_HEADER_MAGIC
+            header = pack(e + 'IiIIIIII', magic, cputype, cpusubtype, self._filetype, len(cmds), len(commands), 0, 0)
+        else:
+            magic = MachO.MACHO_HEADER_MAGIC
+            header = pack(e + 'IiIIIII', magic, cputype, cpusubtype, self._filetype, len(cmds), len(commands), 0)
+        data = header + commands
+        filler = size - len(data)
+        if filler > 0:
+            data += self._rng.randbytes(filler)
+        if symtab_cmd is not None:
+            data += b'\0' * (-len(data) % 8)
+            symbol_cmds, linkedit = self._symbol_table(e, is_64, len(data))
+            symtab_cmd += len(header)
+            data = data[:symtab_cmd] + symbol_cmds + data[symtab_cmd + len(symbol_cmds):] + linkedit
+        if self._identifier is not None:
+            data += b'\0' * (-len(data) % 16)
+            sig_cmd = len(header) + len(commands) - 16
+            # The load command is part of the signed code, so its final values have to be in place before hashing.
+            # The signature's size only depends on the size of the code.
+            sig_size = len(self.code_signature(data))
+            data = data[:sig_cmd] + self._lc(e, MachSlice.LC_CODE_SIGNATURE, pack(e + 'II', len(data), sig_size)) + data[sig_cmd + 16:]
+            data += self.code_signature(data)
+        return data
+
+    def _symbol_table(self, e, is_64, symoff):
+        """
+        The exported symbols (defined in section 1) followed by the undefined ones, and their string table
+        :param symoff: File offset the nlist entries will be written at
+        :return: Tuple of the LC_SYMTAB + LC_DYSYMTAB commands and the data they point at
+        """
+        undefined, exported = self._symbols
+        # String table offset 0 is the empty name, as ld writes it
+        strings = [b' \0']
+        strings_size = 2
+        nlists = []
+        entry = e + ('IBBHQ' if is_64 else 'IBBHI')
+        for names, n_type, n_sect in ((exported, 0x0f, 1), (undefined, 0x01, 0)):
+            for name in names:
+                nlists.append(pack(entry, strings_size, n_type, n_sect, 0, 0))
+                strings.append(name.encode('utf-8') + b'\0')
+                strings_size += len(strings[-1])
+        strings = b''.join(strings) + b'\0' * (-strings_size % 8)
+        nlists = b''.join(nlists)
+        stroff = symoff + len(nlists)
+        nsyms = len(exported) + len(undefined)
+        symtab = self._lc(e, MachSlice.LC_SYMTAB, pack(e + 'IIII', symoff, nsyms, stroff, len(strings)))
+        dysymtab = self._lc(e, MachSlice.LC_DYSYMTAB, pack(e + 'IIIIII', 0, 0, 0, len(exported), len(exported), len(undefined)) + b'\0' * 48)
+        return symtab + dysymtab, nlists + strings
+
+    def code_signature(self, code):
+        """
+        An ad-hoc style embedded signature over the code: a SHA-256 code directory, a designated requirement,
+        the entitlements (if any) and an empty CMS wrapper
+        :param code: Everything the signature covers, from the mach header up to the signature itself
+        :return: The SuperBlob
+        """
+        cs = CodeSignature
+        requirement = self._blob(cs.CSMAGIC_REQUIREMENT, pack('>II', 1, self.OP_IDENT) + self._req_data(self._identifier))
+        requirements = self._blob(cs.CSMAGIC_REQUIREMENTS, pack('>III', 1, self.REQUIREMENT_DESIGNATED, 20) + requirement)
+        blobs = [(cs.CSSLOT_REQUIREMENTS, requirements)]
+        if self._entitlements is not None:
+            blobs.append((cs.CSSLOT_ENTITLEMENTS, self._blob(cs.CSMAGIC_EMBEDDED_ENTITLEMENTS, plistlib.dumps(self._entitlements))))
+        special_count = max(slot for slot, blob in blobs)
+        special = {slot: hashlib.sha256(blob).digest() for slot, blob in blobs}
+        special_hashes = b''.join(special.get(slot, b'\0' * 32) for slot in range(special_count, 0, -1))
+        page_size = 1 << self.PAGE_SIZE_LOG2
+        code_hashes = b''.join(hashlib.sha256(code[pos:pos + page_size]).digest() for pos in range(0, len(code), page_size))
+        ident = self._identifier.encode('utf-8') + b'\0'
+        team = self._team_id.encode('utf-8') + b'\0' if self._team_id is not None else b''
+        team_offset = self.CODE_DIRECTORY_SIZE + len(ident) if team else 0
+        hash_offset = self.CODE_DIRECTORY_SIZE + len(ident) + len(team) + len(special_hashes)
+        length = hash_offset + len(code_hashes)
+        code_dir = pack(self.CODE_DIRECTORY, cs.CSMAGIC_CODEDIRECTORY, length, self.CODE_DIRECTORY_VERSION, 0,
+                        hash_offset, self.CODE_DIRECTORY_SIZE, special_count, len(code_hashes) // 32, len(code), 32,
+                        self.HASH_TYPE_SHA256, 0, self.PAGE_SIZE_LOG2, 0, 0, team_offset, 0, 0, 0, 0, 0)
+        code_dir += ident + team + special_hashes + code_hashes
+        blobs.insert(0, (cs.CSSLOT_CODEDIRECTORY, code_dir))
+        blobs.append((cs.CSSLOT_SIGNATURESLOT, self._blob(cs.CSMAGIC_BLOBWRAPPER, b'')))
+        offset = 12 + 8 * len(blobs)
+        index = b''
+        for slot, blob in blobs:
+            index += pack('>II', slot, offset)
+            offset += len(blob)
+        return pack('>III', cs.CSMAGIC_EMBEDDED_SIGNATURE, offset, len(blobs)) + index + b''.join(blob for slot, blob in blobs)
+
+    @staticmethod
+    def _blob(magic, payload):
+        return pack('>II', magic, len(payload) + 8) + payload
+
+    @staticmethod
+    def _req_data(text):
+        """
+        Length prefixed, padded to 4 bytes, the way requirement expressions store strings
+        """
+        raw = text.encode('utf-8')
+        return pack('>I', len(raw)) + raw + b'\0' * (-len(raw) % 4)
+
+    def _lc(self, e, cmd, body):
+        """
+        Wrap a load command body, padding to 8 bytes
+        """
+        raw = body + b'\0' * (-(len(body) + 8) % 8)
+        return pack(e + 'II', cmd, len(raw) + 8) + raw
+
+    def _dylib_lc(self, e, cmd, name):
+        return self._lc(e, cmd, pack(e + 'IIII', 24, 2, 0x10000, 0x10000) + name.encode('utf-8') + b'\0')
+
+
+class SyntheticIpa:
+    """
+    Generates realistic looking .ipa files offline for benchmarks: an app bundle with Info.plist, a signed
+    embedded.mobileprovision, a main executable, embedded frameworks and a pile of assets.
+    The CMS signature is structurally complete but its signature bytes are random, nothing here checks them.
+    The binaries carry ad-hoc style code signatures with real page hashes.
+    """
+    TEAM_ID = 'XYZ1234567'
+    WEAK_DYLIBS = ('/System/Library/Frameworks/AppTrackingTransparency.framework/AppTrackingTransparency',)
+    # Imports every app has, plus a deprecated class for denylist checks to find
+    COMMON_IMPORTS = ('_objc_msgSend', '_objc_release', '_OBJC_CLASS_$_NSObject', '_OBJC_CLASS_$_UIView',
+                      '_OBJC_CLASS_$_UIViewController', '_OBJC_CLASS_$_UIWebView', '_dlopen', '_dlsym')
+
+    def __init__(self, name='SynthApp', bundle_id='com.acme.synthapp', asset_count=100, asset_size=16 * 1024,
+                 framework_count=3, executable_layout='fat', executable_size=1024 * 1024, plist_format='binary',
+                 device_count=100, url_scheme_count=10, compression=zipfile.ZIP_DEFLATED, seed=0, symbol_count=1000) -> None:
+        """
+        __init__
+        :param name: Name of the .app and its executable
+        :param bundle_id: CFBundleIdentifier
+        :param asset_count: Number of asset files
+        :param asset_size: Size of each asset in bytes. Half of each asset is random, half repeats, so they compress.
+        :param framework_count: Number of Frameworks/*.framework to embed
+        :param executable_layout: One of SyntheticMachO.LAYOUTS
+        :param executable_size: Size of each executable slice in bytes
+        :param plist_format: 'binary' or 'xml' for Info.plist
+        :param device_count: Number of ProvisionedDevices in the profile (0 for an App Store style profile)
+        :param url_scheme_count: Number of CFBundleURLTypes entries in Info.plist
+        :param compression: zipfile compression method for the members
+        :param seed: Seed for all generated content
+        :param symbol_count: Number of symbols in the main executable's symbol table, about half of them undefined
+        """
+        super().__init__()
+        self._name = name
+        self._bundle_id = bundle_id
+        self._asset_count = asset_count
+        self._asset_size = asset_size
+        self._framework_count = framework_count
+        self._executable_layout = executable_layout
+        self._executable_size = executable_size
+        self._plist_format = plist_format
+        self._device_count = device_count
+        self._url_scheme_count = url_scheme_count
+        self._compression = compression
+        self._rng = random.Random(seed)
+        self._symbol_count = symbol_count
+
+    @property
+    def executable_name(self):
+        return self._name
+
+    def write(self, ipa_path):
+        """
+        Write the .ipa file
+        :param ipa_path: Destination path
+        :return: ipa_path
+        """
+        app = 'Payload/{0}.app/'.format(self._name)
+        frameworks = ['Fw{0}'.format(i) for i in range(self._framework_count)]
+        with zipfile.ZipFile(str(ipa_path), 'w', self._compression) as ipa_zip:
+            ipa_zip.writestr(app + 'Info.plist', self.info_plist())
+            ipa_zip.writestr(app + 'embedded.mobileprovision', self.mobileprovision())
+            dylibs = ['/usr/lib/libSystem.B.dylib',
+                      '/System/Library/Frameworks/Foundation.framework/Foundation',
+                      '/System/Library/Frameworks/UIKit.framework/UIKit']
+            dylibs += ['@rpath/{0}.framework/{0}'.format(fw) for fw in frameworks]
+            executable = SyntheticMachO(self._rng, dylibs, identifier=self._bundle_id, team_id=self.TEAM_ID,
+                                        entitlements=self.entitlements(), weak_dylibs=self.WEAK_DYLIBS,
+                                        symbols=self.symbols() if self._symbol_count else None).build(self._executable_layout, self._executable_size)
+            ipa_zip.writestr(app + self._name, executable)
+            for fw in frameworks:
+                install_name = '@rpath/{0}.framework/{0}'.format(fw)
+                fw_macho = SyntheticMachO(self._rng, dylibs[:2], SyntheticMachO.FILETYPE_DYLIB, install_name,
+                                          identifier='{0}.{1}'.format(self._bundle_id, fw.lower()), team_id=self.TEAM_ID)
+                fw_dir = app + 'Frameworks/{0}.framework/'.format(fw)
+                ipa_zip.writestr(fw_dir + fw, fw_macho.build('thin64', self._executable_size // 4))
+                ipa_zip.writestr(fw_dir + 'Info.plist', plistlib.dumps({'CFBundleIdentifier': self._bundle_id + '.' + fw.lower(),
+                                                                         'CFBundleExecutable': fw}, fmt=plistlib.FMT_BINARY))
+            for i in range(self._asset_count):
+                half = self._asset_size // 2
+                ipa_zip.writestr(app + 'Assets/asset{0:05d}.png'.format(i),
+                                 self._rng.randbytes(half) + b'\x89PNG' * ((self._asset_size - half) // 4))
+        return ipa_path
+
+    def symbols(self):
+        """
+        :return: Tuple of (undefined, exported) symbol names for the main executable
+        """
+        half = self._symbol_count // 2
+        undefined = list(self.COMMON_IMPORTS) + ['_synth_import_{0:06d}'.format(i) for i in range(half - len(self.COMMON_IMPORTS))]
+        exported = ['_main', '_OBJC_CLASS_$_AppDelegate', '_OBJC_METACLASS_$_AppDelegate']
+        exported += ['_OBJC_CLASS_$_SynthView{0:04d}'.format(i) for i in range(min(100, half // 10))]
+        exported += ['_synth_export_{0:06d}'.format(i) for i in range(self._symbol_count - len(undefined) - len(exported))]
+        return undefined[:self._symbol_count], exported[:max(0, self._symbol_count - len(undefined))]
+
+    def info_plist(self):
+        info = {}
+        info['CFBundleIdentifier'] = self._bundle_id
+        info['CFBundleExecutable'] = self._name
+        info['CFBundleName'] = self._name
+        info['CFBundleDisplayName'] = self._name
+        info['CFBundleVersion'] = '1.0.0'
+        info['CFBundleShortVersionString'] = '1.0.0'
+        info['MinimumOSVersion'] = '12.0'
+        info['DTSDKName'] = 'iphoneos17.0'
+        info['UISupportedInterfaceOrientations'] = ['UIInterfaceOrientationPortrait', 'UIInterfaceOrientationPortraitUpsideDown']
+        info['UIRequiredDeviceCapabilities'] = ['arm64']
+        info['CFBundleURLTypes'] = [{'CFBundleURLName': '{0}.scheme{1}'.format(self._bundle_id, i),
+                                     'CFBundleURLSchemes': ['synth{0}'.format(i)]} for i in range(self._url_scheme_count)]
+        fmt = plistlib.FMT_XML if self._plist_format == 'xml' else plistlib.FMT_BINARY
+        return plistlib.dumps(info, fmt=fmt)
+
+    def profile_plist(self):
+        now = datetime(2024, 1, 1)
+        prov = {}
+        prov['AppIDName'] = self._name
+        prov['ApplicationIdentifierPrefix'] = [self.TEAM_ID]
+        prov['CreationDate'] = now
+        prov['ExpirationDate'] = now + timedelta(days=365 * 20)
+        prov['Platform'] = ['iOS']
+        prov['DeveloperCertificates'] = [self.certificate(self.developer_name(), self.developer_name())]
+        prov['Entitlements'] = {'application-identifier': '{0}.{1}'.format(self.TEAM_ID, self._bundle_id),
+                                'com.apple.developer.team-identifier': self.TEAM_ID,
+                                'get-task-allow': False,
+                                'keychain-access-groups': ['{0}.*'.format(self.TEAM_ID)]}
+        prov['Name'] = '{0} Distribution'.format(self._name)
+        if self._device_count:
+            prov['ProvisionedDevices'] = ['{0:040x}'.format(self._rng.getrandbits(160)) for i in range(self._device_count)]
+        prov['TeamIdentifier'] = [self.TEAM_ID]
+        prov['TeamName'] = 'Acme, Inc.'
+        prov['TimeToLive'] = 365
+        prov['UUID'] = '{0:08x}-{1:04x}-{2:04x}-{3:04x}-{4:012x}'.format(
+            self._rng.getrandbits(32), self._rng.getrandbits(16), self._rng.getrandbits(16),
+            self._rng.getrandbits(16), self._rng.getrandbits(48))
+        prov['Version'] = 1
+        return plistlib.dumps(prov)
+
+    def entitlements(self):
+        """
+        The entitlements signed into the main executable, a subset of what the profile grants
+        """
+        app_id = '{0}.{1}'.format(self.TEAM_ID, self._bundle_id)
+        return {'application-identifier': app_id,
+                'com.apple.developer.team-identifier': self.TEAM_ID,
+                'get-task-allow': False,
+                'keychain-access-groups': [app_id]}
+
+    def developer_name(self):
+        return {'CN': 'iPhone Distribution: Acme, Inc. ({0})'.format(self.TEAM_ID), 'OU': self.TEAM_ID,
+                'O': 'Acme, Inc.', 'C': 'US'}
+
+    def certificate(self, subject, issuer, serial=None):
+        """
+        A structurally valid X.509 certificate with a random key and signature
+        """
+        w = DerWriter
+        if serial is None:
+            serial = self._rng.getrandbits(63)
+        not_before = datetime(2024, 1, 1)
+        tbs = w.seq(w.context(0, w.integer(2)),
+                    w.integer(serial),
+                    w.seq(w.oid(OID_SHA256_RSA), w.null()),
+                    w.name(**issuer),
+                    w.seq(w.utc_time(not_before), w.utc_time(not_before + timedelta(days=365 * 20))),
+                    w.name(**subject),
+                    w.seq(w.seq(w.oid(OID_RSA), w.null()), w.bits(self._rng.randbytes(270))))
+        return w.seq(tbs, w.seq(w.oid(OID_SHA256_RSA), w.null()), w.bits(self._rng.randbytes(256)))
+
+    def mobileprovision(self):
+        """
+        The profile plist wrapped in CMS signed-data, signed by a leaf certificate issued by an "Apple" CA
+        """
+        w = DerWriter
+        ca_name = {'CN': 'Apple iPhone Certification Authority', 'O': 'Apple Inc.', 'C': 'US'}
+        signer_name = {'CN': 'Apple iPhone OS Provisioning Profile Signing', 'O': 'Apple Inc.', 'C': 'US'}
+        serial = self._rng.getrandbits(63)
+        signer = self.certificate(signer_name, ca_name, serial)
+        ca = self.certificate(ca_name, ca_name)
+        signer_info = w.seq(w.integer(1),
+                            w.seq(w.name(**ca_name), w.integer(serial)),
+                            w.seq(w.oid(OID_SHA256)),
+                            w.seq(w.oid(OID_RSA), w.null()),
+                            w.octets(self._rng.randbytes(256)))
+        signed_data = w.seq(w.integer(1),
+                            w.set(w.seq(w.oid(OID_SHA256))),
+                            w.seq(w.oid(OID_DATA), w.context(0, w.octets(self.profile_plist()))),
+                            w.context(0, signer + ca),
+                            w.set(signer_info))
+        return w.seq(w.oid(OID_SIGNED_DATA), w.context(0, signed_data))
@@ -1,70 +1,220 @@
-from zipfile import ZipFile
+import os
+import json
+import zlib
+import zipfile
+import contextvars
 from pathlib import Path
-import subprocess
+from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+
+from ipa_util import metrics
+from ipa_util.cms import SignedData
+from ipa_util.metrics import MeteredZipFile
 
 
 class Unpack:
     """
-    Unpack an ipa file to a specific directory for further processing
+    Unpack an ipa file to a specific directory for further processing, or open it for in-archive analysis
+    where members are read straight out of the zip and nothing is written to disk.
+
+    Unpacking decompresses members on a thread pool (zlib releases the GIL), streaming each one through a bounded
+    buffer. Every file vipa writes is listed in a manifest in the destination folder, with its size, CRC32 and
+    mtime, so unpacking the same build again only rewrites the files that changed, and cleanup_dest() knows exactly
+    what to remove.
     """
+    MANIFEST_NAME = '.vipa_manifest.json'
+    PART_SUFFIX = '.vipa-part'
+    CHUNK_SIZE = 1024 * 1024
 
-    def __init__(self, src_path, dest_path) -> None:
+    def __init__(self, src_path, dest_path, max_workers=None) -> None:
         """
         __init__
-        :param src_path: Full path to the source .ipa file
+        :param src_path: Full path to the source .ipa file, or a seekable file-like object such as a source.ByteSource
         :param dest_path: Path to a destination folder where the unpacking will be done
+        :param max_workers: Threads used to decompress members, defaults to the CPU count
         """
         super().__init__()
         self._src_path = src_path
         self._dest_path = dest_path
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._ipa_zip = None
 
     def unpack_ipa(self):
         """
-        Unpacks the ipa and returns the path where the unpacked file may be found
+        Unpacks the ipa and returns the path where the unpacked file may be found.
+        Files already in the destination with the member's size and CRC32 are left alone. A member is written to a
+        temporary name and renamed into place, so an interrupted unpack never leaves a truncated file behind and
+        the next run picks up where it stopped.
         :return: Path to the destination folder
         """
-        with ZipFile(self._src_path) as ipa_zip:
-            ipa_zip.extractall(self._dest_path)
+        dest = Path(self._dest_path)
+        dest.mkdir(parents=True, exist_ok=True)
+        manifest = self._read_manifest()
+        with self._open_zip() as ipa_zip:
+            files = {}
+            for info in ipa_zip.infolist():
+                target = self._member_path(dest, info.filename)
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                else:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    # A repeated name overwrites the earlier member, as extractall() would
+                    files[info.filename] = (info, target)
+            # Largest first, so one big binary doesn't start last and hold up the whole pool
+            files = sorted(files.values(), key=lambda f: f[0].file_size, reverse=True)
+            with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self._extract_member, ipa_zip, info, target,
+                                       manifest.get(info.filename)) for info, target in files]
+                for (info, target), future in zip(files, futures):
+                    manifest[info.filename] = future.result()
+        self._write_manifest(manifest)
         return self._dest_path
 
+    @property
+    def ipa_zip(self):
+        """
+        The ZipFile for the source .ipa, opened on first use. Opening only reads the central directory.
+        """
+        if self._ipa_zip is None:
+            self._ipa_zip = self._open_zip()
+        return self._ipa_zip
+
+    def _open_zip(self):
+        """
+        Open the source archive. With instrumentation on, its reads and decompression are counted.
+        """
+        if metrics.active() is not None:
+            return MeteredZipFile(self._src_path)
+        return ZipFile(self._src_path)
+
+    def open_ipa(self):
+        """
+        Opens the ipa for in-archive analysis. Only the central directory is read here, members are decompressed
+        on demand by whoever opens them.
+        :return: A zipfile.Path pointing at the root of the archive
+        """
+        return zipfile.Path(self.ipa_zip)
+
+    def close_ipa(self):
+        """
+        Close the archive opened by open_ipa()
+        :return: None
+        """
+        if self._ipa_zip is not None:
+            self._ipa_zip.close()
+            self._ipa_zip = None
+
     def cleanup_dest(self):
         """
-        Clean up the destination folder by deleting everything in it
+        Clean up the destination folder by deleting everything unpack_ipa() wrote there, and any folders left empty.
+        Files which were already there are not touched.
         :return: None
         """
-        pass
+        dest = Path(self._dest_path)
+        manifest = self._read_manifest()
+        folders = set()
+        for name, entry in manifest.items():
+            target = self._member_path(dest, name)
+            paths = [target.with_name(target.name + Unpack.PART_SUFFIX)]
+            if entry[3]:
+                paths.append(target)
+            for path in paths:
+                if path.is_file() or path.is_symlink():
+                    path.unlink()
+            parent = target.parent
+            while parent != dest:
+                folders.add(parent)
+                parent = parent.parent
+        manifest_path = dest / Unpack.MANIFEST_NAME
+        if manifest_path.exists():
+            manifest_path.unlink()
+        # Deepest first, so parents are empty by the time they come up
+        for folder in sorted(folders, key=lambda f: len(f.parts), reverse=True):
+            try:
+                folder.rmdir()
+            except OSError:
+                # Not empty (something else lives there) or already gone
+                pass
+
+    def _extract_member(self, ipa_zip, info, target, known):
+        """
+        Write one member to disk unless an identical file is already there
+        :param known: The member's previous manifest entry, or None
+        :return: The new manifest entry, [size, CRC32, mtime_ns, written by vipa]
+        """
+        try:
+            stat = target.stat()
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and stat.st_size == info.file_size:
+            # The manifest vouches for files nobody touched since, anything else has its CRC checked
+            if known is not None and known[:3] == [info.file_size, info.CRC, stat.st_mtime_ns]:
+                metrics.count('files_skipped')
+                return known
+            if self._file_crc(target) == info.CRC:
+                metrics.count('files_skipped')
+                # A matching file vipa didn't write is left for its owner at cleanup
+                return [info.file_size, info.CRC, stat.st_mtime_ns, known is not None and known[3]]
+        part = target.with_name(target.name + Unpack.PART_SUFFIX)
+        with ipa_zip.open(info) as member_fp, open(str(part), 'wb') as out_fp:
+            while True:
+                chunk = member_fp.read(Unpack.CHUNK_SIZE)
+                if not chunk:
+                    break
+                out_fp.write(chunk)
+        os.replace(str(part), str(target))
+        metrics.count('files_written')
+        metrics.count('bytes_written', info.file_size)
+        return [info.file_size, info.CRC, target.stat().st_mtime_ns, True]
+
+    @staticmethod
+    def _file_crc(path):
+        crc = 0
+        with open(str(path), 'rb') as fp:
+            while True:
+                chunk = fp.read(Unpack.CHUNK_SIZE)
+                if not chunk:
+                    return crc
+                crc = zlib.crc32(chunk, crc)
+
+    @staticmethod
+    def _member_path(dest, name):
+        """
+        :return: Where a member goes under dest. Names that would land outside it are refused.
+        """
+        parts = name.replace('\\', '/').split('/')
+        if name.startswith('/') or '..' in parts or (parts and ':' in parts[0]):
+            raise Exception('Refusing to unpack {0}, it points outside the destination folder'.format(name))
+        return dest.joinpath(*[part for part in parts if part not in ('', '.')])
+
+    def _read_manifest(self):
+        """
+        :return: Dict of member name => [size, CRC32, mtime_ns, written by vipa] from a previous unpack, empty if
+                 there wasn't one
+        """
+        try:
+            with open(os.path.join(str(self._dest_path), Unpack.MANIFEST_NAME), 'r') as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        return manifest if isinstance(manifest, dict) else {}
+
+    def _write_manifest(self, manifest):
+        manifest_path = os.path.join(str(self._dest_path), Unpack.MANIFEST_NAME)
+        with open(manifest_path + Unpack.PART_SUFFIX, 'w') as fp:
+            json.dump(manifest, fp)
+        os.replace(manifest_path + Unpack.PART_SUFFIX, manifest_path)
 
     def extract_provisioning_info(self, app_root):
         """
         Extract information from the embedded.mobileprovision file, which is really a pkcs#7 file in der format.
-        There are other ways to do this, but I think this is the cleanest with the only external dependency being openssl in your path.
+        The signed-data blob is decoded in-process (see cms.SignedData), so there's no openssl dependency and no temp file.
 
-        Thanks to SO user olivierypg
-        https://stackoverflow.com/a/14379814/953365
-
-        Also, Jay Graves:
+        Thanks to Jay Graves:
         https://possiblemobile.com/2013/04/what-is-a-provisioning-profile-part-1/
 
-        :param app_root: Path to the application root folder
-        :return: None
+        :param app_root: Path to the application root folder, either on disk or from open_ipa()
+        :return: A SignedData whose content is the embedded plist and whose signer_chain() are the signing certificates
         """
         mobile_prov_path = app_root / 'embedded.mobileprovision'
-        temp_path = Path(self._dest_path) / 'temp'
-        if not temp_path.is_dir():
-            temp_path.mkdir()
-        temp_plist_path = temp_path / 'embedded_prov.plist'
-
-        openssl_args = []
-        openssl_args.append('openssl')
-        openssl_args.append('smime')
-        openssl_args.append('-inform')
-        openssl_args.append('der')
-        openssl_args.append('-verify')
-        openssl_args.append('-noverify')
-        openssl_args.append('-in')
-        openssl_args.append(str(mobile_prov_path))
-        openssl_args.append('-out')
-        openssl_args.append(str(temp_plist_path))
-        ret = subprocess.check_call(openssl_args)
-        return ret, temp_plist_path
-
+        return SignedData(mobile_prov_path.read_bytes())
@@ -1,7 +1,10 @@
 import plistlib
+import zipfile
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
+from ipa_util.lazy_plist import LazyPlist
+
 
 class Validate:
     """
@@ -16,14 +19,30 @@ class Validate:
     req-005: WARNING: Should warn if the provisioning profile has expired
     req-006: The app id from the Entitlements section must match the app id from Info.plist, taking wildcards into account.
     req-007: Executable files should be in the correct format for iOS devices (armv7, armv7s, arm64, etc)
+    req-008: Every page and blob covered by a binary's code signature must match its hash in the CodeDirectory.
+            WARNING: Should warn if a binary isn't code signed at all
+    req-009: The entitlements signed into the main executable must all be granted by the provisioning profile's
+            Entitlements, taking wildcards into account
+
+    validate_structure(), validate_provisioning_plist() and validate_binary() raise on the first failure. Each rule
+    also has its own check_*() method, which rules.RuleEngine runs independently to report every finding.
     """
+    # cpu types (as decoded by MachO) which run on iOS devices
+    DEVICE_CPU_TYPES = ('arm', 'arm64')
+    # LC_BUILD_VERSION platforms that mean the binary was built for something other than a device
+    NON_DEVICE_PLATFORMS = ('iossimulator', 'tvossimulator', 'watchossimulator', 'visionossimulator', 'macos')
+
     def __init__(self, dest_path) -> None:
         """
         __init__
-        :param dest_path: The path to the unpacked .ipa file (location of the Payload folder)
+        :param dest_path: The path to the unpacked .ipa file (location of the Payload folder), or the zipfile.Path
+                          returned by Unpack.open_ipa() to validate in-archive
         """
         super().__init__()
-        self._root_path = Path(dest_path)
+        if isinstance(dest_path, zipfile.Path):
+            self._root_path = dest_path
+        else:
+            self._root_path = Path(dest_path)
         self._payload_path = None
         self._app_dir = None
         self._plist_file = None
@@ -42,17 +61,33 @@ class Validate:
     def executable_path(self):
         return self._app_dir / self._executable_file
 
+    @property
+    def payload_path(self):
+        return self._payload_path
+
     def validate_structure(self):
         """
         Validates the basic structure of an .ipa file
         :return:
         """
-        # req-001
+        self.check_payload()
+        self.check_app_dir()
+        self.check_info_plist()
+
+    def check_payload(self):
+        """
+        req-001
+        """
         self._payload_path = self._root_path / 'Payload'
         if not self._payload_path.is_dir():
             raise Exception("Root Payload path not found")
-        # req-002
-        app_dirs = sorted(self._payload_path.glob('*.app'))
+
+    def check_app_dir(self):
+        """
+        req-002, after check_payload()
+        """
+        # iterdir() rather than glob() so this works against zipfile.Path as well
+        app_dirs = sorted((d for d in self._payload_path.iterdir() if d.name.endswith('.app')), key=lambda d: d.name)
         if len(app_dirs) == 0:
             raise Exception("No .app directories found within Payload")
         if len(app_dirs) > 1:
@@ -60,9 +95,13 @@ class Validate:
         for dir1 in app_dirs:
             if not dir1.is_dir():
                 raise Exception("{0} is not a directory".format(dir1))
-        # req-003
         self._app_dir = dir1
         print('Found app: {0}'.format(dir1))
+
+    def check_info_plist(self):
+        """
+        req-003, after check_app_dir()
+        """
         self._plist_file = self._app_dir / 'Info.plist'
         if not self._plist_file.is_file():
             raise Exception("Info.plist file was not found in the app bundle")
@@ -70,10 +109,10 @@ class Validate:
     def extract_plist(self):
         """
         Extracts information from the Info.plist file
-        :return: Dictionary representation of Info.plist contents
+        :return: Dictionary representation of Info.plist contents. Values are only decoded when looked up.
         """
         with self._plist_file.open('rb') as plist_fp:
-            p_dict = plistlib.load(plist_fp)
+            p_dict = LazyPlist.load(plist_fp)
             self._bundle_id = p_dict.get('CFBundleIdentifier')
             self._executable_file = p_dict.get('CFBundleExecutable')
             return p_dict
@@ -81,41 +120,171 @@ class Validate:
     def extract_provisioning_plist(self, embedded_prov_plist_path):
         """
         Extracts information from the Info.plist file
-        :param  embedded_prov_plist_path: Full path to the plist file which is embedded in the provisioning profile
-        :return: Dictionary representation of embedded.mobileprovision contents
+        :param  embedded_prov_plist_path: Full path to the plist file which is embedded in the provisioning profile,
+                                          or the plist bytes themselves
+        :return: Dictionary representation of embedded.mobileprovision contents. Values are only decoded when looked up.
         """
+        if isinstance(embedded_prov_plist_path, bytes):
+            return LazyPlist(embedded_prov_plist_path)
         with embedded_prov_plist_path.open('rb') as plist_fp:
-            p_dict = plistlib.load(plist_fp)
+            p_dict = LazyPlist.load(plist_fp)
             return p_dict
 
-    def validate_provisioning_plist(self, plist_dict):
+    def validate_provisioning_plist(self, plist_dict, mach_info=None):
         """
         Validate the embedded provisioning plist which was extracted in a previous step.
         :param plist_dict: Dictionary representation of the embedded.mobileprovision file
+        :param mach_info: Optional MachO.get_mach_info() of the main executable, to check its signed entitlements
         :return: None
         """
-        app_id_prefix_array = plist_dict['ApplicationIdentifierPrefix']
-        entitlements_dict = plist_dict['Entitlements']
-        app_identifier_raw = entitlements_dict.get('application-identifier')
+        self.check_app_id_prefix(plist_dict)
+        warning = self.check_expiration(plist_dict)
+        if warning is not None:
+            print(warning)
+        self.check_app_id(plist_dict)
+        if mach_info is not None:
+            self.check_entitlements(plist_dict, mach_info)
+
+    @staticmethod
+    def _split_app_identifier(plist_dict):
+        """
+        :return: Tuple of the prefix and the app id of the profile's application-identifier entitlement
+        """
+        app_identifier_raw = plist_dict['Entitlements'].get('application-identifier')
         ix = app_identifier_raw.find('.')
         if ix >= 0:
-            app_identifier_prefix = app_identifier_raw[:ix]
-            app_id = app_identifier_raw[ix+1:]
-        else:
-            app_identifier_prefix = app_identifier_raw
-            app_id = ''
-        get_task_allow = entitlements_dict.get('get-task-allow')
-        keychain_groups = entitlements_dict.get('keychain-access-groups')
-        # req-004
-        if app_identifier_prefix not in app_id_prefix_array:
+            return app_identifier_raw[:ix], app_identifier_raw[ix+1:]
+        return app_identifier_raw, ''
+
+    def check_app_id_prefix(self, plist_dict):
+        """
+        req-004
+        :param plist_dict: The embedded provisioning profile
+        """
+        app_identifier_prefix = self._split_app_identifier(plist_dict)[0]
+        if app_identifier_prefix not in plist_dict['ApplicationIdentifierPrefix']:
             raise Exception('The entitlements application-identifier {0} does not match any of the given app id prefixes'.format(app_identifier_prefix))
-        # req-005
-        exp_date = plist_dict['ExpirationDate']
+
+    @staticmethod
+    def check_expiration(plist_dict):
+        """
+        req-005
+        :param plist_dict: The embedded provisioning profile
+        :return: The warning if the profile has expired, else None
+        """
+        exp_date = plist_dict.get('ExpirationDate')
         now = datetime.now()
-        if exp_date < now:
-            print('The embedded provisioning profile has expired on {0}'.format(exp_date))
-        # req-006
-        self._validate_app_id(self._bundle_id, app_id)
+        if exp_date is not None and exp_date < now:
+            return 'The embedded provisioning profile has expired on {0}'.format(exp_date)
+        return None
+
+    def check_app_id(self, plist_dict):
+        """
+        req-006, after extract_plist()
+        :param plist_dict: The embedded provisioning profile
+        """
+        self._validate_app_id(self._bundle_id, self._split_app_identifier(plist_dict)[1])
+
+    def check_entitlements(self, plist_dict, mach_info):
+        """
+        req-009
+        :param plist_dict: The embedded provisioning profile
+        :param mach_info: MachO.get_mach_info() of the main executable, with read_signature
+        """
+        for slice in mach_info['arch_slices']:
+            code_sig = slice.get('code_signature')
+            # Without read_signature only the signature's location is known
+            if code_sig is not None and code_sig.get('entitlements') is not None:
+                self._validate_entitlements(mach_info['binary_name'], code_sig['entitlements'], plist_dict['Entitlements'])
+
+    def validate_binary(self, mach_info):
+        """
+        Validate that every slice of a mach file can run on an iOS device, and matches its code signature
+        :param mach_info: A python value object from MachO.get_mach_info()
+        :return: None
+        """
+        self.check_architectures(mach_info)
+        for warning in self.check_code_signature(mach_info):
+            print(warning)
+
+    @staticmethod
+    def check_architectures(mach_info):
+        """
+        req-007
+        :param mach_info: A python value object from MachO.get_mach_info()
+        """
+        for slice in mach_info['arch_slices']:
+            if slice['cpu_type'] not in Validate.DEVICE_CPU_TYPES:
+                raise Exception('{0} contains a {1} slice which will not run on iOS devices'.format(mach_info['binary_name'], slice['cpu_type']))
+            if slice.get('platform') in Validate.NON_DEVICE_PLATFORMS:
+                raise Exception('{0} has a slice built for {1}'.format(mach_info['binary_name'], slice['platform']))
+
+    @staticmethod
+    def check_code_signature(mach_info):
+        """
+        req-008
+        :param mach_info: A python value object from MachO.get_mach_info(), with read_signature for the signed blobs
+                          and verify_pages for the page hashes
+        :return: List of warnings, for the slices which aren't signed
+        """
+        warnings = []
+        for slice in mach_info['arch_slices']:
+            if 'code_signature' not in slice:
+                # Only the slice headers were read
+                continue
+            code_sig = slice['code_signature']
+            if code_sig is None:
+                warnings.append('{0} has a {1} slice which is not code signed'.format(mach_info['binary_name'], slice['cpu_type']))
+                continue
+            for blob_name, blob_valid in code_sig.get('blobs_valid', {}).items():
+                if not blob_valid:
+                    raise Exception('{0} has {1} which do not match its code signature'.format(mach_info['binary_name'], blob_name))
+            pages = code_sig.get('pages')
+            if pages is not None and not pages['valid']:
+                raise Exception('{0} has {1} of {2} pages which do not match its code signature'.format(
+                    mach_info['binary_name'], pages['bad_page_count'], pages['page_count']))
+        return warnings
+
+    def _validate_entitlements(self, binary_name, signed_entitlements, profile_entitlements):
+        """
+        Check that every entitlement the binary was signed with is granted by the provisioning profile.
+        Examples (signed, granted):
+        get-task-allow: False, False  => match
+        get-task-allow: True, False   => fail
+        keychain-access-groups: [ABC.com.acme.app1], [ABC.*]  => match
+        application-identifier: ABC.com.acme.app1, ABC.com.acme.app2  => fail
+
+        :param binary_name: Name of the binary, for the error message
+        :param signed_entitlements: Entitlements from the binary's code signature
+        :param profile_entitlements: The Entitlements section of the provisioning profile
+        :return: None
+        """
+        for key, value in signed_entitlements.items():
+            if key not in profile_entitlements:
+                raise Exception('{0} is signed with the {1} entitlement which the provisioning profile does not grant'.format(binary_name, key))
+            if not self._entitlement_granted(value, profile_entitlements[key]):
+                raise Exception('{0} is signed with {1} = {2} but the provisioning profile only grants {3}'.format(
+                    binary_name, key, value, profile_entitlements[key]))
+
+    @staticmethod
+    def _entitlement_granted(value, granted):
+        """
+        :param value: A signed entitlement value
+        :param granted: The profile's value for the same entitlement. Strings may end in a * wildcard.
+        :return: True if value is allowed by granted
+        """
+        if isinstance(value, list):
+            return all(Validate._entitlement_granted(item, granted) for item in value)
+        if isinstance(granted, list):
+            return any(Validate._entitlement_granted(value, item) for item in granted)
+        if isinstance(granted, bool):
+            # Not using a capability is always allowed
+            return value == granted or value is False
+        if isinstance(granted, str) and isinstance(value, str):
+            ix = granted.find('*')
+            if ix >= 0:
+                return value[:ix] == granted[:ix]
+        return value == granted
 
     def _validate_app_id(self, app_id_from_info_plist, app_id_from_provisioning_file):
         """
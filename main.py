@@ -1,76 +1,371 @@
 import sys
+import json
+import cProfile
+import contextlib
 import argparse
-import tempfile
 
-from ipa_util.info_plist import PlistScanner, EmbeddedProvisioningPlistScanner
-from ipa_util.mach_o import MachO
-from ipa_util.unpack import Unpack
-from ipa_util.validate import Validate
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.batch import BatchRunner
+from ipa_util.bench import Benchmark, STAGES
+from ipa_util.cache import ResultCache
+from ipa_util.diff import BuildDiff
+from ipa_util.duplicates import DuplicateReport
+from ipa_util.index import BuildIndex
+from ipa_util.profiles import ProfileLibrary
+from ipa_util.result import JsonWriter
+from ipa_util.rules import RuleEngine, RULES
+from ipa_util.service import AnalysisService
+from ipa_util.size_report import SizeReport
+from ipa_util.symbol_report import SymbolReport
+from ipa_util.symbols import SymbolDenylist
+from ipa_util.synth import SyntheticIpa, SyntheticMachO
 
 
 def validate_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("input", help="Path to the input .ipa file")
+    parser.add_argument("input", help="Path or http(s) URL of the input .ipa file. URLs are read with range requests, without downloading the whole file.")
     parser.add_argument("--unpack", help="Path to the folder to unpack the .ipa file. A temporary folder wll be used if not given.")
+    parser.add_argument("--in-archive", action="store_true", help="Analyze the .ipa straight from the zip without extracting anything to disk")
+    parser.add_argument("--clean", action="store_true", help="Remove the unpacked files from the --unpack folder when done. They're kept by default, so a re-run only extracts what changed.")
+    parser.add_argument("--metrics", action="store_true", help="Add per-stage timing, I/O and peak memory figures to the output")
+    parser.add_argument("--profile", help="Write cProfile stats for the run to this file (read it with pstats or snakeviz)")
+    parser.add_argument("--verify-pages", action="store_true", help="Check every page of the binaries against their code signatures. This decompresses every binary in full.")
+    parser.add_argument("--signatures", action="store_true", help="Read the code signatures of the binaries and check them and the signed entitlements. The signature is at the end of each binary, so this also decompresses every binary in full.")
+    add_cache_args(parser)
     args = parser.parse_args()
     if args.input is None:
         print("You must provide a path to the input .ipa file", file=sys.stderr)
-        return False, None, None
+        return False, None
+    if args.in_archive and args.unpack is not None:
+        print("--in-archive and --unpack can't be used together", file=sys.stderr)
+        return False, None
+    return True, args
+
+
+def add_cache_args(parser):
+    parser.add_argument("--cache", help="Path to a result cache database. Unchanged builds are served from it without being analyzed.")
+    parser.add_argument("--cache-size", type=int, default=256, help="Maximum size of the result cache in MB (default 256)")
+
+
+def validate_batch_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py batch', description="Analyze many .ipa files, one JSON object per line")
+    parser.add_argument("inputs", nargs='*', default=['-'], help="Directories to walk for .ipa files, or .ipa files / URLs. Use - (the default) to read paths from stdin.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Defaults to the CPU count.")
+    parser.add_argument("--extract", action="store_true", help="Unpack each build to a temporary folder instead of reading it in-archive")
+    parser.add_argument("--output", help="Write the JSON Lines results to this file instead of stdout")
+    parser.add_argument("--metrics", action="store_true", help="Add per-stage timing, I/O and peak memory figures to each record")
+    add_cache_args(parser)
+    return parser.parse_args(argv)
+
+
+def run_batch(argv):
+    args = validate_batch_args(argv)
+    runner = BatchRunner(workers=args.workers, in_archive=not args.extract, cache_path=args.cache,
+                         cache_max_bytes=args.cache_size * 1024 * 1024, metrics=args.metrics)
+    paths = BatchRunner.iter_ipa_paths(args.inputs)
+    if args.output is None:
+        runner.run(paths, sys.stdout)
+    else:
+        with open(args.output, 'w') as out_fp:
+            runner.run(paths, out_fp)
+    print('Analyzed {0} builds, {1} errors'.format(runner.ok_count + runner.error_count, runner.error_count), file=sys.stderr)
+    return 0
+
+
+def validate_serve_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py serve', description="Run the analysis service")
+    parser.add_argument("--host", default='127.0.0.1', help="Host to bind (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="TCP port to listen on")
+    parser.add_argument("--unix", help="Path of a Unix socket to listen on")
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Defaults to the CPU count.")
+    parser.add_argument("--max-concurrency", type=int, help="Analyses running at once. Defaults to the worker count.")
+    parser.add_argument("--max-queue", type=int, help="Requests allowed to wait for a worker before new ones get a 503")
+    parser.add_argument("--timeout", type=float, default=AnalysisService.DEFAULT_TIMEOUT, help="Per request timeout in seconds")
+    parser.add_argument("--no-metrics", action="store_true", help="Don't instrument the analyses or export per-stage counters")
+    parser.add_argument("--allow-path", action="append", default=[], metavar="FOLDER", help="Let JSON {\"path\": ...} requests analyze .ipa files under this folder. Repeat for more folders. Only uploads are accepted by default.")
+    parser.add_argument("--allow-url", action="append", default=[], choices=('http', 'https'), help="Let JSON {\"path\": ...} requests fetch URLs with this scheme. Repeat for both.")
+    add_cache_args(parser)
+    args = parser.parse_args(argv)
+    if args.port is None and args.unix is None:
+        parser.error("give --port and/or --unix")
+    return args
+
+
+def run_serve(argv):
+    args = validate_serve_args(argv)
+    service = AnalysisService(workers=args.workers, max_concurrency=args.max_concurrency, max_queue=args.max_queue,
+                              timeout=args.timeout, cache_path=args.cache, cache_max_bytes=args.cache_size * 1024 * 1024,
+                              metrics=not args.no_metrics, source_roots=args.allow_path, source_schemes=args.allow_url)
+    service.run(args.host, args.port, args.unix)
+    return 0
+
+
+def run_index(argv):
+    parser = argparse.ArgumentParser(prog='main.py index', description="Add builds to a queryable SQLite index")
+    parser.add_argument("database", help="Path to the index database, created if missing")
+    parser.add_argument("inputs", nargs='*', default=['-'], help="Directories to walk for .ipa files, or .ipa files / URLs. Use - (the default) to read paths from stdin.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Defaults to the CPU count.")
+    parser.add_argument("--extract", action="store_true", help="Unpack each build to a temporary folder instead of reading it in-archive")
+    parser.add_argument("--batch-size", type=int, default=BuildIndex.DEFAULT_BATCH_SIZE, help="Builds written per transaction")
+    args = parser.parse_args(argv)
+    build_index = BuildIndex(args.database)
+    try:
+        build_index.index(BatchRunner.iter_ipa_paths(args.inputs), workers=args.workers, batch_size=args.batch_size,
+                          in_archive=not args.extract)
+    finally:
+        build_index.close()
+    print('Indexed {0} builds, {1} unchanged, {2} errors'.format(build_index.indexed_count, build_index.unchanged_count,
+                                                                build_index.error_count), file=sys.stderr)
+    return 0
+
+
+def run_query(argv):
+    parser = argparse.ArgumentParser(prog='main.py query', description="Find builds in an index made with main.py index")
+    parser.add_argument("database", help="Path to the index database")
+    parser.add_argument("--bundle-id", help="Builds with this bundle id")
+    parser.add_argument("--team", help="Builds signed with a profile of this team identifier")
+    parser.add_argument("--profile-uuid", help="Builds embedding the provisioning profile with this UUID")
+    parser.add_argument("--binary-uuid", help="Builds containing a Mach-O with this LC_UUID")
+    parser.add_argument("--arch", help="Builds shipping this architecture in any binary, e.g. armv7")
+    parser.add_argument("--expires-within", type=int, metavar='DAYS', help="Builds whose profile expires in the next DAYS days")
+    parser.add_argument("--expired", action="store_true", default=None, help="Builds whose profile has expired")
+    parser.add_argument("--errors", action="store_true", default=None, help="Builds which failed to analyze")
+    parser.add_argument("--limit", type=int, help="Maximum number of builds to list")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per line instead of a table")
+    args = parser.parse_args(argv)
+    build_index = BuildIndex(args.database)
+    try:
+        rows = build_index.query(bundle_id=args.bundle_id, team_id=args.team, profile_uuid=args.profile_uuid,
+                                 binary_uuid=args.binary_uuid, arch=args.arch, expires_within=args.expires_within,
+                                 expired=args.expired, errors=args.errors, limit=args.limit)
+    finally:
+        build_index.close()
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print('\t'.join('' if row[key] is None else str(row[key])
+                            for key in ('path', 'bundle_id', 'short_version', 'team_id', 'expiration_date', 'error')))
+    print('{0} builds'.format(len(rows)), file=sys.stderr)
+    return 0
+
+
+def run_diff(argv):
+    parser = argparse.ArgumentParser(prog='main.py diff', description="Show what changed between two builds")
+    parser.add_argument("old", help="Path or URL of the previous .ipa file")
+    parser.add_argument("new", help="Path or URL of the new .ipa file")
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        delta = BuildDiff(args.old, args.new).diff()
+    print(json.dumps(delta, indent=2, default=str))
+    return 0
+
+
+def run_profiles(argv):
+    parser = argparse.ArgumentParser(prog='main.py profiles', description="Find the provisioning profiles which can sign bundle ids")
+    parser.add_argument("directory", help="Folder of .mobileprovision files")
+    parser.add_argument("bundle_ids", nargs='*', default=['-'], help="Bundle ids to match. Use - (the default) to read them from stdin.")
+    parser.add_argument("--team", help="Only profiles of this team identifier")
+    parser.add_argument("--device", help="Only profiles which can install on this device UDID")
+    parser.add_argument("--include-expired", action="store_true", help="Include expired profiles")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per bundle id instead of a table")
+    args = parser.parse_args(argv)
+    library = ProfileLibrary()
+    library.load_directory(args.directory)
+    for path, error in library.errors:
+        print('Skipping {0}: {1}'.format(path, error), file=sys.stderr)
+    print('Loaded {0} profiles, {1} errors'.format(len(library), library.error_count), file=sys.stderr)
+    bundle_ids = []
+    for item in args.bundle_ids:
+        if item == '-':
+            bundle_ids += [line.strip() for line in sys.stdin if line.strip()]
+        else:
+            bundle_ids.append(item)
+    matches = library.match_many(bundle_ids, team=args.team, device=args.device, include_expired=args.include_expired)
+    for bundle_id, profiles in matches.items():
+        if args.json:
+            print(json.dumps({'bundle_id': bundle_id, 'profiles': profiles}))
+        else:
+            for profile in profiles:
+                print('\t'.join((bundle_id, profile['UUID'], profile['application-identifier'], profile.get('Name', ''),
+                                 profile.get('ExpirationDate', ''), profile['path'])))
+    return 0
+
+
+def run_sizes(argv):
+    parser = argparse.ArgumentParser(prog='main.py sizes', description="Break a build's size down by folder, category and file type")
+    parser.add_argument("input", help="Path or URL of the .ipa file")
+    parser.add_argument("--depth", type=int, default=4, help="Levels of the folder tree to show (default 4)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of text")
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        report = SizeReport(args.input, args.depth).report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(SizeReport.format_report(report))
+    return 0
+
+
+def run_duplicates(argv):
+    parser = argparse.ArgumentParser(prog='main.py duplicates', description="Find files a build ships more than once, without extracting anything")
+    parser.add_argument("input", help="Path or URL of the .ipa file")
+    parser.add_argument("--min-size", type=int, default=DuplicateReport.DEFAULT_MIN_SIZE, help="Ignore files smaller than this many bytes (default 1)")
+    parser.add_argument("--workers", type=int, help="Threads used to hash the candidates. Defaults to the CPU count.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of text")
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        report = DuplicateReport(args.input, args.min_size, args.workers).report()
+    if args.json:
+        print(json.dumps(report, indent=2))
     else:
-        return True, args.input, args.unpack
+        print(DuplicateReport.format_report(report))
+    return 0
+
+
+def run_symbols(argv):
+    parser = argparse.ArgumentParser(prog='main.py symbols', description="List the linked libraries, symbols and Objective-C classes of every binary, and check them against a denylist")
+    parser.add_argument("input", help="Path or URL of the .ipa file")
+    parser.add_argument("--denylist", help="File of denied symbols and library install names, one per line. A trailing * matches by prefix. Exits with 1 if anything matches.")
+    parser.add_argument("--all", action="store_true", help="Include every undefined and exported symbol in the JSON output")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of text")
+    args = parser.parse_args(argv)
+    denylist = SymbolDenylist.load(args.denylist) if args.denylist is not None else None
+    with contextlib.redirect_stdout(sys.stderr):
+        report = SymbolReport(args.input, denylist, args.all).report()
+    if args.json:
+        JsonWriter(sys.stdout, indent=2).write_line(report)
+    else:
+        print(SymbolReport.format_report(report))
+    return 1 if SymbolReport.denied_count(report) else 0
+
+
+def run_validate(argv):
+    parser = argparse.ArgumentParser(prog='main.py validate', description="Check a build against every validation rule and report all the errors and warnings")
+    parser.add_argument("input", help="Path or URL of the .ipa file")
+    parser.add_argument("--rules", nargs='+', choices=list(RULES), help="Rules to check (default all)")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop at the first error, before reading any binary that only the remaining rules need")
+    parser.add_argument("--workers", type=int, help="Threads the rules run on")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of text")
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        report = RuleEngine(args.input, args.rules, args.fail_fast, args.workers).run()
+    if args.json:
+        JsonWriter(sys.stdout, indent=2).write_line(report)
+    else:
+        print(RuleEngine.format_report(report))
+    return 0 if report['valid'] else 1
+
+
+def add_synth_args(parser):
+    parser.add_argument("--assets", type=int, default=100, help="Number of asset files (default 100)")
+    parser.add_argument("--asset-size", type=int, default=16, help="Size of each asset in KB (default 16)")
+    parser.add_argument("--frameworks", type=int, default=3, help="Number of embedded frameworks (default 3)")
+    parser.add_argument("--layout", choices=SyntheticMachO.LAYOUTS, default='fat', help="Main executable layout (default fat)")
+    parser.add_argument("--executable-size", type=int, default=1024, help="Size of each executable slice in KB (default 1024)")
+    parser.add_argument("--plist-format", choices=('binary', 'xml'), default='binary', help="Info.plist format (default binary)")
+    parser.add_argument("--devices", type=int, default=100, help="Provisioned devices in the profile, 0 for none (default 100)")
+    parser.add_argument("--symbols", type=int, default=1000, help="Symbols in the main executable's symbol table (default 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated content")
+
+
+def synth_options(args):
+    options = {}
+    options['asset_count'] = args.assets
+    options['asset_size'] = args.asset_size * 1024
+    options['framework_count'] = args.frameworks
+    options['executable_layout'] = args.layout
+    options['executable_size'] = args.executable_size * 1024
+    options['plist_format'] = args.plist_format
+    options['device_count'] = args.devices
+    options['symbol_count'] = args.symbols
+    options['seed'] = args.seed
+    return options
+
+
+def run_synth(argv):
+    parser = argparse.ArgumentParser(prog='main.py synth', description="Generate a synthetic .ipa file")
+    parser.add_argument("output", help="Path of the .ipa file to write")
+    add_synth_args(parser)
+    args = parser.parse_args(argv)
+    SyntheticIpa(**synth_options(args)).write(args.output)
+    print('Wrote {0}'.format(args.output))
+    return 0
+
+
+def run_bench(argv):
+    parser = argparse.ArgumentParser(prog='main.py bench', description="Time each analysis stage and compare against a baseline")
+    parser.add_argument("--ipa", help="Benchmark this .ipa file instead of a synthetic one")
+    parser.add_argument("--stages", nargs='+', choices=list(STAGES), help="Stages to run (default all)")
+    parser.add_argument("--iterations", type=int, default=Benchmark.DEFAULT_ITERATIONS, help="Timed iterations per stage")
+    parser.add_argument("--baseline", help="Compare against this saved baseline; exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=Benchmark.DEFAULT_THRESHOLD * 100, help="Slowdown in percent that counts as a regression (default 10)")
+    parser.add_argument("--save-baseline", help="Save the results to this file")
+    add_synth_args(parser)
+    args = parser.parse_args(argv)
+    bench = Benchmark(ipa_path=args.ipa, synth_options=synth_options(args), stages=args.stages, iterations=args.iterations)
+    report = bench.run()
+    rows = None
+    regressions = []
+    if args.baseline is not None:
+        baseline = Benchmark.load(args.baseline)
+        if baseline.get('config') != report['config']:
+            print('Warning: the baseline was recorded with a different configuration', file=sys.stderr)
+        rows, regressions = Benchmark.compare(report, baseline, args.threshold / 100)
+    print(Benchmark.format_report(report, rows))
+    if args.save_baseline is not None:
+        Benchmark.save(report, args.save_baseline)
+        print('Saved baseline to {0}'.format(args.save_baseline))
+    if regressions:
+        print('Regressions: {0}'.format(', '.join(regressions)), file=sys.stderr)
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        exit(run_batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        exit(run_serve(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'index':
+        exit(run_index(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        exit(run_query(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'diff':
+        exit(run_diff(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'profiles':
+        exit(run_profiles(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'sizes':
+        exit(run_sizes(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'duplicates':
+        exit(run_duplicates(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'symbols':
+        exit(run_symbols(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'validate':
+        exit(run_validate(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'synth':
+        exit(run_synth(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        exit(run_bench(sys.argv[2:]))
     res = validate_args()
     if res[0]:
-        tempdir_obj = None
-        src_path = res[1]
-        if res[2] is None:
-            tempdir_obj = tempfile.TemporaryDirectory(prefix='vipa_')
-            dest_path = tempdir_obj.name
-        else:
-            dest_path = res[2]
-        print('Temporary directory path: {0}'.format(dest_path))
-        # top level object
-        top_level = {}
-        root_obj = {}
-        # Unpack the zip file
-        ipa_unpacker = Unpack(src_path, dest_path)
-        ipa_unpacker.unpack_ipa()
-        # Validate the structure and find various paths
-        ipa_val = Validate(dest_path)
-        ipa_val.validate_structure()
-        plist_dict = ipa_val.extract_plist()
-        #print('dict: {0}'.format(plist_dict))
-        # Extract metadata from Info.plist
-        info_p = PlistScanner(plist_dict)
-        app_meta = info_p.dump_info()
-        root_obj['app_meta'] = app_meta
-        #
-        app_dir = ipa_val.app_dir
-        ret = ipa_unpacker.extract_provisioning_info(app_dir)
-        print('Return code from extract prov info: {0}'.format(ret[0]))
-        if ret[0] == 0:
-            embedded_plist_dict = ipa_val.extract_provisioning_plist(ret[1])
-            embedded_pscan = EmbeddedProvisioningPlistScanner(embedded_plist_dict)
-            prov_info = embedded_pscan.dump_info()
-            root_obj['provisioning_info'] = prov_info
-            ipa_val.validate_provisioning_plist(embedded_plist_dict)
-            # TODO - validate the binary
-            #ipa_val.parse_mach_header()
-        # Get info on the binary files
-        binary_name = ipa_val.executable_name
-        binary_path = ipa_val.executable_path
-        macho = MachO(binary_path, binary_name)
-        mach_info = macho.get_mach_info()
-        root_obj['binary_info'] = mach_info
-        # Form the top level object
-        top_level['ipa_info'] = root_obj
-        print('ipa info: {0}'.format(top_level))
-        # Finally, clean up our mess
-        ipa_unpacker.cleanup_dest()
-        if tempdir_obj is not None:
-            tempdir_obj.cleanup()
+        args = res[1]
+        cache = None
+        if args.cache is not None:
+            cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+        ipa_analyzer = IpaAnalyzer(args.input, dest_path=args.unpack, in_archive=args.in_archive, cache=cache,
+                                   metrics=args.metrics, verify_pages=args.verify_pages, clean_dest=args.clean,
+                                   read_signatures=args.signatures)
+        # Progress goes to stderr so stdout is just the JSON result
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.profile is not None:
+                profiler = cProfile.Profile()
+                top_level = profiler.runcall(ipa_analyzer.analyze)
+                profiler.dump_stats(args.profile)
+                print('Profile written to {0}'.format(args.profile))
+            else:
+                top_level = ipa_analyzer.analyze()
+        JsonWriter(sys.stdout, indent=2).write_line(top_level)
         exit(0)
     else:
         exit(1)
@@ -0,0 +1,22 @@
+"""
+Fixtures shared by the tests. Everything is built with ipa_util.synth, nothing is read from sample_files.
+Run from the repository root with python -m pytest, so ipa_util is importable.
+"""
+import pytest
+
+from ipa_util.synth import SyntheticIpa
+
+
+def small_ipa(**kwargs):
+    """
+    A SyntheticIpa cut down to a size the tests can build in a few milliseconds
+    """
+    options = dict(asset_count=3, asset_size=1024, framework_count=2, executable_size=20000, device_count=3,
+                   url_scheme_count=2, symbol_count=40)
+    options.update(kwargs)
+    return SyntheticIpa(**options)
+
+
+@pytest.fixture(scope='session')
+def ipa_path(tmp_path_factory):
+    return small_ipa().write(tmp_path_factory.mktemp('ipa') / 'SynthApp.ipa')
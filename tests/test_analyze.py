@@ -0,0 +1,74 @@
+import pytest
+
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.cache import ResultCache
+from ipa_util.mach_o import MachO
+from ipa_util.result import dumps
+
+from conftest import small_ipa
+
+
+@pytest.mark.parametrize('verify_pages', [False, True])
+@pytest.mark.parametrize('layout', ['fat', 'thin64_be'])
+def test_in_archive_matches_unpacked(tmp_path, layout, verify_pages):
+    ipa_path = small_ipa(executable_layout=layout, plist_format='xml').write(tmp_path / 'SynthApp.ipa')
+    in_archive = IpaAnalyzer(ipa_path, in_archive=True, verify_pages=verify_pages).analyze()
+    unpacked = IpaAnalyzer(ipa_path, dest_path=tmp_path / 'unpacked', verify_pages=verify_pages).analyze()
+    assert dumps(in_archive) == dumps(unpacked)
+
+
+def test_result(ipa_path):
+    ipa_info = IpaAnalyzer(ipa_path, in_archive=True, verify_pages=True).analyze()['ipa_info']
+    assert ipa_info['CFBundleIdentifier'] == 'com.acme.synthapp'
+    assert ipa_info['distribution_type'] == 'adhoc'
+    assert ipa_info['profile_is_expired'] is False
+    assert ipa_info['binary_info']['binary_name'] == 'SynthApp'
+    for arch_slice in ipa_info['binary_info']['arch_slices']:
+        assert arch_slice['code_signature']['pages']['valid'] is True
+    assert sorted(binary['path'] for binary in ipa_info['bundle_binaries']) == [
+        'Frameworks/Fw0.framework/Fw0', 'Frameworks/Fw1.framework/Fw1', 'SynthApp']
+    assert all(binary['valid'] for binary in ipa_info['bundle_binaries'])
+
+
+def test_cache(tmp_path, ipa_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    first = IpaAnalyzer(ipa_path, in_archive=True, cache=cache).analyze()
+    cached = IpaAnalyzer(ipa_path, in_archive=True, cache=cache).analyze()
+    assert dumps(cached) == dumps(first)
+    # Verifying the pages adds to the result, so it's cached separately
+    verified = IpaAnalyzer(ipa_path, in_archive=True, cache=cache, verify_pages=True).analyze()
+    assert 'pages' in verified['ipa_info']['binary_info']['arch_slices'][0]['code_signature']
+    assert 'pages' not in cached['ipa_info']['binary_info']['arch_slices'][0]['code_signature']
+
+
+
+@pytest.mark.parametrize('read_signatures', [False, True])
+def test_signature_read_on_request(tmp_path, read_signatures):
+    ipa = small_ipa(executable_layout='thin64', executable_size=256 * 1024, framework_count=0)
+    ipa_path = ipa.write(tmp_path / 'SynthApp.ipa')
+    top_level = IpaAnalyzer(ipa_path, in_archive=True, metrics=True, trace_memory=False,
+                            read_signatures=read_signatures).analyze()
+    code_signature = top_level['ipa_info']['binary_info']['arch_slices'][0]['code_signature']
+    assert ('entitlements' in code_signature) is read_signatures
+    decompressed = top_level['metrics']['stages']['mach_o']['bytes_decompressed']
+    # The signature is at the end of the executable, the headers at the start
+    if read_signatures:
+        assert decompressed >= 256 * 1024
+    else:
+        assert decompressed < 64 * 1024
+
+
+def test_main_executable_analyzed_once(monkeypatch, ipa_path):
+    analyzed = []
+    get_mach_info = MachO.get_mach_info
+
+    def counting(macho, *args, **kwargs):
+        info = get_mach_info(macho, *args, **kwargs)
+        analyzed.append(info['binary_name'])
+        return info
+    monkeypatch.setattr(MachO, 'get_mach_info', counting)
+    ipa_info = IpaAnalyzer(ipa_path, in_archive=True, verify_pages=True).analyze()['ipa_info']
+    assert sorted(analyzed) == ['Fw0', 'Fw1', 'SynthApp']
+    main_binary = [binary for binary in ipa_info['bundle_binaries'] if binary['path'] == 'SynthApp'][0]
+    assert main_binary['binary_info'] is ipa_info['binary_info']
+    assert main_binary['valid'] is True
@@ -0,0 +1,51 @@
+import io
+import json
+
+from ipa_util.batch import BatchRunner, analyze_one
+
+from conftest import small_ipa
+
+
+def test_run_writes_a_record_per_build(tmp_path, ipa_path):
+    not_a_zip = tmp_path / 'broken.ipa'
+    not_a_zip.write_bytes(b'not a zip file')
+    missing = tmp_path / 'missing.ipa'
+    runner = BatchRunner(workers=1)
+    out_fp = io.StringIO()
+    runner.run([str(ipa_path), str(not_a_zip), str(missing)], out_fp)
+    records = {record['path']: record for record in map(json.loads, out_fp.getvalue().splitlines())}
+    assert len(records) == 3
+    assert records[str(ipa_path)]['ipa_info']['CFBundleIdentifier'] == 'com.acme.synthapp'
+    assert 'error' not in records[str(ipa_path)]
+    assert records[str(not_a_zip)]['error_type'] == 'BadZipFile'
+    assert records[str(missing)]['error_type'] == 'FileNotFoundError'
+    assert records[str(missing)]['error']
+    assert (runner.ok_count, runner.error_count) == (1, 2)
+
+
+def test_run_with_few_pending(tmp_path):
+    paths = [str(small_ipa(seed=seed).write(tmp_path / 'App{0}.ipa'.format(seed))) for seed in range(3)]
+    runner = BatchRunner(workers=1, max_pending=1)
+    out_fp = io.StringIO()
+    runner.run(paths, out_fp)
+    assert sorted(json.loads(line)['path'] for line in out_fp.getvalue().splitlines()) == paths
+    assert (runner.ok_count, runner.error_count) == (3, 0)
+
+
+def test_analyze_one_error_record(tmp_path):
+    not_a_zip = tmp_path / 'broken.ipa'
+    not_a_zip.write_bytes(b'not a zip file')
+    record = analyze_one(str(not_a_zip), cache_path=str(tmp_path / 'cache.db'))
+    assert record['path'] == str(not_a_zip)
+    assert record['error_type'] == 'BadZipFile'
+    assert 'ipa_info' not in record
+
+
+def test_iter_ipa_paths(tmp_path):
+    (tmp_path / 'b').mkdir()
+    for name in ('b/two.ipa', 'one.IPA', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    stdin = io.StringIO('from_stdin.ipa\n\n  other.ipa \n')
+    paths = list(BatchRunner.iter_ipa_paths([str(tmp_path), '-', 'named.ipa'], stdin))
+    assert paths == [str(tmp_path / 'one.IPA'), str(tmp_path / 'b' / 'two.ipa'), 'from_stdin.ipa', 'other.ipa',
+                     'named.ipa']
@@ -0,0 +1,65 @@
+import zipfile
+
+import ipa_util
+from ipa_util.cache import ResultCache
+from ipa_util.result import dumps
+
+from conftest import small_ipa
+
+
+def key_for(ipa_path, **kwargs):
+    with zipfile.ZipFile(ipa_path) as ipa_zip:
+        return ResultCache.cache_key(ipa_zip, **kwargs)
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(tmp_path / 'cache.db')
+    assert cache.get('key') is None
+    cache.put('key', {'ipa_info': {'CFBundleIdentifier': 'com.acme.synthapp'}, 'count': 3})
+    assert cache.get('key') == {'ipa_info': {'CFBundleIdentifier': 'com.acme.synthapp'}, 'count': 3}
+    cache.close()
+    # It's persistent
+    cache = ResultCache(tmp_path / 'cache.db')
+    assert cache.get('key')['count'] == 3
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    value = {'data': 'x' * 100}
+    size = len(dumps(value))
+    # Room for three entries, and evicting one gets back under the low-water mark
+    cache = ResultCache(tmp_path / 'cache.db', max_bytes=size * 3 + size // 2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, value)
+    # Reading a makes b the least recently used
+    assert cache.get('a') is not None
+    cache.put('d', value)
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in ('a', 'c', 'd'))
+    # Replacing an entry doesn't count its old size
+    cache.put('d', value)
+    assert all(cache.get(key) is not None for key in ('a', 'c', 'd'))
+    cache.close()
+
+
+def test_expiry_recomputed_on_get(tmp_path):
+    cache = ResultCache(tmp_path / 'cache.db')
+    cache.put('key', {'ipa_info': {'ExpirationDate': '2001-01-01T00:00:00Z', 'profile_is_expired': False}})
+    assert cache.get('key')['ipa_info']['profile_is_expired'] is True
+    cache.close()
+
+
+def test_key_invalidation(tmp_path, ipa_path, monkeypatch):
+    key = key_for(ipa_path)
+    assert key == key_for(ipa_path)
+    other_keys = [key_for(ipa_path, verify_pages=True), key_for(ipa_path, read_signatures=True),
+                  key_for(small_ipa(seed=1).write(tmp_path / 'Changed.ipa'))]
+    monkeypatch.setattr(ipa_util.cache, '__version__', '0.0.0')
+    other_keys.append(key_for(ipa_path))
+    assert len({key, *other_keys}) == 5
+
+
+def test_no_key_without_payload(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'other.zip', 'w') as out_zip:
+        out_zip.writestr('readme.txt', 'hello')
+    assert key_for(tmp_path / 'other.zip') is None
@@ -0,0 +1,68 @@
+import plistlib
+
+import pytest
+
+from ipa_util.cms import Certificate, DerReader, SignedData
+from ipa_util.synth import DerWriter
+
+from conftest import small_ipa
+
+APPLE_CA = {'CN': 'Apple iPhone Certification Authority', 'O': 'Apple Inc.', 'C': 'US'}
+PROFILE_SIGNER = {'CN': 'Apple iPhone OS Provisioning Profile Signing', 'O': 'Apple Inc.', 'C': 'US'}
+
+
+def test_der_values():
+    w = DerWriter
+    data = w.seq(w.integer(0), w.integer(-129), w.integer(2 ** 70), w.oid('1.2.840.113549.1.7.2'),
+                 w.octets(b'\x00' * 200), w.utf8('Ünïcode'), w.null())
+    reader = DerReader(data)
+    values = reader.child_list(reader.root())
+    assert [reader.integer(elem) for elem in values[:3]] == [0, -129, 2 ** 70]
+    assert reader.oid(values[3]) == '1.2.840.113549.1.7.2'
+    assert reader.octets(values[4]) == b'\x00' * 200
+    assert reader.string(values[5]) == 'Ünïcode'
+    assert reader.raw(values[6]) == b'\x05\x00'
+
+
+def test_truncated():
+    data = DerWriter.seq(DerWriter.octets(b'x' * 300))
+    with pytest.raises(Exception):
+        reader = DerReader(data[:100])
+        reader.child_list(reader.root())
+
+
+def test_mobileprovision():
+    ipa = small_ipa()
+    signed_data = SignedData(ipa.mobileprovision())
+    profile = plistlib.loads(signed_data.content)
+    assert profile['AppIDName'] == 'SynthApp'
+    assert profile['TeamIdentifier'] == [ipa.TEAM_ID]
+    assert len(profile['ProvisionedDevices']) == 3
+    reader = DerReader(profile['DeveloperCertificates'][0])
+    assert Certificate(reader, reader.root()).subject == ipa.developer_name()
+
+
+def test_signer_chain():
+    chain = SignedData(small_ipa().mobileprovision()).signer_chain()
+    assert [cert.subject for cert in chain] == [PROFILE_SIGNER, APPLE_CA]
+    assert [cert.issuer for cert in chain] == [APPLE_CA, APPLE_CA]
+    info = chain[0].dump_info()
+    assert info['subject'] == PROFILE_SIGNER
+    assert info['not_before'] == '2024-01-01T00:00:00Z'
+    assert info['not_after'] == '2043-12-27T00:00:00Z'
+    assert 'team_identifier' not in info
+
+
+def test_developer_certificate():
+    ipa = small_ipa()
+    reader = DerReader(ipa.certificate(ipa.developer_name(), ipa.developer_name(), serial=0x1234))
+    cert = Certificate(reader, reader.root())
+    assert cert.serial_number == 0x1234
+    assert cert.team_identifier == ipa.TEAM_ID
+    assert cert.dump_info()['serial_number'] == '1234'
+
+
+def test_not_signed_data():
+    w = DerWriter
+    with pytest.raises(Exception):
+        SignedData(w.seq(w.oid('1.2.840.113549.1.7.1'), w.context(0, w.octets(b'plain'))))
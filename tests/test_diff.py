@@ -0,0 +1,82 @@
+import plistlib
+import zipfile
+
+from ipa_util.diff import BuildDiff
+
+from conftest import small_ipa
+
+
+def with_bundle_id(ipa, bundle_id):
+    """
+    Change the Info.plist bundle id only, so it no longer matches the profile
+    """
+    info_plist = ipa.info_plist
+
+    def changed_info_plist():
+        info = plistlib.loads(info_plist())
+        info['CFBundleIdentifier'] = bundle_id
+        return plistlib.dumps(info)
+    ipa.info_plist = changed_info_plist
+    return ipa
+
+
+def test_same_build(ipa_path):
+    delta = BuildDiff(ipa_path, ipa_path).diff()
+    assert delta['files']['added'] == delta['files']['removed'] == delta['files']['changed'] == []
+    assert delta['files']['size_delta'] == 0
+    assert delta['info_plist'] is None
+    assert delta['provisioning'] is None
+    assert delta['binaries'] == {}
+    assert delta['validation'] == []
+
+
+def test_only_changed_members_read(tmp_path, monkeypatch):
+    old_path = small_ipa().write(tmp_path / 'old.ipa')
+    new_path = small_ipa(url_scheme_count=3).write(tmp_path / 'new.ipa')
+    opened = []
+    zip_open = zipfile.ZipFile.open
+
+    def recording_open(self, name, *args, **kwargs):
+        opened.append(getattr(name, 'filename', name))
+        return zip_open(self, name, *args, **kwargs)
+    monkeypatch.setattr(zipfile.ZipFile, 'open', recording_open)
+    delta = BuildDiff(old_path, new_path).diff()
+    assert [entry['name'] for entry in delta['files']['changed']] == ['Info.plist']
+    assert delta['files']['unchanged_count'] == 9
+    assert list(delta['info_plist']['changed']) == ['CFBundleURLTypes']
+    assert len(delta['info_plist']['changed']['CFBundleURLTypes']['new']) == 3
+    assert delta['provisioning'] is None
+    # Re-validating the app id reads the new profile too, but no binary or asset is opened
+    assert not [name for name in opened if not name.endswith(('Info.plist', 'embedded.mobileprovision'))]
+
+
+def test_changed_binaries(tmp_path):
+    old_path = small_ipa().write(tmp_path / 'old.ipa')
+    new_path = small_ipa(executable_layout='thin64', framework_count=3).write(tmp_path / 'new.ipa')
+    delta = BuildDiff(old_path, new_path).diff()
+    assert [entry['name'] for entry in delta['files']['added']] == [
+        'Frameworks/Fw2.framework/Fw2', 'Frameworks/Fw2.framework/Info.plist']
+    assert delta['files']['removed'] == []
+    executable = next(entry for entry in delta['files']['changed'] if entry['name'] == 'SynthApp')
+    assert executable['size_delta'] == executable['new_size'] - executable['old_size'] < 0
+    binary = delta['binaries']['SynthApp']
+    assert binary['binary_type'] == {'old': 'fat_binary', 'new': 'mach_64_binary'}
+    assert binary['removed'] == ['arm armv7']
+    assert binary['changed']['arm64']['dylibs']['new'][-2:] == [
+        '@rpath/Fw2.framework/Fw2', '/System/Library/Frameworks/AppTrackingTransparency.framework/AppTrackingTransparency']
+    assert delta['provisioning'] is None
+    assert delta['validation'] == []
+
+
+def test_validation_of_changed_parts(tmp_path):
+    old_path = small_ipa().write(tmp_path / 'old.ipa')
+    new_path = with_bundle_id(small_ipa(), 'com.other.app').write(tmp_path / 'new.ipa')
+    delta = BuildDiff(old_path, new_path).diff()
+    assert delta['info_plist']['changed'] == {'CFBundleIdentifier': {'old': 'com.acme.synthapp', 'new': 'com.other.app'}}
+    assert len(delta['validation']) == 1
+    assert 'app ID' in delta['validation'][0]
+
+
+def test_diff_dicts():
+    delta = BuildDiff.diff_dicts({'a': 1, 'b': 2, 'c': [1]}, {'b': 3, 'c': [1], 'd': 4})
+    assert delta == {'added': {'d': 4}, 'removed': {'a': 1}, 'changed': {'b': {'old': 2, 'new': 3}}}
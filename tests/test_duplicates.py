@@ -0,0 +1,88 @@
+import os
+import zlib
+import zipfile
+
+import pytest
+
+from ipa_util.duplicates import DuplicateReport
+
+
+def forge_crc(prefix, target_crc):
+    """
+    :return: prefix plus 4 bytes chosen so the CRC32 of the whole is target_crc. CRC32 over a fixed length is affine
+             in the input bits, so the 4 bytes come from solving a 32 bit linear system.
+    """
+    base = zlib.crc32(prefix + b'\0\0\0\0')
+    # Row i: the CRC change from flipping bit i of the suffix, augmented with that bit
+    rows = [(zlib.crc32(prefix + (1 << i).to_bytes(4, 'little')) ^ base, 1 << i) for i in range(32)]
+    wanted = base ^ target_crc
+    suffix = 0
+    for bit in range(32):
+        pivot = next(ix for ix, row in enumerate(rows) if row[0] >> bit & 1)
+        pivot_row = rows.pop(pivot)
+        rows = [(row[0] ^ pivot_row[0], row[1] ^ pivot_row[1]) if row[0] >> bit & 1 else row for row in rows]
+        if wanted >> bit & 1:
+            wanted ^= pivot_row[0]
+            suffix ^= pivot_row[1]
+    return prefix + suffix.to_bytes(4, 'little')
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as out_zip:
+        for name, data, compression in members:
+            out_zip.writestr(zipfile.ZipInfo(name), data, compression)
+    return path
+
+
+def test_duplicates(tmp_path):
+    asset = os.urandom(3000) + b'\0' * 3000
+    other = os.urandom(2000)
+    collides = forge_crc(os.urandom(len(other) - 4), zlib.crc32(other))
+    assert zlib.crc32(collides) == zlib.crc32(other) and collides != other
+    zip_path = write_zip(tmp_path / 'dups.ipa', [
+        ('Payload/App.app/a.png', asset, zipfile.ZIP_DEFLATED),
+        ('Payload/App.app/Copy.bundle/a.png', asset, zipfile.ZIP_STORED),
+        ('Payload/App.app/PlugIns/Ext.appex/a.png', asset, zipfile.ZIP_DEFLATED),
+        ('Payload/App.app/other.bin', other, zipfile.ZIP_STORED),
+        ('Payload/App.app/collides.bin', collides, zipfile.ZIP_STORED),
+        ('Payload/App.app/small1', b'xy', zipfile.ZIP_STORED),
+        ('Payload/App.app/small2', b'xy', zipfile.ZIP_STORED),
+        ('Payload/App.app/unique.txt', b'just the one', zipfile.ZIP_DEFLATED),
+        ('Payload/App.app/empty1', b'', zipfile.ZIP_STORED),
+        ('Payload/App.app/empty2', b'', zipfile.ZIP_STORED),
+    ])
+    report = DuplicateReport(str(zip_path), min_size=2, max_workers=2).report()
+    assert report['file_count'] == 8
+    # Same size and CRC32 gets hashed, but only equal digests are duplicates
+    assert report['candidate_count'] == 7
+    assert report['hashed_bytes'] == 3 * len(asset) + 2 * len(other) + 2 * 2
+    asset_set, small_set = report['duplicates']
+    assert asset_set['files'] == ['Payload/App.app/Copy.bundle/a.png', 'Payload/App.app/PlugIns/Ext.appex/a.png',
+                                  'Payload/App.app/a.png']
+    assert (asset_set['count'], asset_set['size'], asset_set['wasted_bytes']) == (3, len(asset), 2 * len(asset))
+    with zipfile.ZipFile(zip_path) as in_zip:
+        compressed = sorted(in_zip.getinfo(name).compress_size for name in asset_set['files'])
+    # Every copy but the best compressed one is wasted download
+    assert asset_set['wasted_compressed_bytes'] == sum(compressed[1:])
+    assert small_set['files'] == ['Payload/App.app/small1', 'Payload/App.app/small2']
+    assert report['wasted_bytes'] == 2 * len(asset) + 2
+    text = DuplicateReport.format_report(report)
+    assert '8 files, 7 hashed' in text
+    assert '    Payload/App.app/small2' in text
+
+
+def test_min_size(tmp_path):
+    zip_path = write_zip(tmp_path / 'small.ipa', [('a', b'xy', zipfile.ZIP_STORED), ('b', b'xy', zipfile.ZIP_STORED),
+                                                  ('c', b'xyz', zipfile.ZIP_STORED)])
+    report = DuplicateReport(str(zip_path), min_size=3).report()
+    assert (report['file_count'], report['candidate_count'], report['duplicates']) == (1, 0, [])
+
+
+def test_repeated_name_is_one_file(tmp_path):
+    zip_path = tmp_path / 'repeated.ipa'
+    with zipfile.ZipFile(zip_path, 'w') as out_zip:
+        out_zip.writestr('a', b'same')
+        with pytest.warns(UserWarning):
+            out_zip.writestr('a', b'same')
+    report = DuplicateReport(str(zip_path)).report()
+    assert (report['file_count'], report['duplicates']) == (1, [])
@@ -0,0 +1,92 @@
+import os
+import plistlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from ipa_util.index import BuildIndex
+from ipa_util.synth import SyntheticIpa
+
+from conftest import small_ipa
+
+
+def expiring_ipa(days, **kwargs):
+    """
+    A small_ipa whose profile expires the given number of days from now
+    """
+    ipa = small_ipa(**kwargs)
+    profile_plist = ipa.profile_plist
+
+    def expiring_profile_plist():
+        prov = plistlib.loads(profile_plist())
+        prov['ExpirationDate'] = datetime.now().replace(microsecond=0) + timedelta(days=days)
+        return plistlib.dumps(prov)
+    ipa.profile_plist = expiring_profile_plist
+    return ipa
+
+
+@pytest.fixture
+def builds(tmp_path):
+    paths = {}
+    paths['good'] = str(small_ipa().write(tmp_path / 'Good.ipa'))
+    paths['soon'] = str(expiring_ipa(10, bundle_id='com.acme.soon', executable_layout='thin64')
+                        .write(tmp_path / 'Soon.ipa'))
+    paths['expired'] = str(expiring_ipa(-10, bundle_id='com.acme.expired').write(tmp_path / 'Expired.ipa'))
+    paths['broken'] = str(tmp_path / 'Broken.ipa')
+    with open(paths['broken'], 'wb') as fp:
+        fp.write(b'not a zip file')
+    return paths
+
+
+def query_paths(build_index, **kwargs):
+    return [row['path'] for row in build_index.query(**kwargs)]
+
+
+def test_index_and_query(tmp_path, builds):
+    build_index = BuildIndex(tmp_path / 'index.db')
+    build_index.index(sorted(builds.values()), workers=1, batch_size=2)
+    assert (build_index.indexed_count, build_index.unchanged_count, build_index.error_count) == (3, 0, 1)
+    assert query_paths(build_index, errors=True) == [builds['broken']]
+    assert query_paths(build_index, errors=False) == [builds['expired'], builds['good'], builds['soon']]
+    assert query_paths(build_index, expires_within=30) == [builds['soon']]
+    assert query_paths(build_index, expires_within=365 * 30) == [builds['good'], builds['soon']]
+    assert query_paths(build_index, expired=True) == [builds['expired']]
+    assert query_paths(build_index, expired=False) == [builds['good'], builds['soon']]
+    assert query_paths(build_index, bundle_id='com.acme.soon', team_id=SyntheticIpa.TEAM_ID) == [builds['soon']]
+    assert query_paths(build_index, bundle_id='com.acme.soon', team_id='OTHERTEAM') == []
+    # The fat executables ship armv7, the thin one doesn't
+    assert query_paths(build_index, arch='armv7') == [builds['expired'], builds['good']]
+    assert query_paths(build_index, arch='arm64') == [builds['expired'], builds['good'], builds['soon']]
+    assert query_paths(build_index, errors=False, limit=1) == [builds['expired']]
+    row = build_index.query(errors=True)[0]
+    assert row['error'] and row['bundle_id'] is None
+    build_index.close()
+
+
+def test_unchanged_builds_skipped(tmp_path, builds):
+    paths = [builds['good'], builds['soon']]
+    build_index = BuildIndex(tmp_path / 'index.db')
+    build_index.index(paths, workers=1)
+    build_index.close()
+
+    # Same size and mtime: not even opened
+    build_index = BuildIndex(tmp_path / 'index.db')
+    build_index.index(paths, workers=1)
+    assert (build_index.indexed_count, build_index.unchanged_count) == (0, 2)
+    build_index.close()
+
+    # Touched but the same central directory: fingerprinted, not re-analyzed
+    os.utime(builds['good'], (0, 0))
+    small_ipa(bundle_id='com.acme.changed').write(builds['soon'])
+    build_index = BuildIndex(tmp_path / 'index.db')
+    build_index.index(paths, workers=1)
+    assert (build_index.indexed_count, build_index.unchanged_count) == (1, 1)
+    assert query_paths(build_index, bundle_id='com.acme.changed') == [builds['soon']]
+    assert len(build_index.query()) == 2
+    build_index.close()
+
+    # The touched build's new mtime was recorded
+    build_index = BuildIndex(tmp_path / 'index.db')
+    build_index.index(paths, workers=1)
+    assert (build_index.indexed_count, build_index.unchanged_count) == (0, 2)
+    build_index.close()
@@ -0,0 +1,75 @@
+import io
+import plistlib
+from datetime import datetime
+
+import pytest
+
+from ipa_util.lazy_plist import LazyPlist
+
+from conftest import small_ipa
+
+SAMPLE = {
+    'string': 'héllo & <world>',
+    'empty_string': '',
+    'integer': 42,
+    'negative': -7,
+    'big': 2 ** 62,
+    'real': 1.5,
+    'true': True,
+    'false': False,
+    'date': datetime(2024, 2, 29, 12, 30, 15),
+    'data': b'\x00\x01binary\xff',
+    'array': [1, 'two', [3.0], {'four': 4}],
+    'empty_array': [],
+    'dict': {'nested': {'deeper': ['x']}, 'flag': False},
+    'empty_dict': {},
+}
+FORMATS = {'binary': plistlib.FMT_BINARY, 'xml': plistlib.FMT_XML}
+
+
+@pytest.mark.parametrize('fmt', sorted(FORMATS))
+def test_matches_plistlib(fmt):
+    data = plistlib.dumps(SAMPLE, fmt=FORMATS[fmt])
+    lazy = LazyPlist(data)
+    assert list(lazy) == list(plistlib.loads(data))
+    assert len(lazy) == len(SAMPLE)
+    for key in SAMPLE:
+        assert lazy[key] == SAMPLE[key]
+    assert lazy.to_dict() == plistlib.loads(data)
+    assert 'missing' not in lazy
+    assert lazy.get('missing') is None
+
+
+@pytest.mark.parametrize('fmt', sorted(FORMATS))
+def test_synthetic_plists(fmt):
+    ipa = small_ipa(plist_format=fmt, url_scheme_count=50)
+    for data in (ipa.info_plist(), ipa.profile_plist()):
+        assert LazyPlist(data).to_dict() == plistlib.loads(data)
+
+
+def test_load():
+    data = plistlib.dumps(SAMPLE, fmt=plistlib.FMT_BINARY)
+    assert LazyPlist.load(io.BytesIO(data)).to_dict() == SAMPLE
+
+
+@pytest.mark.parametrize('data', [
+    # Markup the XML scanner leaves to plistlib
+    b'<?xml version="1.0" encoding="UTF-8"?><plist version="1.0"><dict><!-- note --><key>a</key>'
+    b'<string>1</string></dict></plist>',
+    b'<?xml version="1.0" encoding="UTF-8"?><plist version="1.0"><dict><key>a&amp;b</key><true/></dict></plist>',
+    b'<plist version="1.0"><dict/></plist>',
+])
+def test_xml_fallbacks(data):
+    assert LazyPlist(data).to_dict() == plistlib.loads(data)
+
+
+@pytest.mark.parametrize('fmt', sorted(FORMATS))
+def test_root_must_be_a_dict(fmt):
+    with pytest.raises(Exception):
+        LazyPlist(plistlib.dumps(['not', 'a', 'dict'], fmt=FORMATS[fmt]))
+
+
+def test_corrupt_binary_plist():
+    data = plistlib.dumps(SAMPLE, fmt=plistlib.FMT_BINARY)
+    with pytest.raises(Exception):
+        LazyPlist(data[:len(data) // 2])
@@ -0,0 +1,199 @@
+import random
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ipa_util.codesign import CodeDirectory
+from ipa_util.mach_o import MachO
+from ipa_util.synth import SyntheticMachO
+
+DYLIBS = ['/usr/lib/libSystem.B.dylib', '@rpath/Fw0.framework/Fw0']
+WEAK_DYLIBS = ['/System/Library/Frameworks/AppTrackingTransparency.framework/AppTrackingTransparency']
+ENTITLEMENTS = {'application-identifier': 'XYZ1234567.com.acme.test', 'get-task-allow': False}
+SYMBOLS = (['_objc_msgSend', '_OBJC_CLASS_$_NSObject', '_dlopen'], ['_main', '_OBJC_CLASS_$_AppDelegate'])
+SLICE_SIZE = 20000
+# Layout => (binary type, [(cpu type, cpu subtype)])
+EXPECTED = {
+    'thin32': ('mach_o_binary', [('arm', 'armv7')]),
+    'thin64': ('mach_64_binary', [('arm64', '')]),
+    'thin32_be': ('mach_o_binary', [('arm', 'armv7')]),
+    'thin64_be': ('mach_64_binary', [('arm64', '')]),
+    'fat': ('fat_binary', [('arm', 'armv7'), ('arm64', '')]),
+    'fat64': ('fat_binary', [('arm', 'armv7'), ('arm64', '')]),
+}
+
+
+def build(layout, size=SLICE_SIZE, **kwargs):
+    options = dict(dylibs=DYLIBS, identifier='com.acme.test', team_id='XYZ1234567', entitlements=ENTITLEMENTS,
+                   weak_dylibs=WEAK_DYLIBS, symbols=SYMBOLS)
+    options.update(kwargs)
+    return SyntheticMachO(random.Random(0), **options).build(layout, size)
+
+
+@pytest.fixture
+def write_binary(tmp_path):
+    def write(layout, data=None):
+        path = tmp_path / layout
+        path.write_bytes(build(layout) if data is None else data)
+        return path
+    return write
+
+
+def test_every_layout_is_covered():
+    assert sorted(EXPECTED) == sorted(SyntheticMachO.LAYOUTS)
+
+
+@pytest.mark.parametrize('layout', SyntheticMachO.LAYOUTS)
+def test_layout(write_binary, layout):
+    binary_type, archs = EXPECTED[layout]
+    info = MachO(write_binary(layout), 'Test').get_mach_info(verify_pages=True)
+    assert info['binary_name'] == 'Test'
+    assert info['binary_type'] == binary_type
+    assert [(s['cpu_type'], s['cpu_subtype']) for s in info['arch_slices']] == archs
+    for arch_slice in info['arch_slices']:
+        assert arch_slice['file_type'] == 'execute'
+        assert arch_slice['platform'] == 'ios'
+        assert arch_slice['min_os'] == '12.0.0'
+        assert arch_slice['sdk'] == '17.0.0'
+        assert arch_slice['cryptid'] == 0
+        assert [segment['name'] for segment in arch_slice['segments']] == ['__PAGEZERO', '__TEXT', '__LINKEDIT']
+        assert arch_slice['dylibs'] == DYLIBS + WEAK_DYLIBS
+        code_signature = arch_slice['code_signature']
+        assert code_signature['identifier'] == 'com.acme.test'
+        assert code_signature['team_id'] == 'XYZ1234567'
+        assert code_signature['hash_type'] == 'sha256'
+        assert code_signature['signed'] is False
+        assert code_signature['requirements'] == ['designated']
+        assert code_signature['entitlements'] == ENTITLEMENTS
+        assert code_signature['blobs_valid'] == {'requirements': True, 'entitlements': True}
+        assert code_signature['pages']['valid'] is True
+        assert code_signature['pages']['bad_page_count'] == 0
+
+
+@pytest.mark.parametrize('layout', SyntheticMachO.LAYOUTS)
+def test_signature_not_read_by_default(write_binary, layout):
+    path = write_binary(layout)
+    located = MachO(path, 'Test').get_mach_info()
+    read = MachO(path, 'Test').get_mach_info(read_signature=True)
+    for located_slice, read_slice in zip(located['arch_slices'], read['arch_slices']):
+        assert sorted(located_slice['code_signature']) == ['offset', 'size']
+        assert located_slice['code_signature']['offset'] + located_slice['code_signature']['size'] <= located_slice['size']
+        assert read_slice['code_signature']['offset'] == located_slice['code_signature']['offset']
+        assert read_slice['code_signature']['blobs_valid'] == {'requirements': True, 'entitlements': True}
+        assert 'pages' not in read_slice['code_signature']
+
+
+@pytest.mark.parametrize('layout', SyntheticMachO.LAYOUTS)
+def test_symbol_table(write_binary, layout):
+    with MachO(write_binary(layout), 'Test') as macho:
+        for macho_slice in macho.slices():
+            assert macho_slice.symbol_table.undefined == SYMBOLS[0]
+            assert macho_slice.symbol_table.exported == SYMBOLS[1]
+
+
+@pytest.mark.parametrize('layout', SyntheticMachO.LAYOUTS)
+def test_headers_only(write_binary, layout):
+    info = MachO(write_binary(layout), 'Test').get_mach_info(load_commands=False)
+    for arch_slice in info['arch_slices']:
+        assert sorted(arch_slice) == ['cpu_subtype', 'cpu_type', 'offset', 'size']
+
+
+def test_unsigned(write_binary):
+    path = write_binary('thin64', build('thin64', identifier=None, symbols=None))
+    with MachO(path, 'Test') as macho:
+        macho_slice = macho.slices()[0]
+        assert macho_slice.code_signature is None
+        assert macho_slice.verify_pages() is None
+        assert macho_slice.symbol_table is None
+
+
+@pytest.mark.parametrize('layout', ['thin64_be', 'fat'])
+def test_tampered_page(write_binary, layout):
+    data = bytearray(build(layout))
+    with MachO(write_binary(layout, bytes(data)), 'Test') as macho:
+        # The second page of the last slice, well clear of the headers
+        offset = macho.slices()[-1].offset + 4096 + 10
+    data[offset] ^= 0xff
+    info = MachO(write_binary(layout, bytes(data)), 'Test').get_mach_info(verify_pages=True)
+    pages = info['arch_slices'][-1]['code_signature']['pages']
+    assert pages['valid'] is False
+    assert pages['bad_pages'] == [1]
+    if layout == 'fat':
+        assert info['arch_slices'][0]['code_signature']['pages']['valid'] is True
+
+
+def test_tampered_entitlements(write_binary):
+    data = build('thin64')
+    old = b'<key>get-task-allow</key>\n\t<false/>'
+    assert old in data
+    path = write_binary('thin64', data.replace(old, b'<key>get-task-allow</key>\n\t<true />'))
+    with MachO(path, 'Test') as macho:
+        code_sig = macho.slices()[0].code_signature
+        assert code_sig.entitlements['get-task-allow'] is True
+        assert code_sig.verify_blobs() == {'requirements': True, 'entitlements': False}
+
+
+class _FailingPool(ThreadPoolExecutor):
+    """
+    Refuses work after the first task
+    """
+
+    def __init__(self) -> None:
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        if self.submitted > 1:
+            raise RuntimeError('pool is full')
+        return super().submit(*args, **kwargs)
+
+
+def test_failed_submit_releases_views(write_binary):
+    # Enough pages for several chunks
+    path = write_binary('thin64', build('thin64', size=CodeDirectory.CHUNK_PAGES * 4096 * 3))
+    pool = _FailingPool()
+    try:
+        # get_mach_info() closes the file on the way out, which raises BufferError if a view was left behind
+        with pytest.raises(RuntimeError, match='pool is full'):
+            MachO(path, 'Test').get_mach_info(verify_pages=True, pool=pool)
+    finally:
+        pool.shutdown()
+
+
+def test_failed_chunk_keeps_the_first_error(monkeypatch, write_binary):
+    """
+    A task which failed while the submit loop was failing doesn't replace the submit's error
+    """
+    path = write_binary('thin64', build('thin64', size=CodeDirectory.CHUNK_PAGES * 4096 * 3))
+
+    def failing(code_dir, view, first_page):
+        view.release()
+        raise ValueError('chunk at page {0}'.format(first_page))
+    monkeypatch.setattr(CodeDirectory, '_hash_chunk', failing)
+    pool = _FailingPool()
+    try:
+        with pytest.raises(RuntimeError, match='pool is full'):
+            MachO(path, 'Test').get_mach_info(verify_pages=True, pool=pool)
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize('layout', SyntheticMachO.LAYOUTS)
+def test_in_archive(tmp_path, write_binary, layout):
+    """
+    A binary read out of a zip gives the same result as the same file on disk
+    """
+    path = write_binary(layout)
+    with zipfile.ZipFile(tmp_path / 'test.zip', 'w', zipfile.ZIP_DEFLATED) as test_zip:
+        test_zip.write(path, 'Test')
+    with zipfile.ZipFile(tmp_path / 'test.zip') as test_zip:
+        in_archive = MachO(zipfile.Path(test_zip, 'Test'), 'Test').get_mach_info(verify_pages=True)
+    assert in_archive.to_dict() == MachO(path, 'Test').get_mach_info(verify_pages=True).to_dict()
+
+
+def test_not_a_mach_o(write_binary):
+    with pytest.raises(Exception):
+        MachO(write_binary('junk', b'\x89PNG' * 64), 'Test').get_mach_info()
@@ -0,0 +1,89 @@
+import os
+import zipfile
+
+from ipa_util import metrics
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.metrics import MetricsRecorder, MeteredZipFile
+
+
+def write_zip(path, members, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, 'w', compression) as out_zip:
+        for name, data in members.items():
+            out_zip.writestr(name, data)
+    return path
+
+
+def test_no_recorder_is_a_no_op():
+    assert metrics.active() is None
+    with metrics.stage('anything'):
+        metrics.count('bytes_read', 10)
+
+
+def test_stages_and_counters():
+    with MetricsRecorder(trace_memory=False) as recorder:
+        assert metrics.active() is recorder
+        with metrics.stage('outer'):
+            with metrics.stage('inner'):
+                metrics.count('bytes_read', 5)
+                metrics.count('files_written')
+            metrics.count('bytes_read', 10)
+        with metrics.stage('inner'):
+            metrics.count('bytes_written', 7)
+        # Outside any stage it only adds to the total
+        metrics.count('files_skipped', 2)
+    assert metrics.active() is None
+    report = recorder.to_dict()
+    assert list(report['stages']) == ['outer', 'inner']
+    inner, outer = report['stages']['inner'], report['stages']['outer']
+    assert (inner['calls'], inner['bytes_read'], inner['files_written'], inner['bytes_written']) == (2, 5, 1, 7)
+    # Counts go to the innermost stage only
+    assert (outer['calls'], outer['bytes_read'], outer['files_written']) == (1, 10, 0)
+    total = report['total']
+    assert (total['bytes_read'], total['files_written'], total['bytes_written'], total['files_skipped']) == (15, 1, 7, 2)
+    assert total['wall_seconds'] >= outer['wall_seconds']
+    assert 'peak_memory_bytes' not in total
+
+
+def test_peak_memory():
+    with MetricsRecorder() as recorder:
+        with metrics.stage('allocate'):
+            block = bytearray(4 * 1024 * 1024)
+            del block
+    assert recorder.to_dict()['stages']['allocate']['peak_memory_bytes'] >= 4 * 1024 * 1024
+
+
+def test_metered_zip_file(tmp_path):
+    data = os.urandom(10000) + b'\0' * 50000
+    zip_path = write_zip(tmp_path / 'test.zip', {'a.bin': data, 'b.bin': b'b' * 100})
+    with MetricsRecorder(trace_memory=False) as recorder:
+        with metrics.stage('read'):
+            with MeteredZipFile(zip_path) as in_zip:
+                with in_zip.open('a.bin') as member_fp:
+                    assert member_fp.read(1000) == data[:1000]
+                    # Seeking forward decompresses the skipped bytes, seeking back starts over from the start
+                    member_fp.seek(5000)
+                    member_fp.seek(2000)
+                    assert member_fp.read() == data[2000:]
+    stage = recorder.to_dict()['stages']['read']
+    assert stage['bytes_decompressed'] == 1000 + 4000 + 2000 + len(data) - 2000
+    # The compressed bytes are counted too, and seeking back reads them again
+    assert stage['bytes_read'] > os.path.getsize(zip_path)
+
+
+def test_metered_zip_file_plain_in_write_mode(tmp_path):
+    with MeteredZipFile(tmp_path / 'out.zip', 'w') as out_zip:
+        with out_zip.open('a.txt', 'w') as member_fp:
+            member_fp.write(b'hello')
+    with zipfile.ZipFile(tmp_path / 'out.zip') as in_zip:
+        assert in_zip.read('a.txt') == b'hello'
+
+
+def test_analysis_metrics(ipa_path):
+    top_level = IpaAnalyzer(ipa_path, in_archive=True, metrics=True, trace_memory=False).analyze()
+    report = top_level['metrics']
+    for name in ('validate_structure', 'info_plist', 'provisioning', 'mach_o', 'bundle_binaries'):
+        assert report['stages'][name]['calls'] == 1
+    assert report['total']['bytes_read'] > 0
+    assert report['total']['bytes_decompressed'] == sum(stage['bytes_decompressed']
+                                                        for stage in report['stages'].values())
+    assert 'metrics' not in IpaAnalyzer(ipa_path, in_archive=True).analyze()
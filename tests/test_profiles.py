@@ -0,0 +1,90 @@
+import os
+import plistlib
+from datetime import datetime
+
+import pytest
+
+from ipa_util.cms import SignedData
+from ipa_util.profiles import ProfileLibrary
+
+from conftest import small_ipa
+
+# File name => bundle id (app id) of the profile
+PROFILES = {
+    'exact': 'com.acme.app1',
+    'other': 'com.acme.app2',
+    'wildcard': 'com.acme.*',
+    'everything': '*',
+    'partial': 'com.ac*',
+}
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    for seed, (name, bundle_id) in enumerate(sorted(PROFILES.items())):
+        data = small_ipa(bundle_id=bundle_id, seed=seed).mobileprovision()
+        (tmp_path / (name + ProfileLibrary.PROFILE_SUFFIX)).write_bytes(data)
+    (tmp_path / 'notes.txt').write_text('not a profile')
+    return tmp_path
+
+
+@pytest.fixture
+def library(profile_dir):
+    library = ProfileLibrary()
+    assert library.load_directory(str(profile_dir)) == len(PROFILES)
+    return library
+
+
+def names(profiles):
+    return [os.path.basename(profile['path'])[:-len(ProfileLibrary.PROFILE_SUFFIX)] for profile in profiles]
+
+
+def test_match_most_specific_first(library):
+    assert names(library.match('com.acme.app1')) == ['exact', 'wildcard', 'partial', 'everything']
+    assert names(library.match('com.acme.app3')) == ['wildcard', 'partial', 'everything']
+    assert names(library.match('com.acorn.app')) == ['partial', 'everything']
+    assert names(library.match('org.example')) == ['everything']
+
+
+def test_match_many(library):
+    matches = library.match_many(['com.acme.app2', 'org.example', 'com.acme.app2'])
+    assert {bundle_id: names(profiles) for bundle_id, profiles in matches.items()} == {
+        'com.acme.app2': ['other', 'wildcard', 'partial', 'everything'],
+        'org.example': ['everything'],
+    }
+
+
+def test_team(library):
+    team = small_ipa().TEAM_ID
+    assert names(library.match('com.acme.app1', team=team)) == names(library.match('com.acme.app1'))
+    assert library.match('com.acme.app1', team='OTHERTEAM') == []
+
+
+def test_device(library, profile_dir):
+    data = (profile_dir / ('exact' + ProfileLibrary.PROFILE_SUFFIX)).read_bytes()
+    device = plistlib.loads(SignedData(data).content)['ProvisionedDevices'][0]
+    assert names(library.match('com.acme.app1', device=device)) == ['exact']
+    assert library.match('com.acme.app1', device='0' * 40) == []
+
+
+def test_expired(library):
+    later = datetime(2050, 1, 1)
+    assert library.match('com.acme.app1', now=later) == []
+    assert len(library.match('com.acme.app1', now=later, include_expired=True)) == 4
+
+
+def test_reload(library, profile_dir):
+    assert library.load_directory(str(profile_dir)) == 0
+    os.remove(profile_dir / ('exact' + ProfileLibrary.PROFILE_SUFFIX))
+    assert library.load_directory(str(profile_dir)) == 0
+    assert len(library) == len(PROFILES) - 1
+    assert names(library.match('com.acme.app1')) == ['wildcard', 'partial', 'everything']
+
+
+def test_errors(library, profile_dir):
+    bad_path = profile_dir / ('bad' + ProfileLibrary.PROFILE_SUFFIX)
+    bad_path.write_bytes(b'\x30\x03junk')
+    assert library.load_directory(str(profile_dir)) == 0
+    assert library.error_count == 1
+    assert library.errors[0][0] == str(bad_path)
+    assert len(library) == len(PROFILES)
@@ -0,0 +1,69 @@
+import io
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from ipa_util.result import ArchSlice, BinaryInfo, JsonWriter, dumps, format_date
+
+VALUES = [
+    None, True, False, 0, -12, 2 ** 70, 1.5, -0.0, 1e300, float('nan'), float('inf'), float('-inf'),
+    '', 'plain', 'quote " backslash \\ tab \t newline \n', 'caf\u00e9 \u2603 \U0001f600', '\x00\x1f\x7f',
+    [], {}, (1, 2), [[], {}, [None]],
+    {'nested': {'list': [1, {'a': []}], 'empty': {}}},
+    {1: 'int', 2.5: 'float', False: 'bool', None: 'none', float('nan'): 'nan', float('inf'): 'inf'},
+]
+
+
+def json_default(value):
+    # JsonWriter writes datetimes in the result's own date format, and anything else as its str()
+    if isinstance(value, datetime):
+        return format_date(value)
+    return str(value)
+
+
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+@pytest.mark.parametrize('indent', [None, 0, 2])
+def test_matches_json_dumps(value, indent):
+    separators = (',', ':') if indent is None else None
+    assert dumps(value, indent) == json.dumps(value, indent=indent, separators=separators, default=json_default)
+
+
+def test_datetimes_and_other_values():
+    value = {'date': datetime(2016, 10, 10, 15, 54, 24), 'bytes': b'\x01', 'set': {1}, 'object': object}
+    assert dumps(value) == json.dumps(value, separators=(',', ':'), default=json_default)
+    assert json.loads(dumps(value))['date'] == '2016-10-10T15:54:24Z'
+
+
+def test_result_objects():
+    binary_info = BinaryInfo(binary_type='fat_binary', arch_slices=[ArchSlice(cpu_type='arm64', uuid=None)])
+    assert dumps(binary_info) == json.dumps(binary_info.to_dict(), separators=(',', ':'))
+    assert json.loads(dumps(binary_info, 2)) == binary_info.to_dict()
+
+
+def test_streams_in_buffered_chunks(monkeypatch):
+    monkeypatch.setattr(JsonWriter, 'BUFFER_SIZE', 16)
+    writes = []
+
+    class Recording(io.StringIO):
+        def write(self, text):
+            writes.append(text)
+            return super().write(text)
+    value = [{'key{0}'.format(i): 'value' * i} for i in range(20)]
+    out = Recording()
+    writer = JsonWriter(out)
+    writer.write_line(value)
+    writer.write_line({'second': 2})
+    assert out.getvalue() == json.dumps(value, separators=(',', ':')) + '\n{"second":2}\n'
+    # Flushed as the buffer fills, not once per value
+    assert len(writes) > 4
+
+
+def test_writes_to_a_file_descriptor(tmp_path):
+    fd = os.open(str(tmp_path / 'out.json'), os.O_WRONLY | os.O_CREAT)
+    try:
+        JsonWriter(fd).write_line({'snow': '\u2603'})
+    finally:
+        os.close(fd)
+    assert (tmp_path / 'out.json').read_text() == '{"snow":"\\u2603"}\n'
@@ -0,0 +1,23 @@
+from ipa_util.rules import RULES, RuleEngine
+
+
+def test_valid(ipa_path):
+    report = RuleEngine(str(ipa_path)).run()
+    assert report['valid'] is True
+    assert report['findings'] == []
+    assert report['skipped'] == []
+
+
+def test_not_a_zip(tmp_path):
+    bad_path = tmp_path / 'bad.ipa'
+    bad_path.write_bytes(b'not a zip')
+    report = RuleEngine(str(bad_path)).run()
+    assert report['valid'] is False
+    assert [(finding['rule'], finding['severity']) for finding in report['findings']] == [('req-001', 'error')]
+    assert [skipped['rule'] for skipped in report['skipped']] == [rule for rule in RULES if rule != 'req-001']
+
+
+def test_missing(tmp_path):
+    report = RuleEngine(str(tmp_path / 'missing.ipa')).run()
+    assert report['error_count'] == 1
+    assert report['findings'][0]['rule'] == 'req-001'
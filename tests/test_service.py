@@ -0,0 +1,141 @@
+import os
+import json
+import asyncio
+import tempfile
+
+import pytest
+
+from ipa_util.service import AnalysisService
+
+
+def serve(test, **kwargs):
+    """
+    Run test(service, port) against a service with a single worker, listening on a free port
+    """
+    async def main():
+        service = AnalysisService(workers=1, metrics=False, **kwargs)
+        await service.start('127.0.0.1', 0)
+        try:
+            return await test(service, service._servers[0].sockets[0].getsockname()[1])
+        finally:
+            await service.stop()
+    return asyncio.run(main())
+
+
+async def request(port, head, body=b''):
+    """
+    Send a raw request and read the response up to the end of its body
+    :return: Tuple of status and the decoded JSON body
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b'\r\n':
+                break
+            name, sep, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+    finally:
+        writer.close()
+
+
+def post(port, body, content_type='application/octet-stream', length=None):
+    head = 'POST /analyze HTTP/1.1\r\nContent-Type: {0}\r\nContent-Length: {1}\r\nConnection: close\r\n\r\n'.format(
+        content_type, len(body) if length is None else length)
+    return request(port, head, body)
+
+
+@pytest.fixture
+def spool_dir(monkeypatch, tmp_path):
+    """
+    Spool every upload, into a folder of its own
+    """
+    monkeypatch.setattr(AnalysisService, 'SPOOL_THRESHOLD', 0)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+def spooled(spool_dir):
+    return [name for name in os.listdir(spool_dir) if name.startswith('vipa_upload_')]
+
+
+def test_upload(ipa_path):
+    async def test(service, port):
+        return await post(port, ipa_path.read_bytes())
+    status, record = serve(test)
+    assert status == 200
+    assert record['ipa_info']['CFBundleIdentifier'] == 'com.acme.synthapp'
+
+
+def test_spool_is_deleted(spool_dir, ipa_path):
+    async def test(service, port):
+        status, record = await post(port, ipa_path.read_bytes())
+        # The spool goes once the worker is done, which may be just after the response
+        for i in range(100):
+            if not spooled(spool_dir):
+                break
+            await asyncio.sleep(0.01)
+        return status, record, service._health()['in_flight']
+    status, record, in_flight = serve(test)
+    assert status == 200
+    assert record['ipa_info']['CFBundleExecutable'] == 'SynthApp'
+    assert spooled(spool_dir) == []
+    assert in_flight == 0
+
+
+def test_slow_upload_times_out(spool_dir):
+    async def test(service, port):
+        return await post(port, b'PK\x03\x04', length=1024 * 1024)
+    status, body = serve(test, timeout=0.5)
+    assert status == 408
+    assert spooled(spool_dir) == []
+
+
+@pytest.mark.parametrize('length', ['-5', 'abc', '', '²', '1_0'])
+def test_bad_content_length(length):
+    async def test(service, port):
+        return await post(port, b'', length=length)
+    assert serve(test)[0] == 400
+
+
+def test_content_length_required():
+    async def test(service, port):
+        return await request(port, 'POST /analyze HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert serve(test)[0] == 411
+
+
+def test_long_lines():
+    async def test(service, port):
+        long_path = await request(port, 'GET /{0} HTTP/1.1\r\n\r\n'.format('x' * 100 * 1024))
+        long_header = await request(port, 'GET /health HTTP/1.1\r\nX-Long: {0}\r\n\r\n'.format('x' * 100 * 1024))
+        health = await request(port, 'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+        return long_path[0], long_header[0], health[0]
+    assert serve(test) == (400, 431, 200)
+
+
+def test_path_requests_are_off_by_default(ipa_path):
+    async def test(service, port):
+        return await post(port, json.dumps({'path': str(ipa_path)}).encode('utf-8'), 'application/json')
+    assert serve(test)[0] == 403
+
+
+def test_allowed_paths(tmp_path, ipa_path):
+    allowed = tmp_path / 'allowed'
+    allowed.mkdir()
+    (allowed / 'SynthApp.ipa').write_bytes(ipa_path.read_bytes())
+    (allowed / 'escape.ipa').symlink_to(ipa_path)
+
+    async def test(service, port):
+        statuses = []
+        for path in (allowed / 'SynthApp.ipa', allowed / '..' / ipa_path.name, allowed / 'escape.ipa', ipa_path,
+                     'https://example.com/app.ipa', ''):
+            body = json.dumps({'path': str(path)}).encode('utf-8')
+            statuses.append((await post(port, body, 'application/json'))[0])
+        return statuses
+    assert serve(test, source_roots=[str(allowed)]) == [200, 403, 403, 403, 403, 400]
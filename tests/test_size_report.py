@@ -0,0 +1,81 @@
+import random
+import zipfile
+
+import pytest
+
+from ipa_util.size_report import SizeReport
+from ipa_util.synth import SyntheticMachO
+
+from conftest import small_ipa
+
+APP = 'Payload/SynthApp.app/'
+
+
+@pytest.fixture
+def ipa_path(tmp_path):
+    """
+    A build with a loose dylib and an app extension next to the frameworks, and a Mach-O hidden in an asset
+    """
+    ipa_path = small_ipa(asset_count=4).write(tmp_path / 'SynthApp.ipa')
+    macho = SyntheticMachO(random.Random(0)).build('thin64', 4096)
+    with zipfile.ZipFile(ipa_path, 'a') as ipa_zip:
+        ipa_zip.writestr(APP + 'Frameworks/libloose.dylib', macho)
+        ipa_zip.writestr(APP + 'PlugIns/Share.appex/Share', macho)
+        ipa_zip.writestr(APP + 'PlugIns/Share.appex/Info.plist', b'not a binary')
+        ipa_zip.writestr(APP + 'Assets/model.png', macho)
+        ipa_zip.writestr('iTunesMetadata.plist', b'outside the app')
+    return ipa_path
+
+
+def test_report(ipa_path):
+    report = SizeReport(str(ipa_path)).report()
+    with zipfile.ZipFile(ipa_path) as ipa_zip:
+        infos = [info for info in ipa_zip.infolist() if not info.is_dir()]
+    assert report['total'] == {'size': sum(info.file_size for info in infos),
+                               'compressed_size': sum(info.compress_size for info in infos),
+                               'file_count': len(infos)}
+    assert sum(totals['file_count'] for totals in report['categories'].values()) == len(infos)
+    assert report['categories']['executable']['file_count'] == 1
+    assert report['categories']['outside_app']['file_count'] == 1
+    assert report['categories']['plugins']['file_count'] == 2
+    assert report['categories']['assets']['file_count'] == 5
+    assert sorted(binary['path'] for binary in report['binaries']) == [
+        'Frameworks/Fw0.framework/Fw0', 'Frameworks/Fw1.framework/Fw1', 'Frameworks/libloose.dylib',
+        'PlugIns/Share.appex/Share', 'SynthApp']
+    executable = [binary for binary in report['binaries'] if binary['path'] == 'SynthApp'][0]
+    assert [(s['cpu_type'], s['cpu_subtype']) for s in executable['slices']] == [('arm', 'armv7'), ('arm64', '')]
+    assert report['tree']['file_count'] == len(infos)
+
+
+def test_only_likely_binaries_are_read(monkeypatch, ipa_path):
+    opened = []
+    zip_open = zipfile.ZipFile.open
+
+    def recording(ipa_zip, name, *args, **kwargs):
+        opened.append(name if isinstance(name, str) else name.filename)
+        return zip_open(ipa_zip, name, *args, **kwargs)
+    monkeypatch.setattr(zipfile.ZipFile, 'open', recording)
+    SizeReport(str(ipa_path)).report()
+    assert not [name for name in opened if '/Assets/' in name]
+    assert APP + 'PlugIns/Share.appex/Info.plist' not in opened
+    assert APP + 'PlugIns/Share.appex/Share' in opened
+
+
+@pytest.mark.parametrize('rel_name, expected', [
+    ('SynthApp', True),
+    ('Frameworks/libz.dylib', True),
+    ('Frameworks/Fw0.framework/Fw0', True),
+    ('Frameworks/Fw0.framework/Info.plist', False),
+    ('PlugIns/Share.appex/Share', True),
+    ('Assets/asset00001.png', False),
+    ('_CodeSignature/CodeResources', False),
+    ('en.lproj/Localizable.strings', False),
+])
+def test_likely_binary(rel_name, expected):
+    assert SizeReport.likely_binary(rel_name, 'SynthApp') is expected
+
+
+def test_format_report(ipa_path):
+    text = SizeReport.format_report(SizeReport(str(ipa_path), depth=1).report())
+    assert 'Frameworks/libloose.dylib' in text
+    assert 'files in total' in text
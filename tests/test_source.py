@@ -0,0 +1,111 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from ipa_util.source import ByteSource, LocalFileSource, open_source
+
+BLOCK_SIZE = 16
+
+
+class _MemorySource(ByteSource):
+    """
+    ByteSource over bytes which records every range it's asked for
+    """
+
+    def __init__(self, data, cache_blocks=ByteSource.DEFAULT_CACHE_BLOCKS) -> None:
+        super().__init__('memory', len(data), BLOCK_SIZE, cache_blocks)
+        self._data = data
+        self.ranges = []
+
+    def _read_range(self, offset, size):
+        self.ranges.append((offset, size))
+        return self._data[offset:offset + size]
+
+
+@pytest.fixture
+def data():
+    return bytes(range(256)) * 4 + b'tail'
+
+
+def test_read_at(data):
+    source = _MemorySource(data)
+    for offset, size in ((0, 1), (5, 40), (15, 2), (1000, 28), (0, len(data))):
+        assert source.read_at(offset, size) == data[offset:offset + size]
+
+
+def test_adjacent_blocks_are_one_fetch(data):
+    source = _MemorySource(data)
+    source.read_at(20, 50)
+    assert source.ranges == [(16, 64)]
+    assert source.fetch_count == 1
+    assert source.bytes_fetched == 64
+
+
+def test_cached_blocks_split_the_run(data):
+    source = _MemorySource(data)
+    source.read_at(48, 16)
+    source.read_at(0, 128)
+    # Blocks 0-2 and 4-7 around the cached block 3
+    assert source.ranges == [(48, 16), (0, 48), (64, 64)]
+    source.read_at(0, 128)
+    assert source.fetch_count == 3
+
+
+def test_last_block_is_short(data):
+    source = _MemorySource(data)
+    assert source.read_at(len(data) - 6, 6) == data[-6:]
+    # Blocks 63 and 64, the last one only 4 bytes long
+    assert source.ranges == [(1008, 20)]
+
+
+def test_eviction(data):
+    source = _MemorySource(data, cache_blocks=2)
+    source.read_at(0, 16)
+    source.read_at(16, 16)
+    source.read_at(32, 16)
+    source.read_at(0, 16)
+    assert source.ranges == [(0, 16), (16, 16), (32, 16), (0, 16)]
+
+
+def test_file_interface(data):
+    source = _MemorySource(data)
+    assert source.seek(-4, io.SEEK_END) == len(data) - 4
+    assert source.read() == b'tail'
+    assert source.read(10) == b''
+    source.seek(10)
+    source.seek(5, io.SEEK_CUR)
+    assert source.tell() == 15
+    assert source.read(3) == data[15:18]
+    with pytest.raises(ValueError):
+        source.seek(-1)
+
+
+def test_short_read(data):
+    source = _MemorySource(data)
+    source._data = data[:100]
+    with pytest.raises(Exception):
+        source.read_at(0, 200)
+
+
+def test_local_file_zip(ipa_path):
+    """
+    ZipFile reads the same members through a LocalFileSource as from the path
+    """
+    with zipfile.ZipFile(ipa_path) as by_path:
+        expected = {info.filename: by_path.read(info) for info in by_path.infolist()}
+    source = LocalFileSource(ipa_path, block_size=4096)
+    try:
+        assert source.size == os.path.getsize(ipa_path)
+        with zipfile.ZipFile(source) as by_source:
+            assert {info.filename: by_source.read(info) for info in by_source.infolist()} == expected
+        assert source.bytes_fetched <= source.size
+    finally:
+        source.close()
+
+
+def test_open_source(ipa_path):
+    assert open_source(str(ipa_path)) == str(ipa_path)
+    source = _MemorySource(b'')
+    assert open_source(source) is source
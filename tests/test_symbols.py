@@ -0,0 +1,70 @@
+from ipa_util.symbol_report import SymbolReport
+from ipa_util.symbols import SymbolDenylist
+
+NAMES = [b'_dlopen', b'_dlopenx', b'_dlsym', b'_objc_msgSend', b'_OBJC_CLASS_$_UIWebView',
+         b'_OBJC_CLASS_$_UIWebViewDelegate', b'_OBJC_CLASS_$_UIView', b'_private_api']
+DYLIBS = ['/usr/lib/libSystem.B.dylib', '/System/Library/PrivateFrameworks/Secret.framework/Secret',
+          '/System/Library/Frameworks/UIKit.framework/UIKit', '@rpath/Fw0.framework/Fw0']
+
+
+def test_exact_entries():
+    denylist = SymbolDenylist(['_dlopen', '_OBJC_CLASS_$_UIWebView', '_not_there'])
+    # No prefix matching without a '*': _dlopenx and the delegate class are fine
+    assert denylist.match_symbols(NAMES) == ['_OBJC_CLASS_$_UIWebView', '_dlopen']
+    assert denylist.match_dylibs(DYLIBS) == []
+
+
+def test_prefix_entries():
+    denylist = SymbolDenylist(['_dl*', '_OBJC_CLASS_$_UIWeb*', '_private_api'])
+    assert denylist.match_symbols(NAMES) == ['_OBJC_CLASS_$_UIWebView', '_OBJC_CLASS_$_UIWebViewDelegate',
+                                             '_dlopen', '_dlopenx', '_dlsym', '_private_api']
+    # Prefixes are anchored at the start, and regular expression characters in them are literal
+    assert SymbolDenylist(['lopen*', '_OBJC_CLASS_$*']).match_symbols(NAMES) == [
+        '_OBJC_CLASS_$_UIView', '_OBJC_CLASS_$_UIWebView', '_OBJC_CLASS_$_UIWebViewDelegate']
+    assert SymbolDenylist(['_dl.*']).match_symbols(NAMES) == []
+
+
+def test_dylib_entries():
+    denylist = SymbolDenylist(['/System/Library/PrivateFrameworks/*', '@rpath/Fw0.framework/Fw0', '_dlopen'])
+    assert denylist.match_dylibs(DYLIBS) == ['/System/Library/PrivateFrameworks/Secret.framework/Secret',
+                                             '@rpath/Fw0.framework/Fw0']
+    # Install names and symbols are kept apart
+    assert denylist.match_symbols(NAMES) == ['_dlopen']
+    assert SymbolDenylist(['/usr/lib/*']).match_symbols([b'/usr/lib/x']) == []
+
+
+def test_entries_added_after_matching():
+    denylist = SymbolDenylist(['_dlsym'])
+    assert denylist.match_symbols(NAMES) == ['_dlsym']
+    denylist.add('_objc*')
+    assert denylist.match_symbols(NAMES) == ['_dlsym', '_objc_msgSend']
+    assert len(denylist) == 2
+
+
+def test_load(tmp_path):
+    (tmp_path / 'denylist.txt').write_text('# Banned\n\n_dlopen\n  _OBJC_CLASS_$_UIWeb*  \n/System/Library/PrivateFrameworks/*\n')
+    denylist = SymbolDenylist.load(str(tmp_path / 'denylist.txt'))
+    assert len(denylist) == 3
+    assert denylist.match_symbols(NAMES) == ['_OBJC_CLASS_$_UIWebView', '_OBJC_CLASS_$_UIWebViewDelegate', '_dlopen']
+
+
+def test_report(ipa_path):
+    denylist = SymbolDenylist(['_OBJC_CLASS_$_UIWebView', '_dl*', '@rpath/Fw1.framework/*'])
+    report = SymbolReport(str(ipa_path), denylist).report()
+    assert [binary['path'] for binary in report] == [
+        'Frameworks/Fw0.framework/Fw0', 'Frameworks/Fw1.framework/Fw1', 'SynthApp']
+    executable = report[-1]
+    assert len(executable['slices']) == 2
+    for arch_slice in executable['slices']:
+        assert arch_slice['denied']['symbols'] == ['_OBJC_CLASS_$_UIWebView', '_dlopen', '_dlsym']
+        assert arch_slice['denied']['dylibs'] == ['@rpath/Fw1.framework/Fw1']
+        assert arch_slice['weak_dylibs'] == [
+            '/System/Library/Frameworks/AppTrackingTransparency.framework/AppTrackingTransparency']
+        assert arch_slice['symbols']['undefined_count'] == 20
+        assert 'undefined' not in arch_slice['symbols']
+    # The frameworks have no symbol table
+    assert report[0]['slices'][0]['symbols'] is None
+    assert report[0]['slices'][0]['denied'] == {'dylibs': [], 'symbols': []}
+    assert SymbolReport.denied_count(report) == 8
+    assert 'DENIED symbol: _dlsym' in SymbolReport.format_report(report)
+    assert 'denied' not in SymbolReport(str(ipa_path)).report()[-1]['slices'][0]
@@ -0,0 +1,86 @@
+import os
+import zipfile
+
+import pytest
+
+from ipa_util.analyze import IpaAnalyzer
+from ipa_util.metrics import MetricsRecorder
+from ipa_util.unpack import Unpack
+
+APP = 'Payload/SynthApp.app/'
+
+
+def unpack(ipa_path, dest):
+    """
+    :return: The total counters of the unpack
+    """
+    with MetricsRecorder(trace_memory=False) as recorder:
+        Unpack(ipa_path, dest, max_workers=2).unpack_ipa()
+    return recorder.to_dict()['total']
+
+
+def tree(dest):
+    return sorted(os.path.relpath(os.path.join(dir_path, name), dest).replace(os.sep, '/')
+                  for dir_path, dir_names, file_names in os.walk(dest) for name in file_names)
+
+
+def test_unpack_matches_archive(tmp_path, ipa_path):
+    counters = unpack(ipa_path, tmp_path / 'dest')
+    with zipfile.ZipFile(ipa_path) as ipa_zip:
+        names = [info.filename for info in ipa_zip.infolist() if not info.is_dir()]
+        for name in names:
+            assert (tmp_path / 'dest' / name).read_bytes() == ipa_zip.read(name)
+    assert tree(tmp_path / 'dest') == sorted(names + [Unpack.MANIFEST_NAME])
+    assert counters['files_written'] == len(names)
+
+
+def test_unchanged_files_skipped(tmp_path, ipa_path):
+    dest = tmp_path / 'dest'
+    file_count = unpack(ipa_path, dest)['files_written']
+    counters = unpack(ipa_path, dest)
+    assert (counters['files_written'], counters['files_skipped']) == (0, file_count)
+
+    # Touched but identical: the CRC is checked and it's still skipped. Changed: rewritten.
+    os.utime(dest / APP / 'Info.plist', (0, 0))
+    original = (dest / APP / 'SynthApp').read_bytes()
+    (dest / APP / 'SynthApp').write_bytes(b'\0' * len(original))
+    # An interrupted unpack's leftovers don't count as the member
+    (dest / APP / 'embedded.mobileprovision').unlink()
+    (dest / APP / ('embedded.mobileprovision' + Unpack.PART_SUFFIX)).write_bytes(b'partial')
+    counters = unpack(ipa_path, dest)
+    assert (counters['files_written'], counters['files_skipped']) == (2, file_count - 2)
+    assert (dest / APP / 'SynthApp').read_bytes() == original
+    assert not (dest / APP / ('embedded.mobileprovision' + Unpack.PART_SUFFIX)).exists()
+
+
+def test_cleanup_removes_only_what_it_wrote(tmp_path, ipa_path):
+    dest = tmp_path / 'dest'
+    (dest / APP).mkdir(parents=True)
+    (dest / 'notes.txt').write_text('mine')
+    (dest / APP / 'extra.txt').write_text('mine')
+    with zipfile.ZipFile(ipa_path) as ipa_zip:
+        # Already there with the right contents, so it's skipped and left for its owner
+        (dest / APP / 'Info.plist').write_bytes(ipa_zip.read(APP + 'Info.plist'))
+    unpacker = Unpack(ipa_path, dest)
+    unpacker.unpack_ipa()
+    unpacker.cleanup_dest()
+    assert tree(dest) == ['Payload/SynthApp.app/Info.plist', 'Payload/SynthApp.app/extra.txt', 'notes.txt']
+    assert not (dest / APP / 'Frameworks').exists()
+
+
+def test_analyze_clean_dest(tmp_path, ipa_path):
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    (dest / 'notes.txt').write_text('mine')
+    IpaAnalyzer(ipa_path, dest_path=dest).analyze()
+    assert len(tree(dest)) > 2
+    IpaAnalyzer(ipa_path, dest_path=dest, clean_dest=True).analyze()
+    assert tree(dest) == ['notes.txt']
+
+
+def test_refuses_names_outside_dest(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'evil.ipa', 'w') as out_zip:
+        out_zip.writestr('Payload/../../evil.txt', 'gotcha')
+    with pytest.raises(Exception, match='outside the destination'):
+        Unpack(tmp_path / 'evil.ipa', tmp_path / 'dest').unpack_ipa()
+    assert not (tmp_path / 'evil.txt').exists()